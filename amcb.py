@@ -4,12 +4,66 @@ from meshtastic.BROADCAST_ADDR import BROADCAST_ADDR # For sending to all
 from meshtastic.util import ps_packet # Potentially useful
 
 import paho.mqtt.client as mqtt
+try:
+    from paho.mqtt.properties import Properties # MQTT v5 publish properties, paho >= 1.5
+    from paho.mqtt.packettypes import PacketTypes
+except ImportError:
+    Properties = PacketTypes = None
 import json
 import time
 import threading
 import logging
 import os
 import ssl # For TLS context
+import collections
+import hashlib
+import math
+import bisect
+import http.server
+import struct
+import zlib
+import string
+import functools
+import base64
+import re
+import itertools
+import asyncio
+import random
+
+# Optional encoders for the compact binary payload types
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+try:
+    import orjson # Faster encoder for the JSON payload types
+except ImportError:
+    orjson = None
+try:
+    from meshtastic.protobuf import mqtt_pb2 # meshtastic >= 2.3
+except ImportError:
+    try:
+        from meshtastic import mqtt_pb2
+    except ImportError:
+        mqtt_pb2 = None
+try:
+    from meshtastic.protobuf import mesh_pb2 # For the firmware's payload size limit
+except ImportError:
+    try:
+        from meshtastic import mesh_pb2
+    except ImportError:
+        mesh_pb2 = None
+try:
+    from meshtastic.protobuf import portnums_pb2 # Port numbers in filters may be given as names or numbers
+except ImportError:
+    try:
+        from meshtastic import portnums_pb2
+    except ImportError:
+        portnums_pb2 = None
 
 # Configure logging for the plugin
 logger = logging.getLogger(__name__)
@@ -20,7 +74,2082 @@ if not logger.handlers: # Ensure handler is set up
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
 
-CONFIG_FILENAME = "mqtt_config.json"
+CONFIG_FILENAME = "mqtt_config.json"
+
+OVERFLOW_POLICIES = ['drop_oldest', 'drop_newest', 'block']
+DEFAULT_QUEUE_CONFIG = {"max_depth": 1000, "overflow": "drop_oldest", "block_timeout_ms": 500}
+DEFAULT_BATCH_CONFIG = {"max_messages": 50, "max_bytes": 65536, "max_delay_ms": 1000}
+DEFAULT_SPOOL_CONFIG = {"dir": None, "max_bytes": 64 * 2**20, "max_age_s": 86400, "segment_bytes": 2**20,
+                        "replay_rate": 50, "fsync": False}
+SPOOL_DIRNAME = "amcb_spool"
+MAX_CHANNELS = 8 # Meshtastic channel indices 0-7; the route table grows if a config uses more
+DEFAULT_METRICS_CONFIG = {"http_host": "0.0.0.0", "http_port": None, "stats_topic": None, "stats_channel": None,
+                          "stats_interval_s": 60}
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_WATCH_INTERVAL_S = 2
+DEFAULT_LOOP_CONFIG = {"enabled": True, "window_s": 30, "max_entries": 2000}
+ORIGIN_PROPERTY = "amcb-origin" # MQTT v5 user property naming the gateway that published a message
+MQTT_PROTOCOLS = {"3.1.1": mqtt.MQTTv311, "5": mqtt.MQTTv5}
+DEFAULT_DEDUP_CONFIG = {"enabled": True, "window_s": 60, "max_entries": 10000,
+                        "claim_topic": None, "claim_channel": None, "claim_wait_ms": 300}
+INBOUND_FORMATS = ['text', 'json', 'protobuf']
+# Largest Data.payload the firmware accepts, in bytes
+MAX_MESH_PAYLOAD = mesh_pb2.Constants.DATA_PAYLOAD_LEN if mesh_pb2 is not None and hasattr(mesh_pb2, 'Constants') else 233
+DEFAULT_MAX_FRAGMENTS = 8
+FRAGMENT_TIMEOUT_S = 120 # Incomplete fragment sets are discarded after this long
+FRAGMENT_MAGIC = b'\xa3\xcb'
+FRAGMENT_HEADER = struct.Struct('!2sHBB') # Binary fragments: magic, message id, index (1-based), count
+# Text fragments start with a readable "[index/count #id] "; the id is the low byte of the message id
+TEXT_FRAGMENT_RE = re.compile(r'\[(\d{1,3})/(\d{1,3}) #([0-9a-f]{2})\] ')
+FILTER_KEYS = ['portnums', 'exclude_portnums', 'from_nodes', 'exclude_from_nodes']
+TOPIC_CACHE_SIZE = 4096 # Rendered topics remembered per templated route
+ENGINES = ['threads', 'asyncio'] # bridge.engine: paho network thread per broker session, or one shared event loop
+ENGINE_MISC_INTERVAL_S = 1.0 # How often the asyncio engine runs keepalives
+DEFAULT_RECONNECT_CONFIG = {"min_delay_s": 1, "max_delay_s": 120, "jitter": 0.5, "failure_threshold": 10,
+                            "open_s": 300, "connect_timeout_s": 10}
+SUPERVISOR_INTERVAL_S = 1.0 # Longest the connection supervisor sleeps between checks
+JSON_ENCODER_CHOICES = ['auto', 'json', 'orjson'] # bridge.json_encoder; "auto" picks orjson when it is installed
+DEFAULT_TX_CONFIG = {"duty_cycle_percent": 10.0, "burst_airtime_ms": 5000, "priority": 0,
+                     "dedup_window_s": 30, "max_queue": 100}
+
+# Firmware modem presets: name -> (spreading factor, bandwidth Hz, coding rate denominator 4/x)
+MODEM_PRESETS = {
+    'SHORT_TURBO': (7, 500000, 5),
+    'SHORT_FAST': (7, 250000, 5),
+    'SHORT_SLOW': (8, 250000, 5),
+    'MEDIUM_FAST': (9, 250000, 5),
+    'MEDIUM_SLOW': (10, 250000, 5),
+    'LONG_TURBO': (11, 500000, 5),
+    'LONG_FAST': (11, 250000, 5),
+    'LONG_MODERATE': (11, 125000, 8),
+    'LONG_SLOW': (12, 125000, 8),
+    'VERY_LONG_SLOW': (12, 62500, 8),
+}
+DEFAULT_MODEM_PRESET = 'LONG_FAST'
+LORA_PREAMBLE_SYMBOLS = 16 # Meshtastic preamble length
+MESH_PACKET_OVERHEAD = 20 # On-air Meshtastic header plus Data protobuf framing, in bytes
+
+
+def lora_params(lora_config):
+    """(spreading factor, bandwidth Hz, coding rate denominator) for a LoRaConfig, falling back to LONG_FAST."""
+    if lora_config is None:
+        return MODEM_PRESETS[DEFAULT_MODEM_PRESET]
+    if getattr(lora_config, 'use_preset', True) is False and getattr(lora_config, 'spread_factor', 0) and getattr(lora_config, 'bandwidth', 0):
+        return (lora_config.spread_factor, lora_config.bandwidth * 1000, getattr(lora_config, 'coding_rate', 0) or 5)
+    preset = getattr(lora_config, 'modem_preset', None)
+    preset_name = getattr(preset, 'name', None)
+    if preset_name is None and isinstance(preset, int) and hasattr(lora_config, 'DESCRIPTOR'):
+        enum_value = lora_config.DESCRIPTOR.fields_by_name['modem_preset'].enum_type.values_by_number.get(preset)
+        preset_name = enum_value.name if enum_value else None
+    if preset_name not in MODEM_PRESETS:
+        logger.debug(f"Unknown modem preset '{preset_name}', estimating airtime as {DEFAULT_MODEM_PRESET}.")
+        return MODEM_PRESETS[DEFAULT_MODEM_PRESET]
+    return MODEM_PRESETS[preset_name]
+
+
+def estimate_airtime(payload_len, spreading_factor, bandwidth_hz, coding_rate):
+    """Semtech LoRa time-on-air in seconds for a Meshtastic payload (explicit header, CRC on)."""
+    symbol_time = (2 ** spreading_factor) / bandwidth_hz
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    packet_len = payload_len + MESH_PACKET_OVERHEAD
+    payload_symbols = 8 + max(math.ceil((8 * packet_len - 4 * spreading_factor + 28 + 16)
+                                        / (4 * (spreading_factor - 2 * low_data_rate))) * coding_rate, 0)
+    return (LORA_PREAMBLE_SYMBOLS + 4.25 + payload_symbols) * symbol_time
+
+
+def _json_default(obj):
+    """json.dumps fallback for values found in Meshtastic packet dicts."""
+    if isinstance(obj, bytes): return obj.hex()
+    if hasattr(obj, 'DESCRIPTOR'): return str(obj) # Basic protobuf obj handling
+    return str(obj) # Fallback for other types
+
+
+_JSON_NATIVE_TYPES = (str, int, float, bool, type(None), list, dict)
+_STDLIB_JSON_ENCODER = json.JSONEncoder(default=_json_default) # Built once; json.dumps(default=...) builds one per call
+
+
+def _json_value(value):
+    return value if isinstance(value, _JSON_NATIVE_TYPES) else _json_default(value)
+
+
+def _jsonable_decoded(decoded):
+    """
+    decoded with its bytes fields and the 'raw' protobufs of decoded sub-messages
+    (telemetry, position, ...) already converted as _json_default would. Copies
+    only what it converts; the caller's packet is never modified.
+    """
+    converted = None
+    for key, value in decoded.items():
+        if isinstance(value, bytes):
+            value = value.hex()
+        elif isinstance(value, dict) and 'raw' in value and not isinstance(value['raw'], _JSON_NATIVE_TYPES):
+            value = {**value, 'raw': _json_default(value['raw'])}
+        else:
+            continue
+        if converted is None:
+            converted = dict(decoded)
+        converted[key] = value
+    return decoded if converted is None else converted
+
+
+def _jsonable_packet(packet):
+    """The known non-JSON fields of a Meshtastic packet dict preconverted, so encoders rarely hit their default hook."""
+    converted = dict(packet)
+    if 'raw' in packet:
+        converted['raw'] = _json_value(packet['raw'])
+    if isinstance(packet.get('decoded'), dict):
+        converted['decoded'] = _jsonable_decoded(packet['decoded'])
+    return converted
+
+
+def _encode_json(obj):
+    return _STDLIB_JSON_ENCODER.encode(obj).encode('utf-8')
+
+
+def _encode_orjson(obj):
+    try:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError: # e.g. integers beyond 64 bits, which the stdlib encoder accepts
+        return _encode_json(obj)
+
+
+# bridge.json_encoder -> function(obj) returning JSON bytes. orjson writes non-ASCII text as
+# UTF-8 where json escapes it; both decode to the same document.
+JSON_ENCODERS = {
+    'json': _encode_json,
+    'orjson': _encode_orjson,
+}
+
+
+def resolve_json_encoder(name):
+    """JSON_ENCODERS key for a bridge.json_encoder setting."""
+    if name == 'auto':
+        return 'orjson' if orjson is not None else 'json'
+    return name
+
+
+def _serialize_full_packet(packet, encode=_encode_json):
+    return encode(_jsonable_packet(packet))
+
+
+def _serialize_decoded_only(packet, encode=_encode_json):
+    decoded_part = packet.get('decoded', {})
+    return encode(_jsonable_decoded(decoded_part) if isinstance(decoded_part, dict) else decoded_part)
+
+
+def _serialize_text_payload_only(packet, encode=_encode_json):
+    decoded_part = packet.get('decoded', {})
+    if decoded_part.get('portnum') == 'TEXT_MESSAGE_APP' and 'text' in decoded_part:
+        return decoded_part['text'].encode('utf-8') # MQTT Paho expects bytes
+    return encode(_jsonable_decoded(decoded_part)) # Fallback
+
+
+def _binary_default(obj):
+    """Fallback for MessagePack/CBOR: protobuf objects go out as their wire bytes, unlike the JSON str() form."""
+    if hasattr(obj, 'SerializeToString'): return obj.SerializeToString()
+    return str(obj)
+
+
+def _raw_mesh_packet(packet):
+    raw = packet.get('raw')
+    if raw is None or not hasattr(raw, 'SerializeToString'):
+        raise ValueError("packet has no 'raw' MeshPacket protobuf to pass through")
+    return raw
+
+
+def _serialize_protobuf(packet):
+    return _raw_mesh_packet(packet).SerializeToString()
+
+
+def _serialize_msgpack(packet):
+    return msgpack.packb(packet.get('decoded', {}), default=_binary_default, use_bin_type=True)
+
+
+def _serialize_cbor(packet):
+    return cbor2.dumps(packet.get('decoded', {}), default=lambda encoder, obj: encoder.encode(_binary_default(obj)))
+
+
+def _service_envelope_serializer(channel_id, gateway_id):
+    """ServiceEnvelope wrapping, as used by Meshtastic's own MQTT uplink. Bound per route."""
+    def serialize_service_envelope(packet):
+        envelope = mqtt_pb2.ServiceEnvelope(channel_id=channel_id, gateway_id=gateway_id or "")
+        envelope.packet.CopyFrom(_raw_mesh_packet(packet))
+        return envelope.SerializeToString()
+    return serialize_service_envelope
+
+
+# payload_type -> function(packet) returning the MQTT payload bytes
+SERIALIZERS = {
+    'full_packet': _serialize_full_packet,
+    'decoded_only': _serialize_decoded_only,
+    'text_payload_only': _serialize_text_payload_only,
+    'protobuf': _serialize_protobuf,
+    'msgpack': _serialize_msgpack,
+    'cbor': _serialize_cbor,
+}
+PAYLOAD_TYPES = list(SERIALIZERS) + ['service_envelope']
+# Payload types whose serializer takes the bridge's JSON encoder
+JSON_PAYLOAD_TYPES = ['full_packet', 'decoded_only', 'text_payload_only']
+# payload_type -> (module needed, pip package) for types backed by optional libraries
+PAYLOAD_TYPE_REQUIREMENTS = {
+    'msgpack': (lambda: msgpack, "msgpack"),
+    'cbor': (lambda: cbor2, "cbor2"),
+    'service_envelope': (lambda: mqtt_pb2, "meshtastic (with mqtt_pb2)"),
+}
+
+
+def _cbor_array_header(count):
+    if count < 24: return bytes([0x80 | count])
+    if count < 0x100: return bytes([0x98, count])
+    if count < 0x10000: return b'\x99' + count.to_bytes(2, 'big')
+    return b'\x9a' + count.to_bytes(4, 'big')
+
+
+def _join_json(payloads):
+    return b'[' + b','.join(payloads) + b']' # Items are already JSON documents
+
+
+def _join_text(payloads):
+    return json.dumps([p.decode('utf-8', 'replace') for p in payloads]).encode('utf-8')
+
+
+# payload_type -> function(list of serialized payloads) returning one array payload.
+# Protobuf types have no array framing consumers could rely on, so they cannot be batched.
+BATCH_JOINERS = {
+    'full_packet': _join_json,
+    'decoded_only': _join_json,
+    'text_payload_only': _join_text,
+    'msgpack': lambda payloads: msgpack.Packer().pack_array_header(len(payloads)) + b''.join(payloads),
+    'cbor': lambda payloads: _cbor_array_header(len(payloads)) + b''.join(payloads),
+}
+
+
+# Payload types whose output is built from the packet dict, so a field projection can shrink it
+PROJECTABLE_PAYLOAD_TYPES = ['full_packet', 'decoded_only', 'msgpack', 'cbor']
+# Projectable payload types that publish only packet['decoded'], so only 'decoded.*' paths reach their output
+DECODED_PAYLOAD_TYPES = ['decoded_only', 'msgpack', 'cbor']
+
+
+def build_serializer(payload_type, config, gateway_id=None, projection=None, json_encoder='json'):
+    """Returns the serializer function for a channel's payload_type, applying projection first if given."""
+    if payload_type == 'service_envelope':
+        return _service_envelope_serializer(config.get("envelope_channel_id", ""), gateway_id)
+    serializer = SERIALIZERS[payload_type]
+    if payload_type in JSON_PAYLOAD_TYPES:
+        serializer = functools.partial(serializer, encode=JSON_ENCODERS[json_encoder])
+    if projection is None:
+        return serializer
+    return lambda packet: serializer(projection(packet))
+
+
+def _portnum_name(portnum):
+    """Canonical PortNum name ('TEXT_MESSAGE_APP') for a port name or number; None if it is neither."""
+    if isinstance(portnum, bool):
+        return None
+    if isinstance(portnum, int):
+        if portnums_pb2 is not None:
+            try:
+                return portnums_pb2.PortNum.Name(portnum)
+            except ValueError:
+                pass
+        return str(portnum)
+    if isinstance(portnum, str) and portnum:
+        return portnum.upper()
+    return None
+
+
+def _node_num(node_id):
+    """Node number for an int or a '!xxxxxxxx' node ID string; None if it is neither."""
+    if isinstance(node_id, bool):
+        return None
+    if isinstance(node_id, int):
+        return node_id
+    if isinstance(node_id, str) and node_id.startswith('!'):
+        try:
+            return int(node_id[1:], 16)
+        except ValueError:
+            return None
+    return None
+
+
+def compile_packet_filter(filter_conf):
+    """
+    Compiles a validated channel "filter" object into accept(packet) -> bool,
+    or None when it lets everything through. Runs in onReceive, so rejected
+    packets never reach the outbound queue or a serializer.
+    """
+    allow_ports = frozenset(filter_conf["portnums"]) if "portnums" in filter_conf else None
+    deny_ports = frozenset(filter_conf.get("exclude_portnums", ()))
+    allow_from = frozenset(filter_conf["from_nodes"]) if "from_nodes" in filter_conf else None
+    deny_from = frozenset(filter_conf.get("exclude_from_nodes", ()))
+    check_ports = allow_ports is not None or bool(deny_ports)
+    check_from = allow_from is not None or bool(deny_from)
+    if not check_ports and not check_from:
+        return None
+
+    def accept(packet):
+        if check_ports:
+            decoded = packet.get('decoded')
+            portnum = decoded.get('portnum') if isinstance(decoded, dict) else None # None for packets we could not decrypt
+            if portnum is not None and not isinstance(portnum, str):
+                portnum = _portnum_name(portnum)
+            if portnum in deny_ports or (allow_ports is not None and portnum not in allow_ports):
+                return False
+        if check_from:
+            sender = packet.get('from')
+            if sender is None:
+                sender = _node_num(packet.get('fromId'))
+            if sender in deny_from or (allow_from is not None and sender not in allow_from):
+                return False
+        return True
+    return accept
+
+
+def _projection_tree(fields):
+    """Nests dotted field paths into ((key, subtree or None), ...); selecting a parent wins over its children."""
+    tree = {}
+    for field in fields:
+        node = tree
+        parts = field.split('.')
+        for part in parts[:-1]:
+            if node.get(part, {}) is None:
+                break # Parent already selected whole
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+
+    def freeze(node):
+        return tuple((key, None if child is None else freeze(child)) for key, child in node.items())
+    return freeze(tree)
+
+
+def _project(source, tree):
+    projected = {}
+    for key, subtree in tree:
+        if key in source:
+            value = source[key]
+            if subtree is None:
+                projected[key] = value
+            elif isinstance(value, dict):
+                projected[key] = _project(value, subtree)
+    return projected
+
+
+def compile_projection(fields):
+    """
+    Compiles a channel's "fields" list (dotted paths such as 'decoded.text',
+    'rxSnr', 'fromId') into project(packet) -> dict holding only those fields.
+    Missing fields are left out rather than sent as null.
+    """
+    tree = _projection_tree(fields)
+    return lambda packet: _project(packet, tree)
+
+
+def _node_id(packet, id_key, num_key):
+    node_id = packet.get(id_key)
+    if node_id is None and isinstance(packet.get(num_key), int):
+        node_id = f"!{packet[num_key]:08x}"
+    return node_id
+
+
+def _packet_portnum(packet):
+    decoded = packet.get('decoded')
+    portnum = decoded.get('portnum') if isinstance(decoded, dict) else None
+    return portnum if portnum is None or isinstance(portnum, str) else _portnum_name(portnum)
+
+
+# Topic template placeholder -> function(packet, channel_id_str, gateway_id) returning its value
+TOPIC_FIELDS = {
+    'channel': lambda packet, channel_id_str, gateway_id: channel_id_str,
+    'portnum': lambda packet, channel_id_str, gateway_id: _packet_portnum(packet),
+    'fromId': lambda packet, channel_id_str, gateway_id: _node_id(packet, 'fromId', 'from'),
+    'toId': lambda packet, channel_id_str, gateway_id: _node_id(packet, 'toId', 'to'),
+    'from': lambda packet, channel_id_str, gateway_id: packet.get('from'),
+    'to': lambda packet, channel_id_str, gateway_id: packet.get('to'),
+    'gateway': lambda packet, channel_id_str, gateway_id: gateway_id,
+}
+
+
+def topic_template_fields(template):
+    """Placeholder names used by a topic template. Raises ValueError for malformed or unknown placeholders."""
+    fields = [field for _, field, _, _ in string.Formatter().parse(template) if field is not None]
+    unknown = [field for field in fields if field not in TOPIC_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown placeholder(s) {', '.join('{' + f + '}' for f in unknown)}; "
+                         f"supported: {', '.join('{' + f + '}' for f in TOPIC_FIELDS)}")
+    return fields
+
+
+def _topic_level(value):
+    """A placeholder value as one MQTT topic level: no separators or wildcards, never empty."""
+    if value is None:
+        return "unknown"
+    value = str(value)
+    for char in ('/', '+', '#', '\0'):
+        value = value.replace(char, '_')
+    return value or "unknown"
+
+
+def compile_topic_template(template, channel_id_str, gateway_id=None):
+    """
+    Compiles a validated topic template such as 'mesh/{channel}/{portnum}/{fromId}'
+    into render(packet) -> topic, or None when the topic has no placeholders.
+    Rendering only extracts the placeholder values; the topic string for each
+    distinct set of values is built once and kept in an LRU cache.
+    """
+    parsed = list(string.Formatter().parse(template))
+    getters = [TOPIC_FIELDS[field] for _, field, _, _ in parsed if field is not None]
+    if not getters:
+        return None
+    literals = [literal for literal, _, _, _ in parsed]
+
+    @functools.lru_cache(maxsize=TOPIC_CACHE_SIZE)
+    def format_topic(values):
+        parts = []
+        for index, literal in enumerate(literals):
+            parts.append(literal)
+            if index < len(values):
+                parts.append(_topic_level(values[index]))
+        return ''.join(parts)
+
+    def render(packet):
+        return format_topic(tuple(getter(packet, channel_id_str, gateway_id) for getter in getters))
+    render.cache_info = format_topic.cache_info
+    return render
+
+
+class Route:
+    """
+    Precompiled Meshtastic-to-MQTT route for one channel. Built by
+    AMCBPlugin._compile_routes and never mutated; a config reload or client
+    change swaps in a whole new route table instead.
+    """
+    __slots__ = ('channel_id_str', 'client', 'topic', 'qos', 'retain', 'payload_type', 'serializer', 'queue', 'batcher', 'spool', 'accept', 'render_topic', 'properties', 'reassembler')
+
+    def __init__(self, channel_id_str, client, topic, qos, retain, payload_type, serializer, queue, batcher=None, spool=None, accept=None,
+                 render_topic=None, properties=None, reassembler=None):
+        self.channel_id_str = channel_id_str
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+        self.retain = retain
+        self.payload_type = payload_type
+        self.serializer = serializer
+        self.queue = queue
+        self.batcher = batcher # Set only when the channel has batching enabled
+        self.spool = spool # Set only when the channel has store-and-forward enabled
+        self.accept = accept # Packet filter predicate; None accepts everything
+        self.render_topic = render_topic # Per-packet topic for templated topics; None publishes to topic
+        self.properties = properties # MQTT v5 publish properties (origin marker), or None
+        self.reassembler = reassembler # Set only when the channel rebuilds fragmented messages
+
+
+class OutboundQueue:
+    """
+    Bounded per-channel queue between the Meshtastic receive thread and MQTT.
+    A dedicated worker thread drains it and hands each item to `handler`, so
+    serialization and publishing never run on the radio receive path. Given an
+    asyncio `loop` (the asyncio engine), the queue has no thread of its own:
+    put() schedules the drain on the loop with call_soon_threadsafe instead.
+    """
+    DRAIN_BATCH = 64 # Items handled per loop callback before yielding to other channels and the network
+
+    def __init__(self, channel_id_str, handler, max_depth=1000, overflow="drop_oldest", block_timeout_ms=500, idle_handler=None, loop=None):
+        self.channel_id_str = channel_id_str
+        self.handler = handler # Called as handler(item) on the worker thread; returns True when published, False on failure, or None if it called record() itself
+        self.idle_handler = idle_handler # Called as idle_handler(final) after each item and on wake-up; returns seconds until it is next due, or None
+        self.max_depth = max_depth
+        self.overflow = overflow
+        self.block_timeout_ms = block_timeout_ms
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.published = 0
+        self.failed = 0
+        self.skipped = 0 # Handled without publishing, e.g. claimed by another gateway
+
+        self._items = collections.deque() # (item, ready_at) pairs
+        self._cond = threading.Condition()
+        self._running = True
+        self._loop = loop
+        if loop is None:
+            self._worker = threading.Thread(target=self._run, name=f"amcb-publish-{channel_id_str}", daemon=True)
+            self._worker.start()
+        else:
+            self._wake_pending = False
+            self._timer = None # Loop timer for the next ready_at or idle_handler deadline
+            self._stopped = threading.Event()
+
+    def configure(self, max_depth, overflow, block_timeout_ms):
+        with self._cond:
+            self.max_depth = max_depth
+            self.overflow = overflow
+            self.block_timeout_ms = block_timeout_ms
+            while len(self._items) > self.max_depth: # Shrink immediately if depth was lowered
+                self._items.popleft()
+                self.dropped += 1
+            self._notify()
+
+    def put(self, item, ready_at=None):
+        """
+        Enqueues an item, applying the overflow policy. Returns False if the item
+        was dropped. An item with ready_at (time.monotonic) is not handed to the
+        handler before then, and holds back the items queued after it.
+        """
+        with self._cond:
+            if not self._running:
+                return False
+            if len(self._items) >= self.max_depth:
+                if self.overflow == "drop_newest":
+                    self.dropped += 1
+                    return False
+                elif self.overflow == "block":
+                    deadline = time.monotonic() + self.block_timeout_ms / 1000.0
+                    while self._running and len(self._items) >= self.max_depth:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self._cond.wait(remaining)
+                    if not self._running:
+                        return False
+                else: # "drop_oldest"
+                    self._items.popleft()
+                    self.dropped += 1
+            self._items.append((item, ready_at))
+            self.enqueued += 1
+            self._notify()
+            return True
+
+    def _notify(self):
+        """Wakes the consumer. Caller holds _cond."""
+        self._cond.notify_all() # Also wakes producers blocked on a full queue
+        if self._loop is not None and not self._wake_pending:
+            self._wake_pending = True
+            self._loop.call_soon_threadsafe(self._drain)
+
+    def _take(self):
+        """Pops the next item if it is ready, as (item, None), else (None, seconds until it is). Caller holds _cond."""
+        if not self._items:
+            return None, None
+        ready_at = self._items[0][1]
+        if ready_at is not None and self._running: # Stopping hands everything over without waiting
+            remaining = ready_at - time.monotonic()
+            if remaining > 0:
+                return None, remaining
+        item = self._items.popleft()[0]
+        self._cond.notify_all() # Wake producers blocked on a full queue
+        return item, None
+
+    def _handle(self, item):
+        try:
+            ok = self.handler(item)
+        except Exception as e:
+            logger.error(f"Outbound worker for channel '{self.channel_id_str}' failed to handle item: {e}", exc_info=True)
+            ok = False
+        if ok is not None:
+            self.record(published=int(ok), failed=int(not ok))
+
+    def record(self, published=0, failed=0, skipped=0):
+        """Counts outcomes the handler only learns later (batched items, at flush) or that are not publishes."""
+        with self._cond:
+            self.published += published
+            self.failed += failed
+            self.skipped += skipped
+
+    def _idle(self, final):
+        if self.idle_handler is None:
+            return None
+        try:
+            return self.idle_handler(final)
+        except Exception as e:
+            logger.error(f"Outbound worker for channel '{self.channel_id_str}' idle handler failed: {e}", exc_info=True)
+            return None
+
+    def _run(self):
+        wait_timeout = None
+        while True:
+            with self._cond:
+                item, hold = self._take()
+                if item is None and self._running:
+                    self._cond.wait(min((t for t in (wait_timeout, hold) if t is not None), default=None))
+                    item, hold = self._take()
+                stopping = not self._running and item is None # Stopped and drained
+            if item is not None:
+                self._handle(item)
+            wait_timeout = self._idle(stopping)
+            if stopping:
+                return
+
+    def _drain(self):
+        """Event-loop counterpart of _run: handles up to DRAIN_BATCH ready items per callback."""
+        with self._cond:
+            self._wake_pending = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _ in range(self.DRAIN_BATCH):
+            with self._cond:
+                item, hold = self._take()
+                stopping = not self._running and item is None
+            if item is None:
+                break
+            self._handle(item)
+        else: # Possibly more ready: continue after the loop's other callbacks
+            self._idle(False)
+            with self._cond:
+                if not self._wake_pending:
+                    self._wake_pending = True
+                    self._loop.call_soon(self._drain)
+            return
+        wait_timeout = self._idle(stopping)
+        if stopping:
+            self._stopped.set()
+            return
+        delay = min((t for t in (wait_timeout, hold) if t is not None), default=None)
+        if delay is not None:
+            self._timer = self._loop.call_later(delay, self._drain)
+
+    def stats(self):
+        with self._cond:
+            return {"depth": len(self._items), "enqueued": self.enqueued, "dropped": self.dropped,
+                    "published": self.published, "failed": self.failed, "skipped": self.skipped}
+
+    def stop(self, timeout=2.0):
+        """Stops accepting items, lets the worker drain what is queued, then joins it."""
+        with self._cond:
+            self._running = False
+            self._notify()
+        if self._loop is None:
+            self._worker.join(timeout)
+        else:
+            self._stopped.wait(timeout)
+
+
+class PublishBatcher:
+    """
+    Coalesces serialized payloads for one channel into a single array payload,
+    flushed when max_messages or max_bytes is reached or max_delay_ms after the
+    first pending item. Only touched from the channel's outbound worker (its
+    thread, or the event loop under the asyncio engine).
+    """
+
+    def __init__(self, channel_id_str, publish):
+        self.channel_id_str = channel_id_str
+        self.publish = publish # publish(route, topic, payload_bytes, received_ats) -> bool
+        self.record = None # Optional record(published=n) / record(failed=n), called with each batch's outcome
+        self.enabled = False
+        self.max_messages = DEFAULT_BATCH_CONFIG["max_messages"]
+        self.max_bytes = DEFAULT_BATCH_CONFIG["max_bytes"]
+        self.max_delay_ms = DEFAULT_BATCH_CONFIG["max_delay_ms"]
+        self.batches_published = 0
+
+        self._route = None
+        self._topic = None
+        self._payloads = []
+        self._received_ats = []
+        self._size = 0
+        self._deadline = None
+
+    def configure(self, batch_conf):
+        """Applies a validated batch config, or disables batching when batch_conf is None."""
+        self.enabled = batch_conf is not None
+        if batch_conf is not None:
+            self.max_messages = batch_conf["max_messages"]
+            self.max_bytes = batch_conf["max_bytes"]
+            self.max_delay_ms = batch_conf["max_delay_ms"]
+
+    def add(self, route, topic, payload, received_at):
+        if self._payloads and (topic, route.payload_type) != (self._topic, self._route.payload_type):
+            self.flush() # Never mix topics or encodings in one batch
+        if self._payloads and self._size + len(payload) > self.max_bytes:
+            self.flush()
+        if not self._payloads:
+            self._deadline = time.monotonic() + self.max_delay_ms / 1000.0
+        self._route = route # Latest route carries the current client
+        self._topic = topic
+        self._payloads.append(payload)
+        self._received_ats.append(received_at)
+        self._size += len(payload)
+        if len(self._payloads) >= self.max_messages or self._size >= self.max_bytes:
+            self.flush()
+
+    def poll(self, final=False):
+        """Flushes the pending batch if its delay expired (or final); returns seconds until the next deadline."""
+        if not self._payloads:
+            return None
+        remaining = self._deadline - time.monotonic()
+        if final or remaining <= 0:
+            self.flush()
+            return None
+        return remaining
+
+    def flush(self):
+        if not self._payloads:
+            return
+        route, topic, payloads, received_ats = self._route, self._topic, self._payloads, self._received_ats
+        self._route, self._topic, self._payloads, self._received_ats, self._size, self._deadline = None, None, [], [], 0, None
+        try:
+            payload = BATCH_JOINERS[route.payload_type](payloads)
+        except Exception as e:
+            logger.error(f"Could not join batch of {len(payloads)} for MQTT (channel '{self.channel_id_str}'): {e}", exc_info=True)
+            ok = False
+        else:
+            ok = self.publish(route, topic, payload, received_ats)
+        if ok:
+            self.batches_published += 1
+        if self.record is not None:
+            if ok:
+                self.record(published=len(payloads))
+            else:
+                self.record(failed=len(payloads))
+
+
+class _TokenBucket:
+    """Airtime budget for one channel: refills at duty_cycle seconds of airtime per second, up to burst."""
+
+    def __init__(self, duty_cycle, burst):
+        self.rate = duty_cycle
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        self.refill(now)
+        cost = min(cost, self.capacity) # An oversized packet waits for a full bucket rather than forever
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+
+class TransmitScheduler:
+    """
+    Paces MQTT-to-Meshtastic transmissions on its own thread so inbound MQTT
+    bursts neither flood the LoRa channel nor block the paho network loop.
+    Each bridge channel has a token bucket of airtime derived from the radio's
+    modem preset and its duty_cycle_percent. Each channel's sends go out
+    strictly in the order they were queued; across channels the oldest
+    waiting send of the highest priority goes first, and a channel whose bucket
+    is empty yields to the others. Identical payloads to the same destination
+    within dedup_window_s are dropped.
+    Given an asyncio `loop`, sends are paced with loop timers instead of a thread.
+    """
+
+    def __init__(self, wait_histogram=None, loop=None):
+        self.radio_params = MODEM_PRESETS[DEFAULT_MODEM_PRESET]
+        self.wait_histogram = wait_histogram # Optional Histogram observing queue wait per send, labelled by channel
+        self.sent = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.airtime_total = 0.0
+
+        self._channels = {} # channel_id_str -> tx config
+        self._buckets = {} # channel_id_str -> _TokenBucket
+        self._recent = {} # channel_id_str -> OrderedDict of (destination, payload digest) -> expiry (monotonic)
+        self._queues = {} # channel_id_str -> deque of (-priority, sequence, channel_id_str, airtime, enqueued_at, send)
+        self._queued = 0
+        self._sequence = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._loop = loop
+        if loop is None:
+            self._worker = threading.Thread(target=self._run, name="amcb-tx-scheduler", daemon=True)
+            self._worker.start()
+        else:
+            self._timer = None # Loop timer for the next bucket refill
+
+    def set_lora_config(self, lora_config):
+        with self._cond:
+            self.radio_params = lora_params(lora_config)
+        logger.info(f"Transmit scheduler airtime model: SF{self.radio_params[0]}, BW {self.radio_params[1] / 1000:g} kHz, CR 4/{self.radio_params[2]}")
+
+    def configure_channel(self, channel_id_str, tx_config):
+        with self._cond:
+            self._channels[channel_id_str] = tx_config
+            duty_cycle = tx_config["duty_cycle_percent"] / 100.0
+            burst = tx_config["burst_airtime_ms"] / 1000.0
+            bucket = self._buckets.get(channel_id_str)
+            if bucket is None:
+                self._buckets[channel_id_str] = _TokenBucket(duty_cycle, burst)
+            else:
+                bucket.refill(time.monotonic())
+                bucket.rate, bucket.capacity = duty_cycle, burst
+                bucket.tokens = min(bucket.tokens, burst)
+            self._notify()
+
+    def channel_ids(self):
+        with self._cond:
+            return list(self._channels)
+
+    def remove_channel(self, channel_id_str):
+        with self._cond:
+            self._channels.pop(channel_id_str, None)
+            self._buckets.pop(channel_id_str, None)
+            self._recent.pop(channel_id_str, None)
+            self._queued -= len(self._queues.pop(channel_id_str, ()))
+
+    def submit(self, channel_id_str, destination, payload, send):
+        """Queues send() for a payload (bytes) bound for destination. Returns False if deduplicated or dropped."""
+        now = time.monotonic()
+        with self._cond:
+            tx_config = self._channels.get(channel_id_str)
+            if tx_config is None or not self._running:
+                return False
+            # One table per channel: channels have their own dedup_window_s, so a shared table
+            # would be expired by whichever window is shortest
+            recent = self._recent.setdefault(channel_id_str, collections.OrderedDict())
+            while recent and next(iter(recent.values())) <= now:
+                recent.popitem(last=False) # Expire oldest entries first
+            dedup_key = (destination, hashlib.blake2b(payload, digest_size=16).digest())
+            if recent.get(dedup_key, 0.0) > now:
+                self.deduplicated += 1
+                return False
+            queue = self._queues.setdefault(channel_id_str, collections.deque())
+            if len(queue) >= tx_config["max_queue"]:
+                self.dropped += 1
+                logger.warning(f"Transmit queue for bridge channel '{channel_id_str}' full. Dropping MQTT message.")
+                return False
+            recent[dedup_key] = now + tx_config["dedup_window_s"]
+            recent.move_to_end(dedup_key)
+            airtime = estimate_airtime(len(payload), *self.radio_params)
+            self._sequence += 1
+            queue.append((-tx_config["priority"], self._sequence, channel_id_str, airtime, now, send))
+            self._queued += 1
+            self._notify()
+            return True
+
+    def _notify(self):
+        """Wakes the sender. Caller holds _cond."""
+        if self._loop is None:
+            self._cond.notify_all()
+        else:
+            self._loop.call_soon_threadsafe(self._pump)
+
+    def _next_ready(self, now):
+        """
+        Pops the best-priority channel head whose bucket can pay for it, else returns
+        the shortest wait. Only heads are considered, so a channel never reorders.
+        """
+        shortest_wait = None
+        for queue in sorted((q for q in self._queues.values() if q), key=lambda q: q[0][:2]):
+            entry = queue[0]
+            bucket = self._buckets.get(entry[2])
+            wait = 0.0 if bucket is None else bucket.wait_time(entry[3], now)
+            if wait <= 0:
+                queue.popleft()
+                self._queued -= 1
+                if bucket is not None:
+                    bucket.tokens -= min(entry[3], bucket.capacity)
+                return entry, None
+            shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+        return None, shortest_wait
+
+    def _account(self, entry):
+        """Records a dequeued entry in the stats; returns how long it waited. Caller holds _cond."""
+        queued_for = time.monotonic() - entry[4]
+        self.wait_total += queued_for
+        self.wait_max = max(self.wait_max, queued_for)
+        self.airtime_total += entry[3]
+        self.sent += 1
+        return queued_for
+
+    def _transmit(self, entry, queued_for):
+        if self.wait_histogram is not None:
+            self.wait_histogram.observe(queued_for, entry[2])
+        try:
+            entry[5]()
+        except Exception as e:
+            logger.error(f"Scheduled Meshtastic transmit for bridge channel '{entry[2]}' failed: {e}", exc_info=True)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    entry, wait = self._next_ready(time.monotonic())
+                    if entry is not None:
+                        break
+                    self._cond.wait(wait)
+                if not self._running:
+                    return
+                queued_for = self._account(entry)
+            self._transmit(entry, queued_for)
+
+    def _pump(self):
+        """Event-loop counterpart of _run: sends everything its bucket allows, then sleeps on a loop timer."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                entry, wait = self._next_ready(time.monotonic())
+                if entry is None:
+                    break
+                queued_for = self._account(entry)
+            self._transmit(entry, queued_for)
+        if wait is not None:
+            self._timer = self._loop.call_later(wait, self._pump)
+
+    def stats(self):
+        with self._cond:
+            return {"queued": self._queued, "sent": self.sent, "deduplicated": self.deduplicated,
+                    "dropped": self.dropped, "airtime_s": round(self.airtime_total, 3),
+                    "avg_wait_s": round(self.wait_total / self.sent, 3) if self.sent else 0.0,
+                    "max_wait_s": round(self.wait_max, 3)}
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._queues.clear()
+            self._queued = 0
+            self._cond.notify_all()
+        if self._loop is None:
+            self._worker.join(2.0)
+
+
+class PacketSpool:
+    """
+    Durable store-and-forward log for one channel's outbound MQTT messages.
+
+    Records are appended to numbered segment files in `directory`; a segment
+    is deleted once replayed, and a small cursor file remembers how far into
+    the oldest segment replay got, so a restart resumes without re-sending
+    (delivery is at-least-once for the batch in flight at a crash). Whole
+    segments are evicted oldest-first when the spool exceeds max_bytes or a
+    segment's newest record is older than max_age_s.
+    """
+
+    RECORD_HEADER = struct.Struct('!IdBHI') # crc32 of the rest, timestamp, flags (qos | retain << 2), topic length, payload length
+    CURSOR_FILENAME = "cursor.json"
+    AGE_CHECK_INTERVAL_S = 60
+
+    def __init__(self, directory, max_bytes=DEFAULT_SPOOL_CONFIG["max_bytes"], max_age_s=DEFAULT_SPOOL_CONFIG["max_age_s"],
+                 segment_bytes=DEFAULT_SPOOL_CONFIG["segment_bytes"], fsync=False, replay_rate=DEFAULT_SPOOL_CONFIG["replay_rate"]):
+        self.directory = directory
+        self.replay_rate = replay_rate
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self.spooled = 0
+        self.replayed = 0
+        self.evicted_bytes = 0
+        self.expired = 0
+
+        self._lock = threading.Lock()
+        self._replaying = False
+        self._write_file = None
+        self._last_age_check = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {} # segment number -> bytes on disk
+        for name in os.listdir(directory):
+            if name.endswith(".seg"):
+                try:
+                    self._sizes[int(name[:-4])] = os.path.getsize(os.path.join(directory, name))
+                except ValueError:
+                    continue
+        self._read_segment, self._read_offset = self._load_cursor()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{segment:012d}.seg")
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, self.CURSOR_FILENAME), 'r') as f:
+                cursor = json.load(f)
+            if cursor["segment"] in self._sizes:
+                return cursor["segment"], cursor["offset"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return (min(self._sizes) if self._sizes else None), 0
+
+    def _save_cursor(self):
+        cursor_path = os.path.join(self.directory, self.CURSOR_FILENAME)
+        with open(cursor_path + ".tmp", 'w') as f:
+            json.dump({"segment": self._read_segment, "offset": self._read_offset}, f)
+        os.replace(cursor_path + ".tmp", cursor_path)
+
+    def pending_bytes(self):
+        with self._lock:
+            return self._pending_bytes()
+
+    def _pending_bytes(self):
+        return sum(self._sizes.values()) - (self._read_offset if self._read_segment in self._sizes else 0)
+
+    def has_pending(self):
+        with self._lock:
+            return self._pending_bytes() > 0
+
+    @property
+    def is_replaying(self):
+        return self._replaying
+
+    def append(self, topic, payload, qos=0, retain=False, timestamp=None):
+        topic_bytes = topic.encode('utf-8')
+        body = self.RECORD_HEADER.pack(0, timestamp or time.time(), qos | (int(retain) << 2), len(topic_bytes), len(payload))[4:] + topic_bytes + payload
+        record = struct.pack('!I', zlib.crc32(body)) + body
+        with self._lock:
+            tail = max(self._sizes) if self._sizes else None
+            if tail is None or self._sizes[tail] >= self.segment_bytes or self._write_file is None:
+                if self._write_file is not None:
+                    self._write_file.close()
+                tail = (tail + 1) if tail is not None else 0
+                self._write_file = open(self._segment_path(tail), 'ab')
+                self._sizes[tail] = 0
+                if self._read_segment is None:
+                    self._read_segment, self._read_offset = tail, 0
+            self._write_file.write(record)
+            self._write_file.flush()
+            if self.fsync:
+                os.fsync(self._write_file.fileno())
+            self._sizes[tail] += len(record)
+            self.spooled += 1
+            self._enforce_limits()
+
+    def _enforce_limits(self):
+        now = time.time()
+        check_age = now - self._last_age_check >= self.AGE_CHECK_INTERVAL_S
+        if check_age:
+            self._last_age_check = now
+        while len(self._sizes) > 1:
+            oldest = min(self._sizes)
+            over_size = sum(self._sizes.values()) > self.max_bytes
+            too_old = check_age and os.path.getmtime(self._segment_path(oldest)) < now - self.max_age_s
+            if not (over_size or too_old):
+                break
+            self.evicted_bytes += self._sizes[oldest] - (self._read_offset if oldest == self._read_segment else 0)
+            logger.warning(f"Spool {self.directory}: evicting segment {oldest} ({'size cap' if over_size else 'age'}).")
+            self._delete_segment(oldest)
+
+    def _delete_segment(self, segment):
+        """Removes a segment and moves the read cursor past it if needed. Caller holds _lock."""
+        del self._sizes[segment]
+        try:
+            os.remove(self._segment_path(segment))
+        except OSError:
+            pass
+        if segment == self._read_segment:
+            self._read_segment = min(self._sizes) if self._sizes else None
+            self._read_offset = 0
+            self._save_cursor()
+
+    def _read_records(self, max_records):
+        """Reads up to max_records from the cursor: list of (end_offset, timestamp, qos, retain, topic, payload)."""
+        with self._lock:
+            segment, offset = self._read_segment, self._read_offset
+            if segment is None:
+                return segment, []
+            available = self._sizes[segment] - offset
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                read_len = 4 * 2**20
+                header = f.read(min(self.RECORD_HEADER.size, available))
+                if len(header) == self.RECORD_HEADER.size: # Reads at least the first record whole, however large
+                    topic_len, payload_len = self.RECORD_HEADER.unpack(header)[3:]
+                    read_len = max(read_len, self.RECORD_HEADER.size + topic_len + payload_len)
+                f.seek(offset)
+                data = f.read(min(available, read_len))
+            # Whole records only ever reach the active tail, so anything cut short elsewhere was left by a crash mid-write
+            truncation_possible = offset + len(data) >= self._sizes[segment] and not (
+                self._write_file is not None and segment == max(self._sizes))
+        records = []
+        position = 0
+        truncated = False
+        while len(records) < max_records:
+            if position + self.RECORD_HEADER.size > len(data):
+                truncated = position < len(data)
+                break
+            crc, timestamp, flags, topic_len, payload_len = self.RECORD_HEADER.unpack_from(data, position)
+            end = position + self.RECORD_HEADER.size + topic_len + payload_len
+            if end > len(data):
+                truncated = True
+                break
+            if zlib.crc32(data[position + 4:end]) != crc:
+                logger.error(f"Spool {self.directory}: corrupt record in segment {segment} at offset {offset + position}. Skipping rest of segment.")
+                records.append((None, None, None, None, None, None)) # Marker: drop remainder of this segment
+                break
+            topic_start = position + self.RECORD_HEADER.size
+            records.append((offset + end, timestamp, flags & 0x03, bool(flags & 0x04),
+                            data[topic_start:topic_start + topic_len].decode('utf-8', 'replace'),
+                            data[topic_start + topic_len:end]))
+            position = end
+        if truncated and truncation_possible:
+            logger.error(f"Spool {self.directory}: truncated record in segment {segment} at offset {offset + position} "
+                         f"(interrupted write). Skipping rest of segment.")
+            records.append((None, None, None, None, None, None))
+        return segment, records
+
+    def _commit(self, segment, end_offset):
+        """Advances the cursor past a replayed record, deleting the segment once it is consumed."""
+        with self._lock:
+            if segment != self._read_segment:
+                return # Segment was evicted meanwhile
+            self._read_offset = self._sizes[segment] if end_offset is None else end_offset
+            if self._read_offset >= self._sizes[segment]:
+                if segment == max(self._sizes) and self._write_file is not None:
+                    self._write_file.close() # Start a fresh tail segment on the next append
+                    self._write_file = None
+                self._delete_segment(segment)
+
+    def replay(self, publish, should_continue):
+        """
+        Replays spooled records oldest-first through publish(topic, payload, qos, retain) -> bool
+        at up to replay_rate messages per second. Returns True once the spool is empty; False if
+        publish failed, should_continue() turned false, another replay is already running or no
+        record could be read although bytes are still pending.
+        """
+        with self._lock:
+            if self._replaying:
+                return False
+            self._replaying = True
+        interval = 1.0 / self.replay_rate
+        try:
+            while should_continue():
+                segment, records = self._read_records(max_records=100)
+                if not records:
+                    return not self.has_pending()
+                for end_offset, timestamp, qos, retain, topic, payload in records:
+                    if end_offset is None: # Corrupt tail of a segment
+                        self._commit(segment, None)
+                        break
+                    if timestamp < time.time() - self.max_age_s:
+                        self.expired += 1
+                        self._commit(segment, end_offset)
+                        continue
+                    if not should_continue() or not publish(topic, payload, qos, retain):
+                        return False
+                    self.replayed += 1
+                    self._commit(segment, end_offset)
+                    time.sleep(interval)
+                with self._lock:
+                    if self._read_segment == segment:
+                        self._save_cursor()
+            return False
+        finally:
+            with self._lock:
+                self._replaying = False
+
+    def stats(self):
+        with self._lock:
+            return {"pending_bytes": self._pending_bytes(), "segments": len(self._sizes), "spooled": self.spooled,
+                    "replayed": self.replayed, "evicted_bytes": self.evicted_bytes, "expired": self.expired}
+
+    def close(self):
+        with self._lock:
+            if self._write_file is not None:
+                self._write_file.close()
+                self._write_file = None
+            if self._read_segment is not None:
+                self._save_cursor()
+
+
+def packet_dedup_key(packet):
+    """(sender node number, packet id) identifying a mesh packet across rebroadcasts and gateways, or None."""
+    sender, packet_id = packet.get('from'), packet.get('id')
+    if not sender or not packet_id: # id 0 means the sender did not assign one
+        return None
+    return (sender, packet_id)
+
+
+class PacketDedupCache:
+    """
+    Time-windowed set of packet_dedup_key()s already bridged, so rebroadcasts
+    of the same packet are published once. Keys are kept in arrival order in
+    an OrderedDict, which makes lookup O(1) and lets expired or excess entries
+    be evicted from the front. Loop prevention uses the same structure for
+    fingerprints of what the bridge itself sent.
+
+    In shared mode it also remembers which gateway claimed each packet on
+    the broker; when several claim at once, the lowest gateway ID wins.
+    """
+
+    def __init__(self, window_s=DEFAULT_DEDUP_CONFIG["window_s"], max_entries=DEFAULT_DEDUP_CONFIG["max_entries"]):
+        self.window_s = window_s
+        self.max_entries = max_entries
+        self.duplicates = 0
+        self._seen = collections.OrderedDict() # key -> (expiry (monotonic), None)
+        self._claims = collections.OrderedDict() # key -> (expiry, winning gateway ID)
+        self._lock = threading.Lock()
+
+    def configure(self, window_s, max_entries):
+        with self._lock:
+            self.window_s = window_s
+            self.max_entries = max_entries
+
+    def _evict(self, table, now):
+        """Caller holds _lock. Entries expire in insertion order, so only the front needs checking."""
+        while table and (len(table) >= self.max_entries or next(iter(table.values()))[0] <= now):
+            table.popitem(last=False)
+
+    def add(self, key, now=None):
+        """Records key; returns False if it was already seen within the window."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._evict(self._seen, now)
+            if key in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen[key] = (now + self.window_s, None)
+            return True
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._seen.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def record_claim(self, key, gateway_id, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._evict(self._claims, now)
+            current = self._claims.get(key)
+            if current is None or gateway_id < current[1]:
+                self._claims[key] = (now + self.window_s, gateway_id)
+
+    def claimed_by(self, key):
+        """Winning gateway ID for key, or None if no gateway has claimed it within the window."""
+        with self._lock:
+            claim = self._claims.get(key)
+            return claim[1] if claim is not None and claim[0] > time.monotonic() else None
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._seen), "claims": len(self._claims), "duplicates": self.duplicates}
+
+
+MeshMessage = collections.namedtuple('MeshMessage', ['destination', 'channel_index', 'portnum', 'payload', 'want_ack', 'is_text'])
+
+
+def _mesh_destination(value, default):
+    """Destination for an explicit "to" value; default only when none was given."""
+    if value is None:
+        return default
+    if value in (BROADCAST_ADDR, '^all', 0xFFFFFFFF):
+        return BROADCAST_ADDR
+    if isinstance(value, str) and _node_num(value) is not None:
+        return value
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    raise ValueError(f"invalid destination {value!r}; use a '!xxxxxxxx' node ID, a node number or '^all'")
+
+
+def _portnum_value(portnum):
+    """PortNum number for a name or number, as sendData expects."""
+    name = _portnum_name(portnum)
+    if name is None:
+        raise ValueError(f"invalid portnum {portnum!r}")
+    if name.isdigit():
+        return int(name)
+    if portnums_pb2 is None:
+        raise ValueError(f"portnum names need meshtastic's portnums_pb2; give {name} as a number")
+    try:
+        return portnums_pb2.PortNum.Value(name)
+    except ValueError:
+        raise ValueError(f"unknown portnum {name!r}") from None
+
+
+TEXT_PORTNUM = 1 # TEXT_MESSAGE_APP
+PRIVATE_PORTNUM = 256 # PRIVATE_APP, the default for binary payloads
+
+
+def parse_mesh_message(inbound_format, payload, m2m_conf):
+    """
+    Turns an inbound MQTT payload into a MeshMessage for the channel's
+    mqtt_to_meshtastic format. Raises ValueError for payloads that cannot be sent.
+
+    * text: the payload is a UTF-8 text message.
+    * json: an object with "text" or base64 "payload", and optional "to",
+      "channel", "portnum" and "want_ack". Anything else is sent as text.
+    * protobuf: a Meshtastic ServiceEnvelope with a decoded MeshPacket.
+    """
+    default_destination = m2m_conf.get("target_node_id") or BROADCAST_ADDR
+    default_channel = m2m_conf["target_channel_index"]
+    if inbound_format == 'protobuf':
+        if mqtt_pb2 is None:
+            raise ValueError("protobuf input needs meshtastic's mqtt_pb2")
+        envelope = mqtt_pb2.ServiceEnvelope()
+        try:
+            envelope.ParseFromString(bytes(payload))
+        except Exception as e:
+            raise ValueError(f"not a ServiceEnvelope: {e}") from None
+        packet = envelope.packet
+        if packet.WhichOneof('payload_variant') != 'decoded':
+            raise ValueError("ServiceEnvelope packet is encrypted; only decoded packets can be sent")
+        data = packet.decoded
+        return MeshMessage(_mesh_destination(packet.to or None, default_destination), # 0 is an unset MeshPacket.to
+                           packet.channel if 0 < packet.channel < MAX_CHANNELS else default_channel,
+                           data.portnum or PRIVATE_PORTNUM, bytes(data.payload), packet.want_ack, data.portnum == TEXT_PORTNUM)
+
+    text = bytes(payload).decode('utf-8', errors='replace').strip()
+    if inbound_format == 'json' and text.startswith('{'):
+        try:
+            command = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}") from None
+        destination = _mesh_destination(command.get("to"), default_destination)
+        channel_index = command.get("channel", default_channel)
+        if not isinstance(channel_index, int) or isinstance(channel_index, bool) or not 0 <= channel_index < MAX_CHANNELS:
+            raise ValueError(f"invalid channel {channel_index!r}; must be 0-{MAX_CHANNELS - 1}")
+        want_ack = bool(command.get("want_ack", False))
+        if isinstance(command.get("text"), str):
+            portnum = _portnum_value(command.get("portnum", TEXT_PORTNUM))
+            return MeshMessage(destination, channel_index, portnum, command["text"].encode('utf-8'), want_ack, portnum == TEXT_PORTNUM)
+        if isinstance(command.get("payload"), str):
+            try:
+                data = base64.b64decode(command["payload"], validate=True)
+            except ValueError:
+                raise ValueError("'payload' must be base64") from None
+            portnum = _portnum_value(command.get("portnum", PRIVATE_PORTNUM))
+            return MeshMessage(destination, channel_index, portnum, data, want_ack, False)
+        raise ValueError("JSON message needs a 'text' string or a base64 'payload'")
+    return MeshMessage(default_destination, default_channel, TEXT_PORTNUM, text.encode('utf-8'), False, True)
+
+
+def _utf8_cut(data, limit):
+    """Largest prefix length <= limit that does not split a UTF-8 character."""
+    if limit >= len(data):
+        return len(data)
+    while limit > 0 and (data[limit] & 0xC0) == 0x80:
+        limit -= 1
+    return limit
+
+
+def fragment_payload(payload, is_text, max_len=MAX_MESH_PAYLOAD, max_fragments=DEFAULT_MAX_FRAGMENTS, message_id=0):
+    """
+    Splits a payload into at most max_fragments mesh payloads of at most
+    max_len bytes. Text fragments start with a readable "[i/n #id] " so stock
+    clients still show them sensibly; binary fragments carry FRAGMENT_HEADER.
+    message_id tells apart sets from one sender that arrive interleaved.
+    Returns (fragments, truncated).
+    """
+    if len(payload) <= max_len:
+        return [payload], False
+    if not is_text:
+        chunk_len = max_len - FRAGMENT_HEADER.size
+        chunks = [payload[i:i + chunk_len] for i in range(0, len(payload), chunk_len)]
+        truncated = len(chunks) > max_fragments
+        chunks = chunks[:max_fragments]
+        return [FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, message_id & 0xFFFF, index, len(chunks)) + chunk
+                for index, chunk in enumerate(chunks, 1)], truncated
+    text_id = message_id & 0xFF
+    count = 2
+    while True: # The prefix width depends on the fragment count, so iterate until it is wide enough
+        prefix_len = len(f"[{count}/{count} #{text_id:02x}] ")
+        chunks, rest = [], payload
+        while rest and len(chunks) < max_fragments:
+            cut = _utf8_cut(rest, max_len - prefix_len)
+            chunks.append(rest[:cut])
+            rest = rest[cut:]
+        if len(f"[{len(chunks)}/{len(chunks)} #{text_id:02x}] ") <= prefix_len:
+            break
+        count = len(chunks)
+    return [f"[{index}/{len(chunks)} #{text_id:02x}] ".encode('utf-8') + chunk
+            for index, chunk in enumerate(chunks, 1)], bool(rest)
+
+
+class FragmentReassembler:
+    """
+    Rebuilds messages split by fragment_payload() on another gateway, so a
+    channel publishes one MQTT message per original message. Only used from
+    onReceive's thread. Incomplete sets expire after timeout_s. A repeated
+    index never overwrites a fragment already held, so sets cannot be mixed.
+    """
+
+    def __init__(self, timeout_s=FRAGMENT_TIMEOUT_S):
+        self.timeout_s = timeout_s
+        self.reassembled = 0
+        self.expired = 0
+        self.duplicates = 0
+        self._partial = collections.OrderedDict() # key -> (deadline, count, {index: chunk})
+
+    def add(self, packet):
+        """Returns packet unchanged if it is not a fragment, the rebuilt packet once complete, else None."""
+        decoded = packet.get('decoded')
+        if not isinstance(decoded, dict):
+            return packet
+        text = decoded.get('text')
+        if isinstance(text, str):
+            match = TEXT_FRAGMENT_RE.match(text)
+            if match is None:
+                return packet
+            index, count = int(match.group(1)), int(match.group(2))
+            key = (packet.get('from'), packet.get('channel_index'), 'text', count, match.group(3))
+            chunk = text[match.end():].encode('utf-8')
+        else:
+            data = decoded.get('payload')
+            if not isinstance(data, bytes) or len(data) < FRAGMENT_HEADER.size or not data.startswith(FRAGMENT_MAGIC):
+                return packet
+            _, message_id, index, count = FRAGMENT_HEADER.unpack_from(data)
+            key, chunk = (packet.get('from'), message_id), data[FRAGMENT_HEADER.size:]
+        if not 1 <= index <= count:
+            return packet
+
+        now = time.monotonic()
+        while self._partial and next(iter(self._partial.values()))[0] <= now:
+            self._partial.popitem(last=False)
+            self.expired += 1
+        entry = self._partial.get(key)
+        if entry is None:
+            entry = self._partial[key] = (now + self.timeout_s, count, {})
+        if index in entry[2]:
+            self.duplicates += 1
+            logger.debug(f"Fragment {index}/{count} from {packet.get('from')} already held. Ignoring repeat.")
+            return None
+        entry[2][index] = chunk
+        if len(entry[2]) < count:
+            return None
+        del self._partial[key]
+        self.reassembled += 1
+        data = b''.join(entry[2][i] for i in range(1, count + 1))
+        rebuilt_decoded = dict(decoded, payload=data)
+        if isinstance(text, str):
+            rebuilt_decoded['text'] = data.decode('utf-8', errors='replace')
+        rebuilt = dict(packet, decoded=rebuilt_decoded, fragments=count)
+        rebuilt.pop('raw', None) # The last fragment's MeshPacket no longer matches
+        return rebuilt
+
+
+def connection_key(config):
+    """
+    Identifies the broker session a channel config needs. Channels with equal keys
+    share one paho client; the Will is part of the key because LWT is per-session.
+    """
+    tls_config = config.get("tls") if isinstance(config.get("tls"), dict) else {}
+    will_config = config.get("will") if isinstance(config.get("will"), dict) else {}
+    return (config["host"], int(config["port"]), config.get("protocol", "3.1.1"),
+            config.get("username"), config.get("password"),
+            (tls_config.get("ca_certs"), tls_config.get("certfile"), tls_config.get("keyfile")),
+            (will_config.get("topic"), will_config.get("payload", "offline"),
+             will_config.get("qos", 0), will_config.get("retain", False)))
+
+
+def subscription_topic(config):
+    m2m_conf = config.get("mqtt_to_meshtastic")
+    return m2m_conf["subscribe_topic"] if isinstance(m2m_conf, dict) else None
+
+
+def subscription(config):
+    """(subscribe_topic, qos) for a channel's MQTT-to-Meshtastic side, or None."""
+    topic = subscription_topic(config)
+    return (topic, config.get("qos", 0)) if topic else None
+
+
+ConfigDiff = collections.namedtuple('ConfigDiff', ['added', 'removed', 'reconnect', 'resubscribe', 'updated'])
+
+
+def diff_configs(old_configs, new_configs):
+    """
+    Classifies channel changes between two validated configs: channels whose
+    broker session (connection_key) changed must reconnect, subscription changes
+    are applied on the live session, and all other edits take effect in place.
+    """
+    added = [c for c in new_configs if c not in old_configs]
+    removed = [c for c in old_configs if c not in new_configs]
+    reconnect, resubscribe, updated = [], [], []
+    for channel_id_str, new_config in new_configs.items():
+        old_config = old_configs.get(channel_id_str)
+        if old_config is None or old_config == new_config:
+            continue
+        if connection_key(old_config) != connection_key(new_config):
+            reconnect.append(channel_id_str)
+        elif subscription(old_config) != subscription(new_config):
+            resubscribe.append(channel_id_str)
+        else:
+            updated.append(channel_id_str)
+    return ConfigDiff(added, removed, reconnect, resubscribe, updated)
+
+
+class BrokerHealth:
+    """
+    Connection state of one broker session, driven by MQTTConnectionPool's
+    supervisor. Failed attempts back off exponentially with jitter; after
+    failure_threshold consecutive failures the circuit opens and the broker is
+    left alone for open_s, then probed with a single attempt.
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.state = "connecting" # connecting, connected, backoff, open or closed
+        self.failures = 0 # Consecutive failed attempts
+        self.last_error = None
+        self.next_attempt = 0.0 # time.monotonic() of the next attempt while in backoff or open
+        self.attempt_started = None # Set while an attempt awaits its outcome; None before the first one
+        self.attempting = False # An attempt thread is still inside connect
+        self.connected_since = None # time.time() of the current connection
+
+    def due(self, now):
+        if self.state == "connecting":
+            return self.attempt_started is None
+        return self.state in ("backoff", "open") and now >= self.next_attempt
+
+    def begin(self, now):
+        self.state = "connecting"
+        self.attempt_started = now
+        self.attempting = True
+
+    def connected(self):
+        self.state = "connected"
+        self.failures = 0
+        self.last_error = None
+        self.attempt_started = None
+        self.connected_since = time.time()
+
+    def failed(self, error, now, reconnect_conf):
+        """Records a failed attempt or lost connection; returns seconds until the next attempt."""
+        self.failures += 1
+        self.last_error = error
+        self.attempt_started = None
+        self.connected_since = None
+        if self.failures >= reconnect_conf["failure_threshold"]:
+            self.state = "open"
+            delay = reconnect_conf["open_s"]
+        else:
+            self.state = "backoff"
+            delay = min(reconnect_conf["max_delay_s"], reconnect_conf["min_delay_s"] * 2 ** (self.failures - 1))
+            delay *= 1 - reconnect_conf["jitter"] * random.random() # Gateways that lost the same broker do not retry in lockstep
+        self.next_attempt = now + delay
+        return delay
+
+    def snapshot(self, now):
+        return {"broker": f"{self.host}:{self.port}", "state": self.state, "failures": self.failures,
+                "last_error": self.last_error,
+                "retry_in_s": round(max(0.0, self.next_attempt - now), 1) if self.state in ("backoff", "open") else None,
+                "connected_for_s": round(time.time() - self.connected_since, 1) if self.state == "connected" else None}
+
+
+class _BrokerSession:
+    """One paho client shared by every channel attached to it."""
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.health = BrokerHealth(key[0], key[1])
+        self.channels = {} # channel_id_str -> (on_connect, on_disconnect) callbacks
+        self.message_routes = {} # subscribe_topic -> {channel_id_str: on_message}
+
+
+class AsyncioEngine:
+    """
+    Single asyncio event loop (bridge.engine "asyncio") that replaces the
+    per-session paho network threads and the per-channel worker threads. Paho
+    clients run in its external-loop mode: their sockets are registered with the
+    loop's add_reader/add_writer, and a periodic tick handles keepalives.
+    Connecting stays with MQTTConnectionPool's supervisor. Outbound queues and
+    the transmit scheduler are given `loop` and schedule their work on it.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._clients = set() # Clients needing keepalives; loop thread only
+        self._sockets = {} # Open socket -> its client, including clients being stopped; loop thread only
+        self._thread = threading.Thread(target=self._run, name="amcb-asyncio", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._tick)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _call(self, callback, *args):
+        """Runs callback on the loop: directly when already there, else via call_soon_threadsafe."""
+        if threading.current_thread() is self._thread:
+            callback(*args)
+        elif not self.loop.is_closed(): # A client garbage-collected after stop() closes its socket itself
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def add_client(self, client):
+        """Hands client's network I/O to the loop. Whoever connects it (on any thread) then never blocks the loop."""
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_register_write
+        client.on_socket_unregister_write = self._on_unregister_write
+        self._call(self._clients.add, client)
+
+    def stop_client(self, client):
+        """Disconnects client; the DISCONNECT is written by the loop."""
+        self._call(self._clients.discard, client)
+        client.disconnect()
+
+    def stop(self, timeout=2.0):
+        self._call(self._shutdown)
+        self._thread.join(timeout)
+
+    def _shutdown(self):
+        for client in list(self._sockets.values()):
+            try:
+                client.loop_write() # Flush DISCONNECTs and final publishes the writer has not sent yet
+            except Exception: pass
+        self._clients.clear()
+        self.loop.stop()
+
+    # Paho socket callbacks. They run on whichever thread touched the client. Paho
+    # closes the socket right after on_socket_close, so the reader is removed
+    # synchronously when that happens on the loop (a reused fd must not stay registered).
+    def _on_socket_open(self, client, userdata, sock):
+        self._call(self._attach, client, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call(self._detach, sock)
+
+    def _on_register_write(self, client, userdata, sock):
+        self._call(self._watch_write, client, sock)
+
+    def _on_unregister_write(self, client, userdata, sock):
+        self._call(self._unwatch_write, sock)
+
+    def _attach(self, client, sock):
+        self._sockets[sock] = client
+        self.loop.add_reader(sock, self._read, client, sock)
+
+    def _detach(self, sock):
+        self._sockets.pop(sock, None)
+        self._unwatch_write(sock)
+        try:
+            self.loop.remove_reader(sock)
+        except (ValueError, OSError): pass # Already closed
+
+    def _watch_write(self, client, sock):
+        if client.socket() is sock: # Not a socket closed since the callback was queued
+            self.loop.add_writer(sock, client.loop_write)
+
+    def _unwatch_write(self, sock):
+        try:
+            self.loop.remove_writer(sock)
+        except (ValueError, OSError): pass
+
+    def _read(self, client, sock):
+        client.loop_read()
+        if client.socket() is sock and getattr(sock, 'pending', lambda: 0)():
+            self.loop.call_soon(self._read, client, sock) # Decrypted TLS data already buffered is invisible to the selector
+
+    def _tick(self):
+        """Keepalive pings (and detection of a silent broker) every ENGINE_MISC_INTERVAL_S."""
+        for client in list(self._clients):
+            try:
+                client.loop_misc()
+            except Exception as e:
+                logger.error(f"MQTT keepalive handling failed: {e}", exc_info=True)
+        self.loop.call_later(ENGINE_MISC_INTERVAL_S, self._tick)
+
+
+class MQTTConnectionPool:
+    """
+    Shares MQTT clients between channels that target the same broker session
+    (see connection_key), so N channels on one broker use one socket and one
+    network loop thread. Connect/disconnect events are fanned out to every
+    attached channel; inbound messages are routed per channel by topic filter.
+    With an AsyncioEngine, sessions run on its event loop instead of a thread each.
+
+    acquire() never blocks on the network. A supervisor thread connects new
+    sessions, each attempt on its own short-lived thread so brokers connect in
+    parallel, and reconnects dropped ones following their BrokerHealth. Clients
+    are built with paho's own reconnect loop disabled.
+    """
+
+    def __init__(self, client_factory, engine=None):
+        self.client_factory = client_factory # client_factory(channel_id_str, config) -> unconnected paho client, reconnect_on_failure off
+        self.engine = engine
+        self.reconnect_conf = dict(DEFAULT_RECONNECT_CONFIG)
+        self._sessions = {} # connection_key -> _BrokerSession
+        self._channel_keys = {} # channel_id_str -> connection_key
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock) # Wakes the supervisor
+        self._supervisor = None
+        self._supervising = False
+
+    def acquire(self, channel_id_str, config, on_connect, on_disconnect, on_message=None):
+        """Attaches a channel to the session for its broker, creating it if needed. The supervisor connects new sessions."""
+        key = connection_key(config)
+        with self._cond:
+            session = self._sessions.get(key)
+            created = session is None
+            if created:
+                client = self.client_factory(channel_id_str, config)
+                session = _BrokerSession(key, client)
+                client.on_connect = self._fan_out_connect(session)
+                client.on_disconnect = self._fan_out_disconnect(session)
+                client.on_message = self._on_unrouted_message
+                if self.engine is not None:
+                    self.engine.add_client(client)
+                if hasattr(type(client), 'connect_timeout'): # paho >= 2.0; only settable before connecting
+                    client.connect_timeout = self.reconnect_conf["connect_timeout_s"]
+                client.connect_async(config["host"], config["port"], keepalive=60) # Only records the broker
+                self._sessions[key] = session
+                self._start_supervisor()
+                self._cond.notify_all()
+            session.channels[channel_id_str] = (on_connect, on_disconnect)
+            self._channel_keys[channel_id_str] = key
+            if on_message is not None and "mqtt_to_meshtastic" in config:
+                self._add_message_route(session, config["mqtt_to_meshtastic"]["subscribe_topic"], channel_id_str, on_message)
+
+        if created:
+            logger.info(f"Connecting to MQTT for channel '{channel_id_str}': {config['host']}:{config['port']}")
+        else:
+            logger.info(f"Channel '{channel_id_str}' sharing existing MQTT session to {config['host']}:{config['port']}")
+            if session.client.is_connected(): # Late joiner: run its connect handling (subscribe, online status) now
+                on_connect(session.client, None, {}, 0)
+        return session.client
+
+    def release(self, channel_id_str, subscribe_topic=None):
+        """Detaches a channel; the session is closed once no channel uses it."""
+        with self._lock:
+            key = self._channel_keys.pop(channel_id_str, None)
+            session = self._sessions.get(key)
+            if session is None:
+                return
+            session.channels.pop(channel_id_str, None)
+            self._remove_message_route(session, subscribe_topic, channel_id_str)
+            if session.channels:
+                return
+            del self._sessions[key]
+            session.health.state = "closed"
+        self._close_client(session.client)
+
+    def resubscribe(self, channel_id_str, old_topic, new_topic, qos, on_message):
+        """Moves a channel's MQTT-to-Meshtastic subscription on its live session, without reconnecting."""
+        with self._lock:
+            session = self._sessions.get(self._channel_keys.get(channel_id_str))
+            if session is None:
+                return
+            self._remove_message_route(session, old_topic, channel_id_str)
+            if new_topic:
+                self._add_message_route(session, new_topic, channel_id_str, on_message)
+        if new_topic and session.client.is_connected():
+            session.client.subscribe(new_topic, qos=qos)
+            logger.info(f"Channel '{channel_id_str}': Subscribed to MQTT topic '{new_topic}' (QoS {qos}) for MQTT-to-Meshtastic.")
+
+    def _add_message_route(self, session, subscribe_topic, channel_id_str, on_message):
+        """Caller holds _lock."""
+        if subscribe_topic not in session.message_routes:
+            session.message_routes[subscribe_topic] = {}
+            session.client.message_callback_add(subscribe_topic, self._route_message(session, subscribe_topic))
+        session.message_routes[subscribe_topic][channel_id_str] = on_message
+
+    def _remove_message_route(self, session, subscribe_topic, channel_id_str):
+        """Caller holds _lock. Unsubscribes once no channel on the session uses the topic filter."""
+        routes = session.message_routes.get(subscribe_topic) if subscribe_topic else None
+        if routes is None:
+            return
+        routes.pop(channel_id_str, None)
+        if not routes: # Last channel on this topic filter
+            del session.message_routes[subscribe_topic]
+            try:
+                session.client.message_callback_remove(subscribe_topic)
+                session.client.unsubscribe(subscribe_topic)
+            except Exception: pass
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def health(self):
+        """Per-channel connection health: the BrokerHealth snapshot of the channel's session."""
+        now = time.monotonic()
+        with self._lock:
+            return {channel_id_str: self._sessions[key].health.snapshot(now)
+                    for channel_id_str, key in self._channel_keys.items() if key in self._sessions}
+
+    def close_all(self):
+        with self._cond:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._channel_keys.clear()
+            for session in sessions:
+                session.health.state = "closed"
+            self._supervising = False
+            self._cond.notify_all()
+            supervisor, self._supervisor = self._supervisor, None
+        if supervisor is not None:
+            supervisor.join(2.0)
+        for session in sessions:
+            self._close_client(session.client)
+
+    def _start_supervisor(self):
+        """Caller holds _lock."""
+        if self._supervisor is None:
+            self._supervising = True
+            self._supervisor = threading.Thread(target=self._supervise, name="amcb-mqtt-supervisor", daemon=True)
+            self._supervisor.start()
+
+    def _supervise(self):
+        """Starts due connection attempts in parallel and fails attempts whose CONNACK never arrives."""
+        while True:
+            attempts, stalled = [], []
+            with self._cond:
+                if not self._supervising:
+                    return
+                now = time.monotonic()
+                wait = SUPERVISOR_INTERVAL_S
+                for session in self._sessions.values():
+                    health = session.health
+                    if health.due(now):
+                        health.begin(now)
+                        attempts.append(session)
+                    elif (health.state == "connecting" and not health.attempting
+                          and now - health.attempt_started > self.reconnect_conf["connect_timeout_s"]):
+                        delay = health.failed(f"no CONNACK within {self.reconnect_conf['connect_timeout_s']}s", now, self.reconnect_conf)
+                        stalled.append((session, delay))
+                    elif health.state in ("backoff", "open"):
+                        wait = min(wait, health.next_attempt - now)
+            for session in attempts:
+                threading.Thread(target=self._attempt, args=(session,), daemon=True,
+                                 name=f"amcb-connect-{session.health.host}:{session.health.port}").start()
+            for session, delay in stalled:
+                self._log_failure(session.health, delay)
+                try:
+                    session.client.disconnect() # Abandon the half-open connection; the next attempt starts clean
+                except Exception: pass
+            with self._cond:
+                if self._supervising:
+                    self._cond.wait(max(wait, 0.01))
+
+    def _attempt(self, session):
+        """Runs on its own thread: paho's connect blocks on DNS, TCP and TLS. The outcome arrives as CONNACK."""
+        client, health = session.client, session.health
+        error = None
+        try:
+            if self.engine is None:
+                client.loop_stop() # Joins the previous connection's network thread if it is still exiting
+            client.reconnect()
+            if self.engine is None:
+                client.loop_start()
+        except Exception as e:
+            error = e
+        delay = None
+        with self._cond:
+            health.attempting = False
+            if error is not None and health.state == "connecting":
+                delay = health.failed(str(error) or type(error).__name__, time.monotonic(), self.reconnect_conf)
+            closed = health.state == "closed"
+            self._cond.notify_all()
+        if closed:
+            self._close_client(client) # Released while connecting
+        elif delay is not None:
+            self._log_failure(health, delay)
+
+    @staticmethod
+    def _log_failure(health, delay):
+        if health.state == "open":
+            logger.error(f"MQTT broker {health.host}:{health.port} failed {health.failures} times in a row ({health.last_error}). "
+                         f"Circuit open; next attempt in {delay:.0f}s.")
+        else:
+            logger.warning(f"MQTT connection to {health.host}:{health.port} failed: {health.last_error}. Retrying in {delay:.1f}s.")
+
+    def _close_client(self, client):
+        try:
+            if self.engine is not None:
+                self.engine.stop_client(client)
+            else:
+                client.loop_stop()
+                client.disconnect()
+        except Exception as e:
+            logger.error(f"Error disconnecting pooled MQTT client: {e}", exc_info=True)
+
+    def _fan_out_connect(self, session):
+        def on_connect_callback(client, userdata, flags, rc, properties=None):
+            delay = None
+            with self._cond:
+                if session.health.state == "closed":
+                    pass
+                elif rc == 0:
+                    session.health.connected()
+                else:
+                    delay = session.health.failed(f"connection refused ({rc})", time.monotonic(), self.reconnect_conf)
+                self._cond.notify_all()
+                callbacks = [cbs[0] for cbs in session.channels.values()]
+            if delay is not None:
+                self._log_failure(session.health, delay)
+            for callback in callbacks:
+                callback(client, userdata, flags, rc, properties)
+        return on_connect_callback
+
+    def _fan_out_disconnect(self, session):
+        def on_disconnect_callback(client, userdata, rc, properties=None):
+            with self._cond:
+                if rc != 0 and session.health.state in ("connected", "connecting"):
+                    session.health.failed(f"connection lost ({rc})", time.monotonic(), self.reconnect_conf)
+                    self._cond.notify_all()
+                callbacks = [cbs[1] for cbs in session.channels.values()]
+            for callback in callbacks:
+                callback(client, userdata, rc, properties)
+        return on_disconnect_callback
+
+    def _route_message(self, session, subscribe_topic):
+        def on_message_callback(client, userdata, msg):
+            with self._lock:
+                callbacks = list(session.message_routes.get(subscribe_topic, {}).values())
+            for callback in callbacks:
+                callback(client, userdata, msg)
+        return on_message_callback
+
+    @staticmethod
+    def _on_unrouted_message(client, userdata, msg):
+        logger.debug(f"MQTT message on topic '{msg.topic}' matched no bridge subscription. Ignoring.")
+
+
+class Counter:
+    """Monotonic counter with optional labels; label values are passed positionally to inc()."""
+    metric_type = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {"/".join(labels) or "total": value for labels, value in self._values.items()}
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) with optional labels."""
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._values = {} # label_values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, series in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", labels + (f"{bound:g}",), cumulative))
+                samples.append((self.name + "_bucket", labels + ("+Inf",), series[-1]))
+                samples.append((self.name + "_sum", labels, series[-2]))
+                samples.append((self.name + "_count", labels, series[-1]))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return {"/".join(labels) or "total": {"count": series[-1], "sum": round(series[-2], 6)}
+                    for labels, series in self._values.items()}
+
+
+class Gauge:
+    """
+    Metric whose samples are read from a callback returning {label_values: value}
+    at scrape time. metric_type may be "counter" for totals owned by other objects.
+    """
+
+    def __init__(self, name, help_text, label_names, callback, metric_type="gauge"):
+        self.metric_type = metric_type
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.callback = callback
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in self.callback().items()]
+
+    def snapshot(self):
+        return {"/".join(labels) or "total": value for labels, value in self.callback().items()}
+
+
+class MetricsRegistry:
+    """In-process metrics, rendered in Prometheus text format or as a JSON-friendly snapshot."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name, help_text, label_names, callback, metric_type="gauge"):
+        return self.register(Gauge(name, help_text, label_names, callback, metric_type))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            label_names = metric.label_names + (("le",) if metric.metric_type == "histogram" else ())
+            for sample_name, label_values, value in metric.samples():
+                labels = ",".join(f'{name}="{val}"' for name, val in zip(label_names, label_values))
+                lines.append(f"{sample_name}{{{labels}}} {value}" if labels else f"{sample_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+
+def start_metrics_server(registry, host, port, health=None):
+    """
+    Serves registry.render_prometheus() at /metrics on a daemon thread; returns the server for shutdown().
+    With health (a callable returning per-channel health dicts), /health serves it as JSON: 200 when every
+    channel is connected, else 503.
+    """
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/health' and health is not None:
+                channels = health()
+                status = 200 if all(h["state"] == "connected" for h in channels.values()) else 503
+                body = json.dumps({"channels": channels}).encode('utf-8')
+                content_type = 'application/json'
+            elif path == '/metrics':
+                status = 200
+                body = registry.render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # Keep scrapes out of the plugin log
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="amcb-metrics-http", daemon=True).start()
+    return server
+
 
 class AMCBPlugin(meshtastic.plugin.Plugin):
     """
@@ -30,9 +2159,36 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
 
     def __init__(self):
         super().__init__()
-        self.mqtt_clients = {}
+        self.mqtt_clients = {} # channel_id_str -> paho client (shared between channels on the same broker session)
         self.mqtt_configs = {}
+        self.outbound_queues = {} # channel_id_str -> OutboundQueue
+        self.publish_batchers = {} # channel_id_str -> PublishBatcher, driven by that channel's outbound worker
+        self.spools = {} # channel_id_str -> PacketSpool for channels with store-and-forward enabled
+        self.packet_filters = {} # channel_id_str -> (accept, projection) compiled by load_config; either may be None
+        self._topic_renderers = {} # (topic template, channel_id_str, gateway_id) -> compiled renderer or None
+        self.routes = () # Route table indexed by channel index; replaced wholesale, read without the lock
         self.config_lock = threading.Lock()
+        self.mqtt_pool = MQTTConnectionPool(self._create_mqtt_client)
+        self.engine = None # AsyncioEngine when bridge.engine is "asyncio"; chosen on the first load
+        self.bridge_config = {} # Plugin-wide settings from the reserved "bridge" key
+        self.message_log_level = logging.INFO # Per-message log level; DEBUG in low_overhead mode
+        self.metrics = MetricsRegistry()
+        self._register_metrics()
+        self.metrics_server = None
+        self._stats_stop_event = None
+        self._stats_settings = None
+        self._watch_stop_event = None
+        self._watch_settings = None
+        self._config_signature = None # (mtime_ns, size) of the config file as last read
+        self.dedup_cache = None # PacketDedupCache unless bridge.dedup is disabled
+        self.mesh_echoes = None # Fingerprints of packets we sent to the mesh, so they are not bridged back (loop prevention)
+        self.mqtt_echoes = None # Fingerprints of (topic, payload) we published that our own subscriptions may match
+        self._may_echo = None # topic -> True if one of our MQTT-to-Meshtastic subscriptions matches it
+        self.reassemblers = {} # channel_id_str -> FragmentReassembler for channels with reassemble enabled
+        self._fragment_ids = itertools.count(int.from_bytes(os.urandom(2), "big")) # Message ids for binary fragments; masked to 16 bits
+        self._claim_settings = None # (claim topic, claim channel, wait seconds) in shared dedup mode
+        self._claim_subscription = None # (client, topic filter) currently receiving other gateways' claims
+        self.tx_scheduler = TransmitScheduler(wait_histogram=self.metric_tx_wait)
         self.lora_config = None
         self.running = True
         self.mesh_interface = None # To store the Meshtastic radio interface for sending
@@ -42,26 +2198,84 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
         if not os.path.exists(self.config_file_path):
             self.config_file_path = os.path.join(os.getcwd(), CONFIG_FILENAME)
 
-    def load_config(self):
+    def _register_metrics(self):
+        m = self.metrics
+        self.metric_received = m.counter("amcb_packets_received_total", "Meshtastic packets seen by onReceive.")
+        self.metric_filtered = m.counter("amcb_packets_filtered_total", "Packets not bridged to MQTT, by reason.", ("reason",))
+        self.metric_serialized = m.counter("amcb_packets_serialized_total", "Packets serialized for MQTT.", ("channel",))
+        self.metric_serialize_time = m.histogram("amcb_serialization_seconds", "Time spent serializing one packet.", ("channel",))
+        self.metric_published = m.counter("amcb_messages_published_total", "Mesh packets handed to the MQTT client (batched packets count individually).", ("channel",))
+        self.metric_publish_failures = m.counter("amcb_publish_failures_total", "Packets that could not be serialized or published.", ("channel",))
+        self.metric_latency = m.histogram("amcb_mesh_to_broker_latency_seconds", "Time from onReceive to the MQTT publish call.", ("channel",))
+        self.metric_reconnects = m.counter("amcb_mqtt_reconnects_total", "Unexpected MQTT disconnects, each followed by a reconnect attempt.", ("channel",))
+        self.metric_mqtt_received = m.counter("amcb_mqtt_messages_received_total", "MQTT messages received for forwarding to Meshtastic.", ("channel",))
+        self.metric_mqtt_echoes = m.counter("amcb_mqtt_echoes_suppressed_total", "MQTT messages not sent to Meshtastic because this bridge published them.", ("channel",))
+        self.metric_tx_wait = m.histogram("amcb_tx_queue_wait_seconds", "Time MQTT-to-Meshtastic messages waited in the transmit scheduler.", ("channel",))
+
+        def queue_stat(key):
+            return lambda: {(channel_id_str,): stats[key] for channel_id_str, stats in self.get_queue_stats().items()}
+        m.gauge("amcb_outbound_queue_depth", "Packets waiting in each channel's outbound queue.", ("channel",), queue_stat("depth"))
+        m.gauge("amcb_outbound_dropped_total", "Packets dropped by outbound queue overflow.", ("channel",), queue_stat("dropped"), metric_type="counter")
+
+        def spool_stat(key):
+            return lambda: {(channel_id_str,): spool.stats()[key] for channel_id_str, spool in list(self.spools.items())}
+        m.gauge("amcb_spool_pending_bytes", "Bytes waiting in each channel's store-and-forward spool.", ("channel",), spool_stat("pending_bytes"))
+        m.gauge("amcb_spooled_total", "Messages written to the spool while MQTT was unavailable.", ("channel",), spool_stat("spooled"), metric_type="counter")
+        m.gauge("amcb_spool_replayed_total", "Spooled messages replayed to MQTT.", ("channel",), spool_stat("replayed"), metric_type="counter")
+        m.gauge("amcb_spool_evicted_bytes_total", "Spooled bytes discarded by the size cap or age limit.", ("channel",), spool_stat("evicted_bytes"), metric_type="counter")
+
+        def dedup_stat(key):
+            return lambda: {(): self.dedup_cache.stats()[key]} if self.dedup_cache is not None else {}
+        m.gauge("amcb_dedup_cache_entries", "Packet keys remembered by the deduplication cache.", (), dedup_stat("entries"))
+
+        def health_stat(value):
+            return lambda: {(channel_id_str,): value(health) for channel_id_str, health in self.get_health().items()}
+        m.gauge("amcb_mqtt_connected", "1 if the channel's MQTT session is connected.", ("channel",), health_stat(lambda h: int(h["state"] == "connected")))
+        m.gauge("amcb_mqtt_circuit_open", "1 while the channel's broker is skipped after repeated connection failures.", ("channel",),
+                health_stat(lambda h: int(h["state"] == "open")))
+        m.gauge("amcb_mqtt_consecutive_failures", "Failed connection attempts since the channel's session was last connected.", ("channel",),
+                health_stat(lambda h: h["failures"]))
+
+        def tx_stat(key):
+            return lambda: {(): self.tx_scheduler.stats()[key]}
+        m.gauge("amcb_tx_queue_depth", "Messages waiting in the transmit scheduler.", (), tx_stat("queued"))
+        m.gauge("amcb_tx_sent_total", "Messages sent to Meshtastic by the transmit scheduler.", (), tx_stat("sent"), metric_type="counter")
+        m.gauge("amcb_tx_deduplicated_total", "MQTT messages dropped as duplicates before transmission.", (), tx_stat("deduplicated"), metric_type="counter")
+        m.gauge("amcb_tx_airtime_seconds_total", "Estimated LoRa airtime used by transmissions.", (), tx_stat("airtime_s"), metric_type="counter")
+
+    def load_config(self, keep_current_on_error=False):
+        """
+        Loads mqtt_config.json and applies it incrementally: only channels whose
+        connection settings changed lose their MQTT session; subscription changes
+        are applied on the live session and everything else takes effect in place.
+        With keep_current_on_error (used by hot reload), an unreadable or invalid
+        file leaves the running configuration untouched instead of clearing it.
+        """
         with self.config_lock:
             try:
                 logger.info(f"Attempting to load MQTT configuration from: {self.config_file_path}")
                 if not os.path.exists(self.config_file_path):
                     logger.error(f"Configuration file {self.config_file_path} not found.")
-                    self.mqtt_configs = {}
+                    if not keep_current_on_error:
+                        self._apply_config_diff({})
                     return False
 
+                self._config_signature = self._config_file_signature()
                 with open(self.config_file_path, 'r') as f:
                     loaded_json = json.load(f)
 
                 if not isinstance(loaded_json, dict):
                     logger.error("MQTT config root must be a JSON object.")
-                    self.mqtt_configs = {}
+                    if not keep_current_on_error:
+                        self._apply_config_diff({})
                     return False
 
                 valid_configs = {}
+                packet_filters = {}
+                bridge_config = self._parse_bridge_config(loaded_json.get("bridge", {}))
                 for channel_id_str, settings in loaded_json.items():
                     if channel_id_str.startswith("//"): continue # Allow comments
+                    if channel_id_str == "bridge": continue # Plugin-wide settings, parsed above
 
                     # Basic validation
                     if not all(k in settings for k in ["host", "port", "topic"]):
@@ -74,18 +2288,96 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
                     except ValueError:
                         logger.warning(f"Skipping channel '{channel_id_str}': Channel ID must be a string representing an integer.")
                         continue
+
+                    # Validate topic template placeholders
+                    try:
+                        topic_template_fields(settings["topic"])
+                    except (ValueError, TypeError, AttributeError) as e:
+                        logger.warning(f"Skipping channel '{channel_id_str}': Invalid topic '{settings['topic']}': {e}")
+                        continue
                     
                     # Validate payload_type
                     settings['payload_type'] = settings.get('payload_type', 'full_packet')
-                    if settings['payload_type'] not in ['full_packet', 'decoded_only', 'text_payload_only']:
+                    if settings['payload_type'] not in PAYLOAD_TYPES:
                         logger.warning(f"Channel '{channel_id_str}': Invalid payload_type '{settings['payload_type']}'. Defaulting to 'full_packet'.")
                         settings['payload_type'] = 'full_packet'
+                    elif settings['payload_type'] in PAYLOAD_TYPE_REQUIREMENTS:
+                        module_getter, package_name = PAYLOAD_TYPE_REQUIREMENTS[settings['payload_type']]
+                        if module_getter() is None:
+                            logger.warning(f"Channel '{channel_id_str}': payload_type '{settings['payload_type']}' requires '{package_name}', which is not installed. Defaulting to 'full_packet'.")
+                            settings['payload_type'] = 'full_packet'
 
                     # Validate TLS settings (basic existence check)
                     if "tls" in settings and not isinstance(settings["tls"], dict):
                         logger.warning(f"Channel '{channel_id_str}': TLS config must be an object. Disabling TLS for this channel.")
                         del settings["tls"]
                     
+                    # Validate MQTT protocol version
+                    settings["protocol"] = str(settings.get("protocol", "3.1.1"))
+                    if settings["protocol"] not in MQTT_PROTOCOLS:
+                        logger.warning(f"Channel '{channel_id_str}': Invalid protocol '{settings['protocol']}'. Defaulting to '3.1.1'.")
+                        settings["protocol"] = "3.1.1"
+                    elif settings["protocol"] == "5" and Properties is None:
+                        logger.warning(f"Channel '{channel_id_str}': MQTT 5 needs paho-mqtt >= 1.5. Defaulting to '3.1.1'.")
+                        settings["protocol"] = "3.1.1"
+
+                    # Validate outbound queue settings
+                    queue_conf = dict(DEFAULT_QUEUE_CONFIG)
+                    if "queue" in settings:
+                        if isinstance(settings["queue"], dict):
+                            queue_conf.update(settings["queue"])
+                        else:
+                            logger.warning(f"Channel '{channel_id_str}': 'queue' config must be an object. Using defaults.")
+                    if not isinstance(queue_conf["max_depth"], int) or queue_conf["max_depth"] < 1:
+                        logger.warning(f"Channel '{channel_id_str}': Invalid queue max_depth '{queue_conf['max_depth']}'. Defaulting to {DEFAULT_QUEUE_CONFIG['max_depth']}.")
+                        queue_conf["max_depth"] = DEFAULT_QUEUE_CONFIG["max_depth"]
+                    if queue_conf["overflow"] not in OVERFLOW_POLICIES:
+                        logger.warning(f"Channel '{channel_id_str}': Invalid queue overflow policy '{queue_conf['overflow']}'. Defaulting to '{DEFAULT_QUEUE_CONFIG['overflow']}'.")
+                        queue_conf["overflow"] = DEFAULT_QUEUE_CONFIG["overflow"]
+                    if not isinstance(queue_conf["block_timeout_ms"], (int, float)) or queue_conf["block_timeout_ms"] < 0:
+                        logger.warning(f"Channel '{channel_id_str}': Invalid queue block_timeout_ms. Defaulting to {DEFAULT_QUEUE_CONFIG['block_timeout_ms']}.")
+                        queue_conf["block_timeout_ms"] = DEFAULT_QUEUE_CONFIG["block_timeout_ms"]
+                    settings["queue"] = queue_conf
+
+                    # Validate batch settings
+                    if "batch" in settings:
+                        batch_conf = dict(DEFAULT_BATCH_CONFIG)
+                        if not isinstance(settings["batch"], dict):
+                            logger.warning(f"Channel '{channel_id_str}': 'batch' config must be an object. Disabling batching for this channel.")
+                            del settings["batch"]
+                        elif settings["payload_type"] not in BATCH_JOINERS:
+                            logger.warning(f"Channel '{channel_id_str}': payload_type '{settings['payload_type']}' cannot be batched. Disabling batching for this channel.")
+                            del settings["batch"]
+                        else:
+                            batch_conf.update(settings["batch"])
+                            for key, default in DEFAULT_BATCH_CONFIG.items():
+                                if not isinstance(batch_conf[key], (int, float)) or batch_conf[key] <= 0:
+                                    logger.warning(f"Channel '{channel_id_str}': Invalid batch {key} '{batch_conf[key]}'. Defaulting to {default}.")
+                                    batch_conf[key] = default
+                            settings["batch"] = batch_conf
+
+                    # Validate spool (store-and-forward) settings
+                    if "spool" in settings:
+                        spool_conf = dict(DEFAULT_SPOOL_CONFIG)
+                        if not isinstance(settings["spool"], dict):
+                            logger.warning(f"Channel '{channel_id_str}': 'spool' config must be an object. Disabling spooling for this channel.")
+                            del settings["spool"]
+                        else:
+                            spool_conf.update(settings["spool"])
+                            for key in ("max_bytes", "max_age_s", "segment_bytes", "replay_rate"):
+                                if not isinstance(spool_conf[key], (int, float)) or spool_conf[key] <= 0:
+                                    logger.warning(f"Channel '{channel_id_str}': Invalid spool {key} '{spool_conf[key]}'. Defaulting to {DEFAULT_SPOOL_CONFIG[key]}.")
+                                    spool_conf[key] = DEFAULT_SPOOL_CONFIG[key]
+                            # The segment being written is never evicted, so max_bytes only holds if several segments fit
+                            if spool_conf["segment_bytes"] > spool_conf["max_bytes"] // 4:
+                                segment_bytes = max(int(spool_conf["max_bytes"] // 4), 1)
+                                logger.warning(f"Channel '{channel_id_str}': spool segment_bytes {spool_conf['segment_bytes']} is too large for max_bytes {spool_conf['max_bytes']}. Using {segment_bytes}.")
+                                spool_conf["segment_bytes"] = segment_bytes
+                            if not spool_conf["dir"]:
+                                spool_conf["dir"] = os.path.join(self.plugin_dir, SPOOL_DIRNAME)
+                            spool_conf["dir"] = os.path.join(spool_conf["dir"], f"channel-{channel_id_str}")
+                            settings["spool"] = spool_conf
+
                     # Validate Will settings
                     if "will" in settings and (not isinstance(settings["will"], dict) or "topic" not in settings["will"]):
                         logger.warning(f"Channel '{channel_id_str}': 'will' config is invalid. Disabling for this channel.")
@@ -101,92 +2393,621 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
                             # Default target_channel_index to the bridge's channel if not specified
                             if "target_channel_index" not in m2m_conf:
                                 m2m_conf["target_channel_index"] = int(channel_id_str)
+                            m2m_conf["format"] = m2m_conf.get("format", "text")
+                            if m2m_conf["format"] not in INBOUND_FORMATS:
+                                logger.warning(f"Channel '{channel_id_str}': Invalid mqtt_to_meshtastic format '{m2m_conf['format']}'. Defaulting to 'text'.")
+                                m2m_conf["format"] = "text"
+                            elif m2m_conf["format"] == "protobuf" and mqtt_pb2 is None:
+                                logger.warning(f"Channel '{channel_id_str}': mqtt_to_meshtastic format 'protobuf' requires meshtastic's mqtt_pb2. Defaulting to 'text'.")
+                                m2m_conf["format"] = "text"
+                            m2m_conf["fragment"] = bool(m2m_conf.get("fragment", False))
+                            m2m_conf["max_fragments"] = m2m_conf.get("max_fragments", DEFAULT_MAX_FRAGMENTS)
+                            if not isinstance(m2m_conf["max_fragments"], int) or not 1 <= m2m_conf["max_fragments"] <= 255:
+                                logger.warning(f"Channel '{channel_id_str}': Invalid mqtt_to_meshtastic max_fragments '{m2m_conf['max_fragments']}'. Defaulting to {DEFAULT_MAX_FRAGMENTS}.")
+                                m2m_conf["max_fragments"] = DEFAULT_MAX_FRAGMENTS
+                            # Transmit pacing defaults
+                            for key, default in DEFAULT_TX_CONFIG.items():
+                                value = m2m_conf.setdefault(key, default)
+                                if not isinstance(value, (int, float)) or isinstance(value, bool) or (value <= 0 and key != "priority"):
+                                    logger.warning(f"Channel '{channel_id_str}': Invalid mqtt_to_meshtastic {key} '{value}'. Defaulting to {default}.")
+                                    m2m_conf[key] = default
 
+                    # Validate packet filter and field projection, then compile them once here
+                    if "filter" in settings:
+                        filter_conf = settings["filter"]
+                        if not isinstance(filter_conf, dict):
+                            logger.warning(f"Channel '{channel_id_str}': 'filter' config must be an object. Disabling filtering for this channel.")
+                            del settings["filter"]
+                        else:
+                            normalized = {}
+                            for key, values in filter_conf.items():
+                                if key not in FILTER_KEYS:
+                                    logger.warning(f"Channel '{channel_id_str}': Unknown filter key '{key}'. Ignoring.")
+                                    continue
+                                if not isinstance(values, list):
+                                    logger.warning(f"Channel '{channel_id_str}': filter {key} must be a list. Ignoring.")
+                                    continue
+                                normalize = _portnum_name if key.endswith("portnums") else _node_num
+                                normalized[key] = []
+                                for value in values:
+                                    if normalize(value) is None:
+                                        logger.warning(f"Channel '{channel_id_str}': Invalid filter {key} entry '{value}'. Ignoring.")
+                                    else:
+                                        normalized[key].append(normalize(value))
+                            settings["filter"] = normalized
+                    if "fields" in settings:
+                        fields = settings["fields"]
+                        if not isinstance(fields, list) or not fields or not all(isinstance(f, str) and f.strip('.') for f in fields):
+                            logger.warning(f"Channel '{channel_id_str}': 'fields' must be a non-empty list of field paths. Sending whole packets.")
+                            del settings["fields"]
+                        elif settings["payload_type"] not in PROJECTABLE_PAYLOAD_TYPES:
+                            logger.warning(f"Channel '{channel_id_str}': 'fields' does not apply to payload_type '{settings['payload_type']}'. Ignoring.")
+                            del settings["fields"]
+                        elif settings["payload_type"] in DECODED_PAYLOAD_TYPES:
+                            outside = [f for f in fields if f.split('.')[0] != 'decoded']
+                            if outside:
+                                logger.warning(f"Channel '{channel_id_str}': payload_type '{settings['payload_type']}' publishes only 'decoded', so fields {outside} would always be empty. Ignoring them.")
+                                settings["fields"] = [f for f in fields if f not in outside]
+                            if not settings["fields"]:
+                                logger.warning(f"Channel '{channel_id_str}': no 'decoded.' fields left. Sending the whole decoded part.")
+                                del settings["fields"]
+                    packet_filters[channel_id_str] = (compile_packet_filter(settings.get("filter", {})),
+                                                      compile_projection(settings["fields"]) if "fields" in settings else None)
 
                     valid_configs[channel_id_str] = settings
                 
-                self.mqtt_configs = valid_configs
+                self.bridge_config = bridge_config
+                self.packet_filters = packet_filters
+                self._select_engine(bridge_config["engine"])
+                self._apply_config_diff(valid_configs)
+                self._apply_bridge_config()
                 logger.info(f"Successfully loaded {len(self.mqtt_configs)} MQTT configurations.")
                 return True
 
             except Exception as e:
                 logger.error(f"Error loading MQTT config: {e}", exc_info=True)
-                self.mqtt_configs = {}
+                if keep_current_on_error:
+                    logger.warning("Keeping the currently running MQTT configuration.")
+                else:
+                    self._apply_config_diff({})
+            return False
+
+    def _apply_config_diff(self, new_configs):
+        """
+        Switches to new_configs, tearing down only sessions that must change. Caller holds
+        config_lock. new_configs is installed as a whole and must not be mutated afterwards:
+        MQTT callbacks read self.mqtt_configs without the lock.
+        """
+        diff = diff_configs(self.mqtt_configs, new_configs)
+        for channel_id_str in diff.removed + diff.reconnect:
+            self.mqtt_clients.pop(channel_id_str, None) # connect_mqtt_clients re-acquires reconnected channels
+            self.mqtt_pool.release(channel_id_str, subscription_topic(self.mqtt_configs[channel_id_str]))
+        for channel_id_str in diff.resubscribe:
+            new_sub = subscription(new_configs[channel_id_str])
+            self.mqtt_pool.resubscribe(channel_id_str, subscription_topic(self.mqtt_configs[channel_id_str]),
+                                       new_sub[0] if new_sub else None, new_sub[1] if new_sub else 0,
+                                       self._on_message_from_mqtt(channel_id_str))
+        self.mqtt_configs = new_configs
+        self._sync_outbound_queues()
+        if any(diff):
+            logger.info(f"Config changes - added: {diff.added}, removed: {diff.removed}, reconnect: {diff.reconnect}, "
+                        f"resubscribe: {diff.resubscribe}, updated in place: {diff.updated}")
+        return diff
+
+    def reload_config(self):
+        """Hot reload: applies the current file incrementally and connects any new or rebuilt channels."""
+        if self.load_config(keep_current_on_error=True):
+            self.connect_mqtt_clients()
+            return True
+        return False
+
+    def _config_file_signature(self):
+        try:
+            stat = os.stat(self.config_file_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _watch_config_loop(self, stop_event, interval):
+        """Polls the config file's mtime/size and hot-reloads it when it changes."""
+        while not stop_event.wait(interval):
+            if self._config_file_signature() == self._config_signature:
+                continue
+            logger.info(f"Configuration file {self.config_file_path} changed. Reloading.")
+            try:
+                self.reload_config()
+            except Exception as e:
+                logger.error(f"Hot reload failed: {e}", exc_info=True)
+
+    def _parse_bridge_config(self, settings):
+        """Validates the reserved "bridge" object holding plugin-wide (not per-channel) settings."""
+        if not isinstance(settings, dict):
+            logger.warning("'bridge' config must be an object. Using defaults.")
+            settings = {}
+        bridge_config = {"engine": settings.get("engine", "threads"),
+                         "json_encoder": settings.get("json_encoder", "auto"),
+                         "low_overhead": bool(settings.get("low_overhead", False)),
+                         "watch_config": bool(settings.get("watch_config", False)),
+                         "watch_interval_s": settings.get("watch_interval_s", DEFAULT_WATCH_INTERVAL_S)}
+        if not isinstance(bridge_config["watch_interval_s"], (int, float)) or bridge_config["watch_interval_s"] <= 0:
+            logger.warning(f"Invalid bridge watch_interval_s. Defaulting to {DEFAULT_WATCH_INTERVAL_S}.")
+            bridge_config["watch_interval_s"] = DEFAULT_WATCH_INTERVAL_S
+
+        reconnect_conf = dict(DEFAULT_RECONNECT_CONFIG)
+        if isinstance(settings.get("reconnect"), dict):
+            reconnect_conf.update(settings["reconnect"])
+        elif "reconnect" in settings:
+            logger.warning("'bridge.reconnect' config must be an object. Using defaults.")
+        for key in ("min_delay_s", "max_delay_s", "failure_threshold", "open_s", "connect_timeout_s"):
+            if not isinstance(reconnect_conf[key], (int, float)) or reconnect_conf[key] <= 0:
+                logger.warning(f"Invalid bridge.reconnect {key} '{reconnect_conf[key]}'. Defaulting to {DEFAULT_RECONNECT_CONFIG[key]}.")
+                reconnect_conf[key] = DEFAULT_RECONNECT_CONFIG[key]
+        if not isinstance(reconnect_conf["jitter"], (int, float)) or not 0 <= reconnect_conf["jitter"] <= 1:
+            logger.warning(f"Invalid bridge.reconnect jitter '{reconnect_conf['jitter']}'. Must be between 0 and 1. Defaulting to {DEFAULT_RECONNECT_CONFIG['jitter']}.")
+            reconnect_conf["jitter"] = DEFAULT_RECONNECT_CONFIG["jitter"]
+        if reconnect_conf["max_delay_s"] < reconnect_conf["min_delay_s"]:
+            logger.warning("bridge.reconnect max_delay_s is below min_delay_s. Using min_delay_s for both.")
+            reconnect_conf["max_delay_s"] = reconnect_conf["min_delay_s"]
+        bridge_config["reconnect"] = reconnect_conf
+        if bridge_config["engine"] not in ENGINES:
+            logger.warning(f"Invalid bridge engine '{bridge_config['engine']}'. Must be one of {ENGINES}. Defaulting to 'threads'.")
+            bridge_config["engine"] = "threads"
+        if bridge_config["json_encoder"] not in JSON_ENCODER_CHOICES:
+            logger.warning(f"Invalid bridge json_encoder '{bridge_config['json_encoder']}'. Must be one of {JSON_ENCODER_CHOICES}. Defaulting to 'auto'.")
+            bridge_config["json_encoder"] = "auto"
+        elif bridge_config["json_encoder"] == "orjson" and orjson is None:
+            logger.warning("bridge json_encoder 'orjson' requires 'orjson', which is not installed. Defaulting to 'json'.")
+            bridge_config["json_encoder"] = "json"
+        bridge_config["json_encoder"] = resolve_json_encoder(bridge_config["json_encoder"])
+
+        metrics_conf = dict(DEFAULT_METRICS_CONFIG)
+        if isinstance(settings.get("metrics"), dict):
+            metrics_conf.update(settings["metrics"])
+        elif "metrics" in settings:
+            logger.warning("'bridge.metrics' config must be an object. Metrics export disabled.")
+        if metrics_conf["http_port"] is not None and not isinstance(metrics_conf["http_port"], int):
+            logger.warning(f"Invalid bridge.metrics http_port '{metrics_conf['http_port']}'. Prometheus endpoint disabled.")
+            metrics_conf["http_port"] = None
+        if not isinstance(metrics_conf["stats_interval_s"], (int, float)) or metrics_conf["stats_interval_s"] <= 0:
+            logger.warning(f"Invalid bridge.metrics stats_interval_s. Defaulting to {DEFAULT_METRICS_CONFIG['stats_interval_s']}.")
+            metrics_conf["stats_interval_s"] = DEFAULT_METRICS_CONFIG["stats_interval_s"]
+        if metrics_conf["stats_channel"] is not None:
+            metrics_conf["stats_channel"] = str(metrics_conf["stats_channel"])
+        bridge_config["metrics"] = metrics_conf
+
+        dedup_conf = dict(DEFAULT_DEDUP_CONFIG)
+        if isinstance(settings.get("dedup"), dict):
+            dedup_conf.update(settings["dedup"])
+        elif "dedup" in settings:
+            logger.warning("'bridge.dedup' config must be an object. Using defaults.")
+        dedup_conf["enabled"] = bool(dedup_conf["enabled"])
+        for key in ("window_s", "max_entries", "claim_wait_ms"):
+            if not isinstance(dedup_conf[key], (int, float)) or dedup_conf[key] <= 0:
+                logger.warning(f"Invalid bridge.dedup {key} '{dedup_conf[key]}'. Defaulting to {DEFAULT_DEDUP_CONFIG[key]}.")
+                dedup_conf[key] = DEFAULT_DEDUP_CONFIG[key]
+        if dedup_conf["claim_topic"] is not None and (not isinstance(dedup_conf["claim_topic"], str) or not dedup_conf["claim_topic"].strip('/')
+                                                      or any(c in dedup_conf["claim_topic"] for c in '+#')):
+            logger.warning(f"Invalid bridge.dedup claim_topic '{dedup_conf['claim_topic']}'. Shared deduplication disabled.")
+            dedup_conf["claim_topic"] = None
+        if dedup_conf["claim_topic"] is not None:
+            dedup_conf["claim_topic"] = dedup_conf["claim_topic"].rstrip('/')
+        if dedup_conf["claim_channel"] is not None:
+            dedup_conf["claim_channel"] = str(dedup_conf["claim_channel"])
+        bridge_config["dedup"] = dedup_conf
+
+        loop_conf = dict(DEFAULT_LOOP_CONFIG)
+        if isinstance(settings.get("loop_prevention"), dict):
+            loop_conf.update(settings["loop_prevention"])
+        elif "loop_prevention" in settings:
+            logger.warning("'bridge.loop_prevention' config must be an object. Using defaults.")
+        loop_conf["enabled"] = bool(loop_conf["enabled"])
+        for key in ("window_s", "max_entries"):
+            if not isinstance(loop_conf[key], (int, float)) or loop_conf[key] <= 0:
+                logger.warning(f"Invalid bridge.loop_prevention {key} '{loop_conf[key]}'. Defaulting to {DEFAULT_LOOP_CONFIG[key]}.")
+                loop_conf[key] = DEFAULT_LOOP_CONFIG[key]
+        bridge_config["loop_prevention"] = loop_conf
+        return bridge_config
+
+    def _select_engine(self, engine_name):
+        """
+        Starts or stops the asyncio engine while no session or queue exists. Caller
+        holds config_lock. Sessions and workers are bound to the engine they started
+        on, so switching engines on a hot reload otherwise needs a restart.
+        """
+        current = "threads" if self.engine is None else "asyncio"
+        if engine_name == current:
+            return
+        if self.outbound_queues or self.mqtt_pool.sessions():
+            logger.warning(f"bridge.engine changed to '{engine_name}'. Restart the plugin to switch; still using '{current}'.")
+            return
+        self.tx_scheduler.stop()
+        if engine_name == "asyncio":
+            self.engine = AsyncioEngine()
+        else:
+            self.engine.stop()
+            self.engine = None
+        self.mqtt_pool.engine = self.engine
+        self.tx_scheduler = TransmitScheduler(wait_histogram=self.metric_tx_wait,
+                                              loop=self.engine.loop if self.engine is not None else None)
+        if self.lora_config is not None:
+            self.tx_scheduler.set_lora_config(self.lora_config)
+        if self.engine is not None:
+            logger.info("Bridge engine: asyncio (MQTT sessions, outbound queues and transmit pacing share one event loop).")
+        else:
+            logger.info("Bridge engine: threads.")
+
+    def _apply_bridge_config(self):
+        """Starts, restarts or stops plugin-wide services to match bridge_config. Caller holds config_lock."""
+        self.message_log_level = logging.DEBUG if self.bridge_config.get("low_overhead") else logging.INFO
+        self.mqtt_pool.reconnect_conf = self.bridge_config.get("reconnect", DEFAULT_RECONNECT_CONFIG) # Read by the supervisor on each attempt
+        metrics_conf = self.bridge_config.get("metrics", DEFAULT_METRICS_CONFIG)
+
+        server_address = (metrics_conf["http_host"], metrics_conf["http_port"])
+        if self.metrics_server is not None and (metrics_conf["http_port"] is None or self.metrics_server.server_address[1] != server_address[1]):
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        if self.metrics_server is None and metrics_conf["http_port"] is not None:
+            try:
+                self.metrics_server = start_metrics_server(self.metrics, *server_address, health=self.get_health)
+                logger.info(f"Prometheus metrics available at http://{server_address[0]}:{server_address[1]}/metrics")
+            except OSError as e:
+                logger.error(f"Could not start metrics endpoint on {server_address[0]}:{server_address[1]}: {e}")
+
+        # Background loops restart only when their settings change, so a hot reload does not reset them
+        stats_settings = (metrics_conf["stats_topic"], metrics_conf["stats_channel"], metrics_conf["stats_interval_s"])
+        if stats_settings != self._stats_settings:
+            self._stats_settings = stats_settings
+            if self._stats_stop_event is not None:
+                self._stats_stop_event.set()
+                self._stats_stop_event = None
+            if metrics_conf["stats_topic"]:
+                self._stats_stop_event = threading.Event()
+                threading.Thread(target=self._publish_stats_loop, args=(self._stats_stop_event, metrics_conf),
+                                 name="amcb-stats-publisher", daemon=True).start()
+
+        watch_settings = (self.bridge_config.get("watch_config", False), self.bridge_config.get("watch_interval_s", DEFAULT_WATCH_INTERVAL_S))
+        if watch_settings != self._watch_settings:
+            self._watch_settings = watch_settings
+            if self._watch_stop_event is not None:
+                self._watch_stop_event.set()
+                self._watch_stop_event = None
+            if watch_settings[0]:
+                self._watch_stop_event = threading.Event()
+                threading.Thread(target=self._watch_config_loop, args=(self._watch_stop_event, watch_settings[1]),
+                                 name="amcb-config-watcher", daemon=True).start()
+                logger.info(f"Watching {self.config_file_path} for changes every {watch_settings[1]}s.")
+
+        loop_conf = self.bridge_config.get("loop_prevention", DEFAULT_LOOP_CONFIG)
+        if not loop_conf["enabled"]:
+            self.mesh_echoes = self.mqtt_echoes = None
+        elif self.mesh_echoes is None:
+            self.mesh_echoes = PacketDedupCache(loop_conf["window_s"], int(loop_conf["max_entries"]))
+            self.mqtt_echoes = PacketDedupCache(loop_conf["window_s"], int(loop_conf["max_entries"]))
+        else:
+            self.mesh_echoes.configure(loop_conf["window_s"], int(loop_conf["max_entries"]))
+            self.mqtt_echoes.configure(loop_conf["window_s"], int(loop_conf["max_entries"]))
+        self._compile_routes() # Origin markers depend on loop_prevention
+
+        dedup_conf = self.bridge_config.get("dedup", DEFAULT_DEDUP_CONFIG)
+        if not dedup_conf["enabled"]:
+            self.dedup_cache = None
+        elif self.dedup_cache is None:
+            self.dedup_cache = PacketDedupCache(dedup_conf["window_s"], int(dedup_conf["max_entries"]))
+        else:
+            self.dedup_cache.configure(dedup_conf["window_s"], int(dedup_conf["max_entries"]))
+        claim_settings = None
+        if dedup_conf["enabled"] and dedup_conf["claim_topic"]:
+            claim_settings = (dedup_conf["claim_topic"], dedup_conf["claim_channel"], dedup_conf["claim_wait_ms"] / 1000.0)
+        if claim_settings != self._claim_settings:
+            self._claim_settings = claim_settings
+            client = self.mqtt_clients.get(self._claim_channel())
+            self._subscribe_claims(client if client is not None and client.is_connected() else None)
+
+    def _claim_channel(self):
+        """Channel whose broker carries shared dedup claims: claim_channel, else the lowest configured channel."""
+        settings = self._claim_settings
+        if settings is None:
+            return None
+        if settings[1] is not None:
+            return settings[1]
+        return min(self.mqtt_configs, key=int, default=None)
+
+    def _subscribe_claims(self, client):
+        """Moves the claim topic subscription to client (None just drops it)."""
+        old = self._claim_subscription
+        self._claim_subscription = None
+        if old is not None:
+            try:
+                old[0].message_callback_remove(old[1])
+                old[0].unsubscribe(old[1])
+            except Exception: pass
+        settings = self._claim_settings
+        if client is None or settings is None:
+            return
+        topic_filter = f"{settings[0]}/#"
+        try:
+            client.message_callback_add(topic_filter, self._on_claim_message)
+            client.subscribe(topic_filter, qos=0)
+            self._claim_subscription = (client, topic_filter)
+            logger.info(f"Shared deduplication: subscribed to claims on '{topic_filter}'.")
+        except Exception as e:
+            logger.error(f"Could not subscribe to dedup claims on '{topic_filter}': {e}", exc_info=True)
+
+    def _on_claim_message(self, client, userdata, msg):
+        """Records another gateway's claim, published as <claim_topic>/<from hex>/<id hex> with its gateway ID as payload."""
+        dedup_cache = self.dedup_cache
+        if dedup_cache is None:
+            return
+        try:
+            sender, packet_id = msg.topic.rsplit('/', 2)[-2:]
+            dedup_cache.record_claim((int(sender, 16), int(packet_id, 16)), msg.payload.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            logger.debug(f"Ignoring malformed dedup claim on '{msg.topic}'.")
+
+    def _claim_packet(self, key, gateway_id):
+        """Publishes this gateway's claim on a packet. Returns False if another gateway already claimed it."""
+        if self.dedup_cache.claimed_by(key) is not None:
+            return False
+        try:
+            route = self.routes[int(self._claim_channel())]
+        except (IndexError, TypeError, ValueError):
+            route = None
+        client = route.client if route is not None else None
+        if client is not None and client.is_connected():
+            client.publish(f"{self._claim_settings[0]}/{key[0]:08x}/{key[1]:08x}", gateway_id, qos=0, retain=False)
+            self.dedup_cache.record_claim(key, gateway_id)
+        return True
+
+    def _won_claim(self, claim):
+        """True if this gateway won the packet. The outbound queue holds claimed items until the claim window has passed."""
+        key, gateway_id = claim
+        winner = self.dedup_cache.claimed_by(key) if self.dedup_cache is not None else None
+        return winner is None or winner == gateway_id
+
+    def _publish_stats_loop(self, stop_event, metrics_conf):
+        """Periodically publishes a JSON metrics snapshot through the stats channel's MQTT client."""
+        while not stop_event.wait(metrics_conf["stats_interval_s"]):
+            routes = self.routes
+            route = next((r for r in routes if r is not None and (metrics_conf["stats_channel"] is None or r.channel_id_str == metrics_conf["stats_channel"])), None)
+            if route is None or route.client is None or not route.client.is_connected():
+                logger.debug("No connected MQTT client for stats publishing. Skipping this interval.")
+                continue
+            try:
+                snapshot = json.dumps({"timestamp": time.time(), "metrics": self.metrics.snapshot()})
+                route.client.publish(metrics_conf["stats_topic"], snapshot, qos=0, retain=False)
+            except Exception as e:
+                logger.warning(f"Could not publish metrics snapshot to '{metrics_conf['stats_topic']}': {e}")
+
+    def _sync_outbound_queues(self):
+        """Creates, reconfigures or retires per-channel outbound queues to match mqtt_configs. Caller holds config_lock."""
+        for channel_id_str, config in self.mqtt_configs.items():
+            queue_conf = config["queue"]
+            if channel_id_str in self.outbound_queues:
+                self.outbound_queues[channel_id_str].configure(queue_conf["max_depth"], queue_conf["overflow"], queue_conf["block_timeout_ms"])
+            else:
+                batcher = PublishBatcher(channel_id_str, self._publish_payload)
+                self.publish_batchers[channel_id_str] = batcher
+                self.outbound_queues[channel_id_str] = OutboundQueue(
+                    channel_id_str, self._publish_route_item,
+                    max_depth=queue_conf["max_depth"], overflow=queue_conf["overflow"],
+                    block_timeout_ms=queue_conf["block_timeout_ms"], idle_handler=batcher.poll,
+                    loop=self.engine.loop if self.engine is not None else None)
+                batcher.record = self.outbound_queues[channel_id_str].record # Batched items count when their batch is flushed
+            self.publish_batchers[channel_id_str].configure(config.get("batch"))
+        for channel_id_str in [c for c in self.outbound_queues if c not in self.mqtt_configs]:
+            self.outbound_queues.pop(channel_id_str).stop(timeout=0) # Worker flushes any pending batch on exit
+            self.publish_batchers.pop(channel_id_str, None)
+        for channel_id_str, config in self.mqtt_configs.items():
+            spool_conf = config.get("spool")
+            spool = self.spools.get(channel_id_str)
+            if spool is not None and (spool_conf is None or spool.directory != spool_conf["dir"]):
+                del self.spools[channel_id_str]
+                spool.close() # Records stay on disk and are replayed if the spool is re-enabled
+                spool = None
+            if spool_conf is None:
+                continue
+            if spool is None:
+                try:
+                    self.spools[channel_id_str] = PacketSpool(spool_conf["dir"], spool_conf["max_bytes"], spool_conf["max_age_s"],
+                                                              spool_conf["segment_bytes"], spool_conf["fsync"], spool_conf["replay_rate"])
+                except OSError as e:
+                    logger.error(f"Channel '{channel_id_str}': Could not open spool directory '{spool_conf['dir']}': {e}. Spooling disabled.")
+            else:
+                spool.max_bytes, spool.max_age_s = spool_conf["max_bytes"], spool_conf["max_age_s"]
+                spool.segment_bytes, spool.fsync = spool_conf["segment_bytes"], spool_conf["fsync"]
+                spool.replay_rate = spool_conf["replay_rate"]
+        for channel_id_str in [c for c in self.spools if c not in self.mqtt_configs]:
+            self.spools.pop(channel_id_str).close()
+        for channel_id_str, config in self.mqtt_configs.items():
+            if "mqtt_to_meshtastic" in config:
+                self.tx_scheduler.configure_channel(channel_id_str, config["mqtt_to_meshtastic"])
+            else:
+                self.tx_scheduler.remove_channel(channel_id_str)
+        for channel_id_str in self.tx_scheduler.channel_ids():
+            if channel_id_str not in self.mqtt_configs:
+                self.tx_scheduler.remove_channel(channel_id_str)
+        self._compile_routes()
+
+    def _compile_routes(self):
+        """Rebuilds the channel-indexed route table from mqtt_configs and mqtt_clients. Caller holds config_lock."""
+        size = max([MAX_CHANNELS] + [int(c) + 1 for c in self.mqtt_configs])
+        table = [None] * size
+        gateway_id = self._gateway_id()
+        json_encoder = self.bridge_config.get("json_encoder", "json")
+        renderers = {}
+        origin_properties = None
+        if self.mesh_echoes is not None and Properties is not None:
+            origin_properties = Properties(PacketTypes.PUBLISH)
+            origin_properties.UserProperty = (ORIGIN_PROPERTY, self._origin_id())
+        for channel_id_str, config in self.mqtt_configs.items():
+            channel_index = int(channel_id_str)
+            if channel_index < 0:
+                continue
+            payload_type = config.get("payload_type", "full_packet")
+            accept, projection = self.packet_filters.get(channel_id_str, (None, None))
+            renderer_key = (config["topic"], channel_id_str, gateway_id)
+            if renderer_key in self._topic_renderers:
+                render_topic = self._topic_renderers[renderer_key]
+            else:
+                render_topic = compile_topic_template(*renderer_key)
+            renderers[renderer_key] = render_topic
+            table[channel_index] = Route(
+                channel_id_str=channel_id_str,
+                client=self.mqtt_clients.get(channel_id_str),
+                topic=config["topic"],
+                qos=config.get("qos", 0),
+                retain=config.get("retain", False),
+                payload_type=payload_type,
+                serializer=build_serializer(payload_type, config, gateway_id, projection, json_encoder),
+                queue=self.outbound_queues.get(channel_id_str),
+                batcher=self.publish_batchers[channel_id_str] if "batch" in config else None,
+                spool=self.spools.get(channel_id_str),
+                accept=accept,
+                render_topic=render_topic,
+                properties=origin_properties if config.get("protocol") == "5" else None,
+                reassembler=self._reassembler_for(channel_id_str, config))
+        self._topic_renderers = renderers # Keeps rendered-topic caches warm across route rebuilds
+        for channel_id_str in [c for c in self.reassemblers if not self.mqtt_configs.get(c, {}).get("reassemble")]:
+            del self.reassemblers[channel_id_str]
+        self.routes = tuple(table) # Single reference swap; onReceive never sees a half-built table
+
+        subscribe_topics = {subscription_topic(c) for c in self.mqtt_configs.values()} - {None}
+        if self.mqtt_echoes is not None and subscribe_topics:
+            self._may_echo = functools.lru_cache(maxsize=TOPIC_CACHE_SIZE)(
+                lambda topic: any(mqtt.topic_matches_sub(sub, topic) for sub in subscribe_topics))
+        else:
+            self._may_echo = None # Nothing we publish can come back to us
+
+    def _reassembler_for(self, channel_id_str, config):
+        """The channel's FragmentReassembler, kept across route rebuilds so partial messages survive. Caller holds config_lock."""
+        if not config.get("reassemble"):
+            return None
+        if channel_id_str not in self.reassemblers:
+            self.reassemblers[channel_id_str] = FragmentReassembler()
+        return self.reassemblers[channel_id_str]
+
+    def _node_num(self):
+        """Local node number, or None before the radio is known."""
+        my_info = getattr(self.mesh_interface, 'myInfo', None)
+        node_num = getattr(my_info, 'my_node_num', None)
+        if node_num is None and isinstance(my_info, dict):
+            node_num = my_info.get('my_node_num')
+        return node_num if isinstance(node_num, int) else None
+
+    def _gateway_id(self):
+        """Local node ID in Meshtastic's '!xxxxxxxx' form, or None before the radio is known."""
+        node_num = self._node_num()
+        return f"!{node_num:08x}" if node_num is not None else None
+
+    def _origin_id(self):
+        """Identifies this bridge in MQTT v5 origin markers: the gateway ID, or a per-process ID before the radio is known."""
+        return self._gateway_id() or f"amcb-{os.getpid()}"
+
+    def _is_mqtt_echo(self, msg):
+        """True if an inbound MQTT message is one this bridge published (origin marker or recent fingerprint)."""
+        properties = getattr(msg, 'properties', None)
+        if properties is not None and (ORIGIN_PROPERTY, self._origin_id()) in (getattr(properties, 'UserProperty', None) or ()):
+            return True
+        mqtt_echoes = self.mqtt_echoes
+        return mqtt_echoes is not None and hash((msg.topic, bytes(msg.payload))) in mqtt_echoes
+
+    def _record_mqtt_publish(self, topic, payload):
+        """Remembers a publish that one of our own subscriptions will receive back."""
+        may_echo, mqtt_echoes = self._may_echo, self.mqtt_echoes
+        if may_echo is not None and mqtt_echoes is not None and may_echo(topic):
+            mqtt_echoes.add(hash((topic, bytes(payload))))
+
+    def _is_mesh_echo(self, packet, channel_index):
+        """True if a received mesh packet is one this bridge sent from MQTT."""
+        if packet.get('from') != self._node_num():
             return False
+        mesh_echoes = self.mesh_echoes
+        if packet.get('id') and ('id', packet['id']) in mesh_echoes:
+            return True
+        decoded = packet.get('decoded')
+        text = decoded.get('text') if isinstance(decoded, dict) else None
+        return text is not None and ('text', channel_index, text) in mesh_echoes
+
+    def get_queue_stats(self):
+        """Returns enqueued/dropped/published counters for every channel's outbound queue."""
+        with self.config_lock:
+            queues = dict(self.outbound_queues)
+        return {channel_id_str: q.stats() for channel_id_str, q in queues.items()}
+
+    def get_health(self):
+        """Per-channel MQTT connection health: state (connecting, connected, backoff, open), failures, last error, retry time."""
+        return self.mqtt_pool.health()
 
     def connect_mqtt_clients(self):
+        """
+        Attaches every configured channel to its broker session. Returns without
+        waiting for the network: the pool's supervisor connects sessions in
+        parallel and keeps reconnecting them, so config_lock is only held briefly.
+        """
         with self.config_lock:
             if not self.mqtt_configs:
                 logger.info("No MQTT configurations, skipping client connections.")
                 return
 
             for channel_id_str, config in self.mqtt_configs.items():
-                if channel_id_str in self.mqtt_clients and self.mqtt_clients[channel_id_str].is_connected():
-                    continue # Already connected
+                if channel_id_str in self.mqtt_clients:
+                    continue
+                try:
+                    self.mqtt_clients[channel_id_str] = self.mqtt_pool.acquire(
+                        channel_id_str, config,
+                        on_connect=self._on_mqtt_connect(channel_id_str, config),
+                        on_disconnect=self._on_mqtt_disconnect(channel_id_str, config["host"]),
+                        on_message=self._on_message_from_mqtt(channel_id_str)) # Routed by subscribe_topic
+                except Exception as e:
+                    logger.error(f"Failed to set up MQTT for channel '{channel_id_str}': {e}", exc_info=True)
+            self._compile_routes()
+            logger.info(f"{len(self.mqtt_clients)} channel(s) bridged over {len(self.mqtt_pool.sessions())} MQTT session(s). Connecting in the background.")
 
-                if channel_id_str in self.mqtt_clients: # Cleanup old, disconnected client
-                    try:
-                        self.mqtt_clients[channel_id_str].loop_stop(force=True) # Stop previous loop
-                        self.mqtt_clients[channel_id_str].disconnect()
-                    except: pass # Ignore errors during cleanup
-                    del self.mqtt_clients[channel_id_str]
+    def _create_mqtt_client(self, channel_id_str, config):
+        """Builds an unconnected paho client with credentials, TLS and Will applied from a channel config."""
+        client_id = f"meshtastic-amcb-{channel_id_str}-{int(time.time())}"
+        # Reconnecting is left to the pool's supervisor (backoff with jitter, circuit breaker), not paho's loop
+        if hasattr(mqtt, 'CallbackAPIVersion'): # Paho MQTT v2.x+
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id,
+                                 protocol=MQTT_PROTOCOLS[config.get("protocol", "3.1.1")], reconnect_on_failure=False)
+        else: # Paho MQTT v1.x
+            client = mqtt.Client(client_id=client_id, protocol=MQTT_PROTOCOLS[config.get("protocol", "3.1.1")], reconnect_on_failure=False)
+
+        if "username" in config and "password" in config:
+            client.username_pw_set(config["username"], config["password"])
 
+        # TLS Configuration
+        if "tls" in config and isinstance(config["tls"], dict):
+            tls_config = config["tls"]
+            ca_certs = tls_config.get("ca_certs")
+            certfile = tls_config.get("certfile")
+            keyfile = tls_config.get("keyfile")
 
-                client_id = f"meshtastic-amcb-{channel_id_str}-{int(time.time())}"
+            if ca_certs or certfile or keyfile: # Only call tls_set if any path is provided
                 try:
-                    if hasattr(mqtt, 'CallbackAPIVersion'): # Paho MQTT v2.x+
-                        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id)
-                    else: # Paho MQTT v1.x
-                        client = mqtt.Client(client_id=client_id)
-
-                    if "username" in config and "password" in config:
-                        client.username_pw_set(config["username"], config["password"])
-
-                    # TLS Configuration
-                    if "tls" in config and isinstance(config["tls"], dict):
-                        tls_config = config["tls"]
-                        ca_certs = tls_config.get("ca_certs")
-                        certfile = tls_config.get("certfile")
-                        keyfile = tls_config.get("keyfile")
-                        
-                        if ca_certs or certfile or keyfile: # Only call tls_set if any path is provided
-                            try:
-                                client.tls_set(ca_certs=ca_certs,
-                                               certfile=certfile,
-                                               keyfile=keyfile,
-                                               cert_reqs=ssl.CERT_REQUIRED if ca_certs else ssl.CERT_NONE,
-                                               tls_version=ssl.PROTOCOL_TLS_CLIENT)
-                                logger.info(f"Channel '{channel_id_str}': TLS configured. CA: {ca_certs is not None}, Cert/Key: {certfile is not None}")
-                            except Exception as e_tls:
-                                logger.error(f"Channel '{channel_id_str}': Failed to set TLS: {e_tls}", exc_info=True)
-
-
-                    # Will Configuration
-                    if "will" in config and isinstance(config["will"], dict) and "topic" in config["will"]:
-                        will_cfg = config["will"]
-                        client.will_set(topic=will_cfg["topic"],
-                                        payload=will_cfg.get("payload", "offline"),
-                                        qos=will_cfg.get("qos", 0),
-                                        retain=will_cfg.get("retain", False))
-                        logger.info(f"Channel '{channel_id_str}': MQTT Will configured for topic '{will_cfg['topic']}'.")
-
-
-                    client.on_connect = self._on_mqtt_connect(channel_id_str, config)
-                    client.on_disconnect = self._on_mqtt_disconnect(channel_id_str, config["host"])
-                    
-                    # Setup for MQTT-to-Meshtastic if configured
-                    if "mqtt_to_meshtastic" in config:
-                        client.on_message = self._on_message_from_mqtt(channel_id_str)
-
-                    logger.info(f"Connecting to MQTT for channel '{channel_id_str}': {config['host']}:{config['port']}")
-                    client.connect(config["host"], config["port"], keepalive=60)
-                    client.loop_start()
-                    self.mqtt_clients[channel_id_str] = client
-                except Exception as e:
-                    logger.error(f"Failed to connect MQTT for channel '{channel_id_str}': {e}", exc_info=True)
+                    client.tls_set(ca_certs=ca_certs,
+                                   certfile=certfile,
+                                   keyfile=keyfile,
+                                   cert_reqs=ssl.CERT_REQUIRED if ca_certs else ssl.CERT_NONE,
+                                   tls_version=ssl.PROTOCOL_TLS_CLIENT)
+                    logger.info(f"Channel '{channel_id_str}': TLS configured. CA: {ca_certs is not None}, Cert/Key: {certfile is not None}")
+                except Exception as e_tls:
+                    logger.error(f"Channel '{channel_id_str}': Failed to set TLS: {e_tls}", exc_info=True)
 
-    def _on_mqtt_connect(self, channel_id_str, bridge_config):
+        # Will Configuration
+        if "will" in config and isinstance(config["will"], dict) and "topic" in config["will"]:
+            will_cfg = config["will"]
+            client.will_set(topic=will_cfg["topic"],
+                            payload=will_cfg.get("payload", "offline"),
+                            qos=will_cfg.get("qos", 0),
+                            retain=will_cfg.get("retain", False))
+            logger.info(f"Channel '{channel_id_str}': MQTT Will configured for topic '{will_cfg['topic']}'.")
+        return client
+
+    def _on_mqtt_connect(self, channel_id_str, initial_config):
         def on_connect_callback(client, userdata, flags, rc, properties=None):
+            bridge_config = self.mqtt_configs.get(channel_id_str, initial_config) # Latest config; hot reload may have edited it in place
             if rc == 0:
                 logger.info(f"Successfully connected to MQTT for channel '{channel_id_str}' on {bridge_config['host']}.")
                 # Publish "online" status if Will is configured
@@ -210,6 +3031,12 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
                         logger.info(f"Channel '{channel_id_str}': Subscribed to MQTT topic '{sub_topic}' (QoS {sub_qos}) for MQTT-to-Meshtastic.")
                     except Exception as e_sub:
                         logger.error(f"Channel '{channel_id_str}': Failed to subscribe to '{sub_topic}': {e_sub}", exc_info=True)
+
+                if self._claim_settings is not None and channel_id_str == self._claim_channel():
+                    self._subscribe_claims(client) # Claims from other gateways; subscriptions do not survive a reconnect
+
+                # Forward anything captured while the broker was unreachable
+                self._start_spool_replay(channel_id_str)
             else:
                 reason = mqtt.connack_string(rc) if hasattr(mqtt, 'connack_string') else f"Code {rc}"
                 logger.error(f"MQTT connection failed for channel '{channel_id_str}': {reason}")
@@ -221,16 +3048,21 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
                 logger.info(f"Gracefully disconnected from MQTT for channel '{channel_id_str}' on {host}.")
             else:
                 logger.warning(f"Unexpectedly disconnected from MQTT for channel '{channel_id_str}' on {host}. Code: {rc}. Will attempt to reconnect.")
+                self.metric_reconnects.inc(channel_id_str)
         return on_disconnect_callback
 
     def _on_message_from_mqtt(self, src_channel_id_str):
         """Callback for when an MQTT message is received for forwarding to Meshtastic."""
         def on_message_callback(client, userdata, msg):
             try:
-                logger.info(f"MQTT message received on topic '{msg.topic}' for bridge channel '{src_channel_id_str}'")
-                payload_str = msg.payload.decode('utf-8', errors='replace').strip()
-                
-                if not payload_str:
+                self.metric_mqtt_received.inc(src_channel_id_str)
+                if logger.isEnabledFor(self.message_log_level):
+                    logger.log(self.message_log_level, f"MQTT message received on topic '{msg.topic}' for bridge channel '{src_channel_id_str}'")
+                if self.mesh_echoes is not None and self._is_mqtt_echo(msg):
+                    logger.debug(f"Ignoring our own publish on '{msg.topic}' (loop prevention).")
+                    self.metric_mqtt_echoes.inc(src_channel_id_str)
+                    return
+                if not msg.payload.strip():
                     logger.info("Received empty MQTT payload, not sending to Meshtastic.")
                     return
 
@@ -238,113 +3070,234 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
                     logger.warning("Mesh interface not available, cannot send MQTT message to Meshtastic.")
                     return
 
-                with self.config_lock: # Access config safely
-                    bridge_config = self.mqtt_configs.get(src_channel_id_str)
-                    if not bridge_config or "mqtt_to_meshtastic" not in bridge_config:
-                        logger.warning(f"No valid MQTT-to-Meshtastic config for bridge '{src_channel_id_str}'. Ignoring MQTT message.")
-                        return
-                    m2m_config = bridge_config["mqtt_to_meshtastic"]
-
-                target_channel_index = m2m_config.get("target_channel_index", int(src_channel_id_str))
-                destination_id = m2m_config.get("target_node_id") or BROADCAST_ADDR # Default to broadcast if null/empty
-
-                # Limit payload length for safety, Meshtastic has packet size limits
-                max_len = 200 # Conservative limit
-                if len(payload_str) > max_len:
-                    payload_str_short = payload_str[:max_len] + "..."
-                    logger.warning(f"MQTT payload too long ({len(payload_str)} bytes), truncating to {max_len} for Meshtastic: '{payload_str_short}'")
-                    payload_str = payload_str[:max_len]
-                else:
-                    payload_str_short = payload_str
+                # No config_lock: a reload holds it while pool.release() joins this very network thread.
+                # mqtt_configs is replaced wholesale, never mutated, so one read is a consistent snapshot.
+                bridge_config = self.mqtt_configs.get(src_channel_id_str)
+                if not bridge_config or "mqtt_to_meshtastic" not in bridge_config:
+                    logger.warning(f"No valid MQTT-to-Meshtastic config for bridge '{src_channel_id_str}'. Ignoring MQTT message.")
+                    return
+                m2m_config = bridge_config["mqtt_to_meshtastic"]
 
-                logger.info(f"Sending to Meshtastic: '{payload_str_short}' (Dest: '{destination_id}', ChanIdx: {target_channel_index})")
-                
-                # Make sure mesh_interface is valid and has sendText
-                if hasattr(self.mesh_interface, 'sendText'):
-                    self.mesh_interface.sendText(
-                        text=payload_str,
-                        destinationId=destination_id,
-                        channelIndex=target_channel_index
-                        # wantAck=True could be an option too
-                    )
-                    logger.debug(f"Message forwarded to Meshtastic network via sendText.")
+                try:
+                    message = parse_mesh_message(m2m_config.get("format", "text"), msg.payload, m2m_config)
+                except ValueError as e:
+                    logger.warning(f"Ignoring MQTT message on '{msg.topic}' for bridge '{src_channel_id_str}': {e}")
+                    return
+
+                # Meshtastic packets carry at most MAX_MESH_PAYLOAD bytes: fragment if enabled, else truncate
+                if m2m_config.get("fragment"):
+                    fragments, truncated = fragment_payload(message.payload, message.is_text, MAX_MESH_PAYLOAD,
+                                                            m2m_config["max_fragments"], next(self._fragment_ids))
+                elif len(message.payload) > MAX_MESH_PAYLOAD:
+                    cut = _utf8_cut(message.payload, MAX_MESH_PAYLOAD) if message.is_text else MAX_MESH_PAYLOAD
+                    fragments, truncated = [message.payload[:cut]], True
                 else:
-                    logger.error("mesh_interface does not have sendText method or is not initialized properly.")
+                    fragments, truncated = [message.payload], False
+                if truncated:
+                    logger.warning(f"MQTT payload too long ({len(message.payload)} bytes), truncating to {sum(len(f) for f in fragments)} bytes "
+                                   f"in {len(fragments)} packet(s) for Meshtastic.")
+
+                # Make sure mesh_interface is valid and can send
+                if not hasattr(self.mesh_interface, 'sendText' if message.is_text else 'sendData'):
+                    logger.error("mesh_interface does not have sendText/sendData methods or is not initialized properly.")
+                    return
+
+                for fragment in fragments:
+                    # Paced by the transmit scheduler; this paho callback returns immediately
+                    if not self.tx_scheduler.submit(src_channel_id_str, message.destination, fragment, self._mesh_sender(message, fragment)):
+                        logger.info(f"MQTT message for bridge '{src_channel_id_str}' not queued for Meshtastic (duplicate or queue full).")
 
             except Exception as e:
                 logger.error(f"Error processing MQTT message for Meshtastic (topic '{msg.topic}'): {e}", exc_info=True)
         return on_message_callback
 
 
+    def _mesh_sender(self, message, payload):
+        """Returns send() for one MeshMessage packet: sendText for text messages, sendData for everything else."""
+        mesh_interface = self.mesh_interface
+        def send():
+            mesh_echoes = self.mesh_echoes
+            if message.is_text:
+                text = payload.decode('utf-8', errors='replace')
+                logger.log(self.message_log_level, f"Sending to Meshtastic: '{text}' (Dest: '{message.destination}', ChanIdx: {message.channel_index})")
+                if mesh_echoes is not None: # Recorded before sending, as the radio may echo the packet back immediately
+                    mesh_echoes.add(('text', message.channel_index, text))
+                sent_packet = mesh_interface.sendText(text=text, destinationId=message.destination,
+                                                      wantAck=message.want_ack, channelIndex=message.channel_index)
+            else:
+                logger.log(self.message_log_level, f"Sending {len(payload)} bytes to Meshtastic on port {message.portnum} (Dest: '{message.destination}', ChanIdx: {message.channel_index})")
+                sent_packet = mesh_interface.sendData(payload, destinationId=message.destination, portNum=message.portnum,
+                                                      wantAck=message.want_ack, channelIndex=message.channel_index)
+            if mesh_echoes is not None and getattr(sent_packet, 'id', None):
+                mesh_echoes.add(('id', sent_packet.id))
+            logger.debug(f"Message forwarded to Meshtastic network via {'sendText' if message.is_text else 'sendData'}.")
+        return send
+
     def onReceive(self, packet, interface): # Meshtastic to MQTT
         if not self.running: return
         # Store interface if not already stored (needed for sending)
         if not self.mesh_interface and hasattr(interface, '_meshInterface') and interface._meshInterface:
             self.mesh_interface = interface._meshInterface
 
-        logger.debug(f"Raw packet received for MQTT bridge: {packet}")
+        if logger.isEnabledFor(logging.DEBUG): # Avoid formatting whole packets when DEBUG is off
+            logger.debug(f"Raw packet received for MQTT bridge: {packet}")
         if not packet: return
+        self.metric_received.inc()
 
         channel_index = packet.get('channel_index')
         if channel_index is None and packet.get('decoded', {}).get('portnum') not in ['UNKNOWN_APP', None, 0]:
             if packet.get('to') == 0xFFFFFFFF: # BROADCAST_ADDR_INT
                 channel_index = 0 # Default to primary for general broadcasts if channel is unclear
             else:
-                logger.debug(f"Packet channel index undetermined, not a clear broadcast. Ignoring for MQTT. Pkt: {packet}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Packet channel index undetermined, not a clear broadcast. Ignoring for MQTT. Pkt: {packet}")
+                self.metric_filtered.inc("no_channel")
                 return
         elif channel_index is None:
-            logger.debug(f"Packet channel index undetermined or not user data. Ignoring. Pkt: {packet}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Packet channel index undetermined or not user data. Ignoring. Pkt: {packet}")
+            self.metric_filtered.inc("no_channel")
             return
 
-        channel_id_str = str(channel_index)
-        
-        with self.config_lock:
-            if channel_id_str not in self.mqtt_configs:
-                return # No config for this channel
-            mqtt_config = self.mqtt_configs[channel_id_str]
-            if channel_id_str not in self.mqtt_clients or not self.mqtt_clients[channel_id_str].is_connected():
-                logger.warning(f"MQTT client for channel '{channel_id_str}' not ready. Message not sent.")
+        try:
+            route = self.routes[channel_index]
+        except (IndexError, TypeError):
+            route = None # Channel index outside the route table
+        if route is None:
+            self.metric_filtered.inc("unconfigured_channel")
+            return # No config for this channel
+        if route.accept is not None and not route.accept(packet):
+            self.metric_filtered.inc("channel_filter")
+            return
+        if self.mesh_echoes is not None and self._is_mesh_echo(packet, channel_index):
+            self.metric_filtered.inc("echo") # Sent by us from MQTT; bridging it back would loop
+            return
+
+        received_at = time.monotonic()
+        claim = ready_at = None
+        dedup_cache = self.dedup_cache
+        key = packet_dedup_key(packet) if dedup_cache is not None else None
+        if key is not None:
+            if not dedup_cache.add(key, received_at):
+                self.metric_filtered.inc("duplicate")
+                return
+            claim_settings = self._claim_settings
+            gateway_id = self._gateway_id() if claim_settings is not None else None
+            if gateway_id is not None: # Shared mode: claim on the broker, publish after the claim window if we won
+                if not self._claim_packet(key, gateway_id):
+                    self.metric_filtered.inc("claimed_elsewhere")
+                    return
+                claim = (key, gateway_id)
+                ready_at = received_at + claim_settings[2]
+        if route.reassembler is not None:
+            packet = route.reassembler.add(packet)
+            if packet is None:
+                self.metric_filtered.inc("fragment") # Held until the rest of the message arrives
                 return
-        
-        client = self.mqtt_clients[channel_id_str]
-        topic = mqtt_config["topic"]
-        qos = mqtt_config.get("qos", 0)
-        retain = mqtt_config.get("retain", False)
-        payload_type = mqtt_config.get("payload_type", "full_packet")
 
-        try:
-            payload_to_publish = None
-            if payload_type == "decoded_only":
-                payload_to_publish = packet.get('decoded', {})
-            elif payload_type == "text_payload_only":
-                decoded_part = packet.get('decoded', {})
-                if decoded_part.get('portnum') == 'TEXT_MESSAGE_APP' and 'text' in decoded_part:
-                    payload_to_publish = decoded_part['text']
-                else:
-                    payload_to_publish = decoded_part # Fallback
-            else: # "full_packet"
-                payload_to_publish = packet
-            
-            if isinstance(payload_to_publish, str):
-                message_payload = payload_to_publish.encode('utf-8') # MQTT Paho expects bytes
-            else:
-                def json_serializer(obj):
-                    if isinstance(obj, bytes): return obj.hex()
-                    if hasattr(obj, 'DESCRIPTOR'): return str(obj) # Basic protobuf obj handling
-                    if isinstance(obj, (int, float, str, list, dict, bool, type(None))): return obj
-                    return str(obj) # Fallback for other types
-                message_payload = json.dumps(payload_to_publish, default=json_serializer).encode('utf-8')
+        topic = route.topic if route.render_topic is None else route.render_topic(packet)
+        # Serialization and publishing happen on the channel's worker (thread or event loop)
+        if not route.queue.put((route, topic, packet, received_at, claim), ready_at):
+            logger.debug(f"Outbound queue for channel '{route.channel_id_str}' full ({route.queue.overflow}). Packet dropped.")
+
+    def _publish_route_item(self, item):
+        """
+        Outbound worker handler: serializes one (route, topic, packet) item and
+        publishes or batches it. Returns None when the outcome is recorded on the
+        queue instead: batched items count when their batch is flushed.
+        """
+        route, topic, packet, received_at, claim = item
+        if claim is not None and not self._won_claim(claim):
+            self.metric_filtered.inc("claimed_elsewhere")
+            route.queue.record(skipped=1) # Another gateway publishes this packet
+            return None
+        if route.batcher is None and route.spool is None and (route.client is None or not route.client.is_connected()):
+            logger.warning(f"MQTT client for channel '{route.channel_id_str}' not ready. Message not sent.")
+            self.metric_publish_failures.inc(route.channel_id_str)
+            return False
 
+        try:
+            started = time.perf_counter()
+            message_payload = route.serializer(packet)
+            self.metric_serialize_time.observe(time.perf_counter() - started, route.channel_id_str)
+            self.metric_serialized.inc(route.channel_id_str)
         except Exception as e:
-            logger.error(f"Could not serialize packet for MQTT (channel '{channel_id_str}'): {e}", exc_info=True)
-            return
+            logger.error(f"Could not serialize packet for MQTT (channel '{route.channel_id_str}'): {e}", exc_info=True)
+            self.metric_publish_failures.inc(route.channel_id_str)
+            return False
 
+        if route.batcher is not None:
+            route.batcher.add(route, topic, message_payload, received_at)
+            return None
+        return self._publish_payload(route, topic, message_payload, (received_at,))
+
+    def _publish_payload(self, route, topic, message_payload, received_ats):
+        """Publishes one MQTT message carrying len(received_ats) mesh packets."""
+        client = route.client
+        # While anything is spooled, new messages queue behind it so the broker sees them in order
+        if route.spool is not None and (client is None or not client.is_connected() or route.spool.has_pending()):
+            return self._spool_payload(route, topic, message_payload, received_ats)
+        if client is None or not client.is_connected():
+            logger.warning(f"MQTT client for channel '{route.channel_id_str}' not ready. {len(received_ats)} message(s) not sent.")
+            self.metric_publish_failures.inc(route.channel_id_str, amount=len(received_ats))
+            return False
         try:
-            logger.info(f"Publishing from Meshtastic chan {channel_index} to MQTT '{topic}' (QoS {qos}, Retain {retain})")
-            logger.debug(f"MQTT Payload ({payload_type}) for topic '{topic}': {message_payload.decode('utf-8', 'replace')[:150]}...")
-            client.publish(topic, message_payload, qos=qos, retain=retain)
+            if logger.isEnabledFor(self.message_log_level):
+                logger.log(self.message_log_level, f"Publishing from Meshtastic chan {route.channel_id_str} to MQTT '{topic}' (QoS {route.qos}, Retain {route.retain}, Messages {len(received_ats)})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"MQTT Payload ({route.payload_type}) for topic '{topic}': {message_payload.decode('utf-8', 'replace')[:150]}...")
+            self._record_mqtt_publish(topic, message_payload) # Before publishing: the echo can arrive before publish() returns
+            client.publish(topic, message_payload, qos=route.qos, retain=route.retain, properties=route.properties)
         except Exception as e:
-            logger.error(f"Failed to publish to MQTT for channel '{channel_id_str}': {e}", exc_info=True)
+            logger.error(f"Failed to publish to MQTT for channel '{route.channel_id_str}': {e}", exc_info=True)
+            if route.spool is not None:
+                return self._spool_payload(route, topic, message_payload, received_ats)
+            self.metric_publish_failures.inc(route.channel_id_str, amount=len(received_ats))
+            return False
+        now = time.monotonic()
+        for received_at in received_ats:
+            self.metric_latency.observe(now - received_at, route.channel_id_str)
+        self.metric_published.inc(route.channel_id_str, amount=len(received_ats))
+        return True
+
+    def _spool_payload(self, route, topic, message_payload, received_ats):
+        try:
+            route.spool.append(topic, message_payload, route.qos, route.retain)
+        except OSError as e:
+            logger.error(f"Could not spool message for channel '{route.channel_id_str}': {e}")
+            self.metric_publish_failures.inc(route.channel_id_str, amount=len(received_ats))
+            return False
+        if logger.isEnabledFor(self.message_log_level):
+            logger.log(self.message_log_level, f"Spooled {len(received_ats)} message(s) for channel {route.channel_id_str} until MQTT is available.")
+        if route.client is not None and route.client.is_connected():
+            self._start_spool_replay(route.channel_id_str) # Connected but still draining: make sure replay is running
+        return True
+
+    def _route_for(self, channel_id_str):
+        return next((r for r in self.routes if r is not None and r.channel_id_str == channel_id_str), None)
+
+    def _start_spool_replay(self, channel_id_str):
+        """Starts a background replay of the channel's spool, unless it is empty or already replaying."""
+        route = self._route_for(channel_id_str)
+        spool = route.spool if route is not None else None
+        if spool is None or spool.is_replaying or not spool.has_pending():
+            return
+
+        def publish(topic, payload, qos, retain):
+            current = self._route_for(channel_id_str) # Pick up a client rebuilt since replay started
+            client = current.client if current is not None else None
+            if client is None or not client.is_connected():
+                return False
+            self._record_mqtt_publish(topic, payload)
+            return client.publish(topic, payload, qos=qos, retain=retain, properties=current.properties).rc == mqtt.MQTT_ERR_SUCCESS
+
+        def replay():
+            logger.info(f"Channel '{channel_id_str}': replaying {spool.pending_bytes()} spooled bytes at up to {spool.replay_rate} msg/s.")
+            # Loop: records spooled while the previous pass was finishing would otherwise wait for the next reconnect
+            while spool.replay(publish, lambda: self.running) and spool.has_pending():
+                pass
+            logger.info(f"Channel '{channel_id_str}': spool replay stopped. {spool.stats()}")
+        threading.Thread(target=replay, name=f"amcb-spool-replay-{channel_id_str}", daemon=True).start()
 
     def onConnection(self, interface, topic=None): # Called when radio connects/disconnects
         if hasattr(interface, '_meshInterface') and interface._meshInterface:
@@ -355,6 +3308,7 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
                 if radio_interface.localNode.has_lora_config:
                     self.lora_config = radio_interface.localNode.lora_config
                     logger.info(f"LoRa Config: Region {self.lora_config.region}, Modem Preset {self.lora_config.modem_preset.name if hasattr(self.lora_config.modem_preset, 'name') else self.lora_config.modem_preset}")
+                    self.tx_scheduler.set_lora_config(self.lora_config)
                 if self.load_config():
                     self.connect_mqtt_clients()
                 return # Successfully handled connection
@@ -370,29 +3324,73 @@ class AMCBPlugin(meshtastic.plugin.Plugin):
         logger.info("Stopping AMCB Plugin. Disconnecting MQTT clients...")
         self.running = False
         with self.config_lock:
-            for channel_id_str, client in self.mqtt_clients.items():
-                if client:
-                    try:
-                        # Publish "offline" will message manually if client is still connected
-                        # This is a good gesture but the broker handles the LWT if disconnect is abrupt
-                        config = self.mqtt_configs.get(channel_id_str)
-                        if config and "will" in config and client.is_connected():
-                             will_cfg = config["will"]
-                             logger.info(f"Publishing final 'offline' status for channel {channel_id_str} to topic {will_cfg['topic']}")
-                             client.publish(will_cfg["topic"], will_cfg.get("payload", "offline"), 
-                                            qos=will_cfg.get("qos",0), retain=will_cfg.get("retain", False))
-                             time.sleep(0.1) # Brief pause to allow publish
-
-                        client.loop_stop()
-                        client.disconnect()
-                    except Exception as e:
-                        logger.error(f"Error disconnecting MQTT client for channel '{channel_id_str}': {e}", exc_info=True)
+            outbound_queues = list(self.outbound_queues.items())
+            self.outbound_queues.clear()
+        for channel_id_str, outbound_queue in outbound_queues: # Drain pending publishes and batches before disconnecting
+            outbound_queue.stop()
+            logger.info(f"Channel '{channel_id_str}' outbound queue stats: {outbound_queue.stats()}")
+        self.publish_batchers.clear()
+        for spool in list(self.spools.values()):
+            spool.close() # Unsent records survive the restart and replay on the next connect
+        self.spools.clear()
+        logger.info(f"Transmit scheduler stats: {self.tx_scheduler.stats()}")
+        self.tx_scheduler.stop()
+        if self._stats_stop_event is not None:
+            self._stats_stop_event.set()
+        if self._watch_stop_event is not None:
+            self._watch_stop_event.set()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        with self.config_lock:
+            # Channels on a shared session share its Will, so publish "offline" once per session
+            for session in self.mqtt_pool.sessions():
+                client = session.client
+                channel_id_str = next(iter(session.channels), None)
+                try:
+                    # Publish "offline" will message manually if client is still connected
+                    # This is a good gesture but the broker handles the LWT if disconnect is abrupt
+                    config = self.mqtt_configs.get(channel_id_str)
+                    if config and "will" in config and client.is_connected():
+                         will_cfg = config["will"]
+                         logger.info(f"Publishing final 'offline' status for channel(s) {', '.join(session.channels)} to topic {will_cfg['topic']}")
+                         client.publish(will_cfg["topic"], will_cfg.get("payload", "offline"),
+                                        qos=will_cfg.get("qos",0), retain=will_cfg.get("retain", False))
+                         time.sleep(0.1) # Brief pause to allow publish
+                except Exception as e:
+                    logger.error(f"Error publishing offline status for channel '{channel_id_str}': {e}", exc_info=True)
+            self.mqtt_pool.close_all()
             self.mqtt_clients.clear()
+            self.routes = ()
+        if self.engine is not None:
+            self.engine.stop() # After close_all, so the loop writes the DISCONNECTs
         logger.info("AMCB Plugin stopped.")
 
 def createPlugin():
     return AMCBPlugin()
 
+# Radio mocks for the standalone test block and benchmarks/bench_amcb.py
+class MockMeshInterface: # Basic mock for testing sendText
+    def __init__(self):
+        self.myInfo = {'my_node_num': 12345678} # Dummy node number
+        self.localNode = self # Simplified
+        self.has_lora_config = False
+        self.lora_config = None
+        self.localConfig = True # Mock that config is present
+
+    def sendText(self, text, destinationId=BROADCAST_ADDR, wantAck=False, channelIndex=0):
+        logger.info(f"[MockMeshInterface.sendText] To: {destinationId}, Chan: {channelIndex}, Text: '{text}'")
+        return True # Simulate success
+
+    def sendData(self, data, destinationId=BROADCAST_ADDR, portNum=256, wantAck=False, channelIndex=0):
+        logger.info(f"[MockMeshInterface.sendData] To: {destinationId}, Chan: {channelIndex}, Port: {portNum}, Bytes: {len(data)}")
+        return True
+
+class MockInterface: # PubSub interface mock
+     def __init__(self, mesh_interface=None):
+        self._meshInterface = mesh_interface or MockMeshInterface()
+
 # Standalone Test Block
 if __name__ == "__main__":
     log_level = logging.DEBUG
@@ -419,22 +3417,6 @@ if __name__ == "__main__":
 
     plugin_instance = AMCBPlugin()
 
-    class MockMeshInterface: # Basic mock for testing sendText
-        def __init__(self):
-            self.myInfo = {'my_node_num': 12345678} # Dummy node number
-            self.localNode = self # Simplified
-            self.has_lora_config = False
-            self.lora_config = None
-            self.localConfig = True # Mock that config is present
-
-        def sendText(self, text, destinationId=BROADCAST_ADDR, channelIndex=0):
-            logger.info(f"[MockMeshInterface.sendText] To: {destinationId}, Chan: {channelIndex}, Text: '{text}'")
-            return True # Simulate success
-
-    class MockInterface: # PubSub interface mock
-         def __init__(self):
-            self._meshInterface = MockMeshInterface()
-
     logger.info("Simulating radio connection...")
     plugin_instance.onConnection(interface=MockInterface()) # Load config, connect MQTT
 
@@ -0,0 +1,324 @@
+"""
+AMCB benchmark suite.
+
+Drives AMCBPlugin.onReceive (Meshtastic -> MQTT) and the MQTT -> Meshtastic
+callback with synthetic packet streams against the embedded LocalBroker and
+amcb.MockMeshInterface, so no radio or external broker is needed.
+
+For every engine x payload_type (x JSON encoder) x QoS x packet shape it reports:
+    msgs/s     packets delivered to the broker per second of wall time
+    ingest     time spent inside onReceive (the radio thread's cost), p50/p99
+    serialize  mean time to serialize one packet, from amcb_serialization_seconds
+    e2e        onReceive call to broker arrival, p50/p99
+    cpu        process CPU time for the run (includes the in-process broker)
+    rss        resident set size after the run
+
+Usage:
+    python benchmarks/bench_amcb.py
+    python benchmarks/bench_amcb.py --packets 5000 --qos 0 1 --shapes text large --json results.json
+    python benchmarks/bench_amcb.py --engine threads asyncio
+    python benchmarks/bench_amcb.py --payload-types full_packet decoded_only --json-encoder json orjson
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # amcb.py lives in the repo root
+
+import paho.mqtt.client as mqtt
+
+import host_standins
+host_standins.install() # Plugin-host modules a stock meshtastic install lacks; real ones win
+
+import amcb
+from local_broker import LocalBroker
+
+try:
+    from meshtastic.protobuf import mesh_pb2, portnums_pb2
+except ImportError:
+    mesh_pb2 = portnums_pb2 = None
+
+OUT_TOPIC = "bench/amcb/out"
+IN_TOPIC = "bench/amcb/in"
+NODE_NUMS = [0x1000 + i for i in range(16)]
+
+
+def _raw_packet(packet_id, from_num, portnum, payload):
+    """MeshPacket protobuf for the 'raw' key, as meshtastic-python attaches it; None if protobufs are unavailable."""
+    if mesh_pb2 is None:
+        return None
+    raw = mesh_pb2.MeshPacket(id=packet_id, to=0xFFFFFFFF, channel=0, hop_limit=3, rx_snr=7.5, rx_rssi=-90)
+    setattr(raw, 'from', from_num)
+    raw.decoded.portnum = portnums_pb2.PortNum.Value(portnum)
+    raw.decoded.payload = payload
+    return raw
+
+
+def _base_packet(i, portnum, payload):
+    from_num = NODE_NUMS[i % len(NODE_NUMS)]
+    return {
+        'from': from_num, 'to': 0xFFFFFFFF, 'fromId': f"!{from_num:08x}", 'toId': '^all',
+        'id': 0x10000 + i, 'channel_index': 0, 'rxTime': 1700000000 + i, 'rxSnr': 7.5, 'rxRssi': -90,
+        'hopLimit': 3, 'raw': _raw_packet(0x10000 + i, from_num, portnum, payload),
+        'decoded': {'portnum': portnum, 'payload': payload},
+    }
+
+
+def text_packet(i):
+    text = f"bench message {i} from the mesh"
+    packet = _base_packet(i, 'TEXT_MESSAGE_APP', text.encode('utf-8'))
+    packet['decoded']['text'] = text
+    return packet
+
+
+def telemetry_packet(i):
+    packet = _base_packet(i, 'TELEMETRY_APP', bytes(range(40)))
+    packet['decoded']['telemetry'] = {
+        'time': 1700000000 + i,
+        'deviceMetrics': {'batteryLevel': 87, 'voltage': 4.05, 'channelUtilization': 12.5,
+                          'airUtilTx': 1.7, 'uptimeSeconds': 3600 + i},
+    }
+    return packet
+
+
+def position_packet(i):
+    packet = _base_packet(i, 'POSITION_APP', bytes(range(32)))
+    packet['decoded']['position'] = {
+        'latitudeI': 450000000 + i, 'longitudeI': -750000000 - i, 'altitude': 120, 'time': 1700000000 + i,
+        'latitude': 45.0 + i * 1e-7, 'longitude': -75.0 - i * 1e-7, 'precisionBits': 32,
+    }
+    return packet
+
+
+def large_packet(i):
+    packet = _base_packet(i, 'PRIVATE_APP', bytes((i + n) % 256 for n in range(233))) # Max Meshtastic payload
+    packet['decoded']['neighbors'] = [{'nodeId': NODE_NUMS[n], 'snr': 5.0 + n, 'lastRxTime': 1700000000 + n}
+                                      for n in range(len(NODE_NUMS))]
+    packet['decoded']['requestId'] = i
+    packet['relayNode'] = 0x42
+    packet['viaMqtt'] = False
+    return packet
+
+
+SHAPES = {'text': text_packet, 'telemetry': telemetry_packet, 'position': position_packet, 'large': large_packet}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Peak, in KiB on Linux
+
+
+def _start_plugin(config, mesh_interface=None):
+    config_dir = tempfile.mkdtemp(prefix="amcb-bench-")
+    plugin = amcb.AMCBPlugin()
+    plugin.config_file_path = os.path.join(config_dir, amcb.CONFIG_FILENAME)
+    with open(plugin.config_file_path, 'w') as f:
+        json.dump(config, f)
+    interface = amcb.MockInterface(mesh_interface)
+    plugin.onConnection(interface=interface)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        clients = list(plugin.mqtt_clients.values())
+        if clients and all(c.is_connected() for c in clients):
+            break
+        time.sleep(0.01)
+    else:
+        raise RuntimeError("plugin did not connect to the local broker")
+    return plugin, interface
+
+
+def run_outbound(broker, payload_type, qos, shape, packets, engine="threads", json_encoder="auto"):
+    arrivals = []
+    done = threading.Event()
+
+    def on_publish(topic, payload, arrival):
+        if topic == OUT_TOPIC:
+            arrivals.append(arrival)
+            if len(arrivals) >= packets:
+                done.set()
+    broker.on_publish = on_publish
+
+    config = {
+        "bridge": {"low_overhead": True, "engine": engine, "json_encoder": json_encoder},
+        "0": {"host": broker.host, "port": broker.port, "topic": OUT_TOPIC, "qos": qos,
+              "payload_type": payload_type,
+              # "block" keeps publish order 1:1 with send order, so arrivals line up with send times
+              "queue": {"max_depth": packets, "overflow": "block", "block_timeout_ms": 10000}},
+    }
+    plugin, interface = _start_plugin(config)
+    generator = SHAPES[shape]
+    stream = [generator(i) for i in range(packets)]
+
+    send_times = []
+    ingest = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for packet in stream:
+        started = time.perf_counter()
+        plugin.onReceive(packet, interface)
+        send_times.append(started)
+        ingest.append(time.perf_counter() - started)
+    completed = done.wait(timeout=60)
+    wall = (arrivals[-1] if arrivals else time.perf_counter()) - wall_start
+    cpu = time.process_time() - cpu_start
+    serialize = plugin.metric_serialize_time.snapshot().get("0", {"count": 0, "sum": 0.0})
+    plugin.stop()
+    broker.on_publish = None
+
+    e2e = sorted(arrival - sent for arrival, sent in zip(arrivals, send_times))
+    ingest.sort()
+    return {
+        "direction": "mesh->mqtt", "engine": engine, "payload_type": payload_type,
+        "json_encoder": amcb.resolve_json_encoder(json_encoder) if payload_type in amcb.JSON_PAYLOAD_TYPES else None,
+        "qos": qos, "shape": shape, "packets": packets, "delivered": len(arrivals), "complete": completed,
+        "msgs_per_s": round(len(arrivals) / wall, 1) if wall > 0 else None,
+        "ingest_p50_us": round(percentile(ingest, 0.50) * 1e6, 1),
+        "ingest_p99_us": round(percentile(ingest, 0.99) * 1e6, 1),
+        "serialize_us": round(serialize["sum"] / serialize["count"] * 1e6, 2) if serialize["count"] else None,
+        "e2e_p50_ms": round(percentile(e2e, 0.50) * 1e3, 3),
+        "e2e_p99_ms": round(percentile(e2e, 0.99) * 1e3, 3),
+        "cpu_s": round(cpu, 3), "rss_mb": round(rss_mb(), 1),
+    }
+
+
+class _TimingMeshInterface(amcb.MockMeshInterface):
+    """MockMeshInterface that timestamps sendText calls instead of logging them."""
+
+    def __init__(self, expected):
+        super().__init__()
+        self.sent_at = {}
+        self.expected = expected
+        self.done = threading.Event()
+
+    def sendText(self, text, destinationId=amcb.BROADCAST_ADDR, wantAck=False, channelIndex=0):
+        self.sent_at[text] = time.perf_counter()
+        if len(self.sent_at) >= self.expected:
+            self.done.set()
+        return True
+
+
+def run_inbound(broker, qos, packets, engine="threads"):
+    mesh_interface = _TimingMeshInterface(packets)
+    config = {
+        "bridge": {"low_overhead": True, "engine": engine},
+        "0": {"host": broker.host, "port": broker.port, "topic": OUT_TOPIC, "qos": qos,
+              # Pacing effectively off: this measures bridge overhead, not the duty-cycle budget
+              "mqtt_to_meshtastic": {"subscribe_topic": IN_TOPIC, "duty_cycle_percent": 100,
+                                     "burst_airtime_ms": 10**9, "dedup_window_s": 0.001, "max_queue": packets}},
+    }
+    plugin, _ = _start_plugin(config, mesh_interface)
+    time.sleep(0.2) # Let the subscription settle
+
+    client_id = f"amcb-bench-publisher-{os.getpid()}"
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id)
+    else:
+        publisher = mqtt.Client(client_id=client_id)
+    publisher.max_inflight_messages_set(1000)
+    publisher.connect(broker.host, broker.port)
+    publisher.loop_start()
+
+    published_at = {}
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(packets):
+        text = f"inbound {i}"
+        published_at[text] = time.perf_counter()
+        publisher.publish(IN_TOPIC, text.encode('utf-8'), qos=qos)
+    completed = mesh_interface.done.wait(timeout=60)
+    wall = (max(mesh_interface.sent_at.values()) if mesh_interface.sent_at else time.perf_counter()) - wall_start
+    cpu = time.process_time() - cpu_start
+    publisher.loop_stop()
+    publisher.disconnect()
+    plugin.stop()
+
+    e2e = sorted(sent - published_at[text] for text, sent in mesh_interface.sent_at.items())
+    return {
+        "direction": "mqtt->mesh", "engine": engine, "payload_type": "text", "json_encoder": None,
+        "qos": qos, "shape": "text", "packets": packets, "delivered": len(mesh_interface.sent_at), "complete": completed,
+        "msgs_per_s": round(len(mesh_interface.sent_at) / wall, 1) if wall > 0 else None,
+        "ingest_p50_us": None, "ingest_p99_us": None, "serialize_us": None,
+        "e2e_p50_ms": round(percentile(e2e, 0.50) * 1e3, 3),
+        "e2e_p99_ms": round(percentile(e2e, 0.99) * 1e3, 3),
+        "cpu_s": round(cpu, 3), "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def available_payload_types():
+    types = []
+    for payload_type in amcb.PAYLOAD_TYPES:
+        requirement = amcb.PAYLOAD_TYPE_REQUIREMENTS.get(payload_type)
+        if requirement and requirement[0]() is None:
+            continue
+        if payload_type in ('protobuf', 'service_envelope') and mesh_pb2 is None:
+            continue
+        types.append(payload_type)
+    return types
+
+
+def print_table(results):
+    columns = ["direction", "engine", "payload_type", "json_encoder", "qos", "shape", "delivered", "msgs_per_s",
+               "ingest_p50_us", "ingest_p99_us", "serialize_us", "e2e_p50_ms", "e2e_p99_ms", "cpu_s", "rss_mb"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for result in results:
+        print("  ".join(str(result[c]).ljust(widths[c]) for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packets", type=int, default=2000, help="packets per scenario (default: 2000)")
+    parser.add_argument("--payload-types", nargs="+", default=None, help="payload_type values to run (default: all available)")
+    parser.add_argument("--qos", nargs="+", type=int, default=[0, 1], help="QoS levels to run (default: 0 1)")
+    parser.add_argument("--shapes", nargs="+", choices=sorted(SHAPES), default=sorted(SHAPES), help="packet shapes to run")
+    parser.add_argument("--engine", nargs="+", choices=amcb.ENGINES, default=["threads"], help="bridge engines to run (default: threads)")
+    parser.add_argument("--json-encoder", nargs="+", choices=amcb.JSON_ENCODER_CHOICES, default=["auto"],
+                        help="bridge json_encoder values to run for the JSON payload types (default: auto)")
+    parser.add_argument("--skip-inbound", action="store_true", help="skip the MQTT -> Meshtastic scenarios")
+    parser.add_argument("--json", dest="json_path", help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger(amcb.__name__).setLevel(logging.WARNING)
+    payload_types = args.payload_types or available_payload_types()
+    if "orjson" in args.json_encoder and amcb.orjson is None:
+        parser.error("--json-encoder orjson requires the orjson package")
+
+    results = []
+    with LocalBroker() as broker:
+        for engine in args.engine:
+            for payload_type in payload_types:
+                # The encoder only matters to the JSON payload types; run the others once
+                encoders = args.json_encoder if payload_type in amcb.JSON_PAYLOAD_TYPES else ["auto"]
+                for json_encoder in encoders:
+                    for qos in args.qos:
+                        for shape in args.shapes:
+                            results.append(run_outbound(broker, payload_type, qos, shape, args.packets, engine, json_encoder))
+            if not args.skip_inbound:
+                for qos in args.qos:
+                    results.append(run_inbound(broker, qos, args.packets, engine))
+
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r["complete"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
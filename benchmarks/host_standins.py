@@ -0,0 +1,40 @@
+"""
+Stand-ins for the Meshtastic plugin-host modules amcb imports.
+
+amcb runs inside a plugin-capable Meshtastic host that provides
+meshtastic.plugin, the meshtastic.BROADCAST_ADDR module and
+meshtastic.util.ps_packet. A stock `pip install meshtastic` has none of them,
+so install() registers minimal versions of whichever are missing. Real host
+modules are always preferred. Used by the benchmarks and the tests; everything
+else (meshtastic protobufs, paho-mqtt) must be installed for real.
+"""
+
+import sys
+import types
+
+
+def install():
+    import meshtastic
+    import meshtastic.util
+
+    try:
+        import meshtastic.plugin
+    except ImportError:
+        plugin_module = types.ModuleType("meshtastic.plugin")
+
+        class Plugin:
+            def __init__(self):
+                pass
+
+        plugin_module.Plugin = Plugin
+        sys.modules["meshtastic.plugin"] = meshtastic.plugin = plugin_module
+
+    try:
+        import meshtastic.BROADCAST_ADDR
+    except ImportError:
+        broadcast_module = types.ModuleType("meshtastic.BROADCAST_ADDR")
+        broadcast_module.BROADCAST_ADDR = "^all"
+        sys.modules["meshtastic.BROADCAST_ADDR"] = broadcast_module
+
+    if not hasattr(meshtastic.util, "ps_packet"):
+        meshtastic.util.ps_packet = None
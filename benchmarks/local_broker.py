@@ -0,0 +1,270 @@
+"""
+Minimal in-process MQTT broker used as a local stand-in by the AMCB benchmarks.
+
+Speaks enough MQTT 3.1.1 and 5.0 for paho-mqtt clients: CONNECT (with Will),
+PUBLISH at QoS 0/1/2, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, retained
+messages, PINGREQ and DISCONNECT. Messages are delivered to subscribers at
+QoS 0. Not a production broker: no persistence, auth or flow control.
+"""
+
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _read_varint(data, offset):
+    multiplier, value = 1, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value, offset
+        multiplier *= 128
+
+
+def _read_string(data, offset):
+    (length,) = struct.unpack_from('!H', data, offset)
+    return data[offset + 2:offset + 2 + length], offset + 2 + length
+
+
+def _packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.broker = self.server.broker
+        self.protocol_level = 4
+        self.subscriptions = set()
+        self.will = None
+        self.send_lock = threading.Lock()
+        self.buffer = self.request.makefile('rb')
+
+    def send(self, data):
+        with self.send_lock:
+            self.request.sendall(data)
+
+    def _read_packet(self):
+        first = self.buffer.read(1)
+        if not first:
+            return None, None, None
+        multiplier, length = 1, 0
+        while True:
+            byte = self.buffer.read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = self.buffer.read(length) if length else b''
+        return first[0] >> 4, first[0] & 0x0F, body
+
+    def handle(self):
+        graceful = False
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if packet_type is None:
+                    break
+                if packet_type == CONNECT:
+                    self._handle_connect(body)
+                elif packet_type == PUBLISH:
+                    self._handle_publish(flags, body)
+                elif packet_type == PUBREL:
+                    self.send(_packet(PUBCOMP, 0, body[:2]))
+                elif packet_type == SUBSCRIBE:
+                    self._handle_subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._handle_unsubscribe(body)
+                elif packet_type == PINGREQ:
+                    self.send(_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    graceful = True
+                    break
+        except (OSError, IndexError, struct.error):
+            pass
+        finally:
+            self.broker._detach(self)
+            if not graceful and self.will is not None:
+                self.broker.route(*self.will)
+
+    def _handle_connect(self, body):
+        _, offset = _read_string(body, 0) # Protocol name
+        self.protocol_level = body[offset]
+        connect_flags = body[offset + 1]
+        offset += 4 # Level, flags, keepalive
+        if self.protocol_level == 5:
+            properties_length, offset = _read_varint(body, offset)
+            offset += properties_length
+        _, offset = _read_string(body, offset) # Client id
+        if connect_flags & 0x04:
+            if self.protocol_level == 5:
+                properties_length, offset = _read_varint(body, offset)
+                offset += properties_length
+            will_topic, offset = _read_string(body, offset)
+            will_payload, offset = _read_string(body, offset)
+            self.will = (will_topic.decode('utf-8'), will_payload, bool(connect_flags & 0x20), b'')
+        self.broker._attach(self)
+        self.send(_packet(CONNACK, 0, b'\x00\x00\x00' if self.protocol_level == 5 else b'\x00\x00'))
+
+    def _handle_publish(self, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        topic, offset = _read_string(body, 0)
+        packet_id = body[offset:offset + 2] if qos else b''
+        offset += len(packet_id)
+        properties = b''
+        if self.protocol_level == 5:
+            properties_length, properties_start = _read_varint(body, offset)
+            properties = body[properties_start:properties_start + properties_length]
+            offset = properties_start + properties_length
+        self.broker.route(topic.decode('utf-8'), body[offset:], retain, properties)
+        if qos == 1:
+            self.send(_packet(PUBACK, 0, packet_id))
+        elif qos == 2:
+            self.send(_packet(PUBREC, 0, packet_id))
+
+    def _handle_subscribe(self, body):
+        packet_id = body[:2]
+        offset = 2
+        if self.protocol_level == 5:
+            properties_length, offset = _read_varint(body, offset)
+            offset += properties_length
+        granted = bytearray()
+        new_filters = []
+        while offset < len(body):
+            topic_filter, offset = _read_string(body, offset)
+            offset += 1 # Subscription options; everything is delivered at QoS 0
+            new_filters.append(topic_filter.decode('utf-8'))
+            granted.append(0)
+        self.subscriptions.update(new_filters)
+        suback = packet_id + (b'\x00' if self.protocol_level == 5 else b'') + bytes(granted)
+        self.send(_packet(SUBACK, 0, suback))
+        for topic, (payload, properties) in self.broker.retained_for(new_filters):
+            self.deliver(topic, payload, properties, retain=True)
+
+    def _handle_unsubscribe(self, body):
+        packet_id = body[:2]
+        offset = 2
+        if self.protocol_level == 5:
+            properties_length, offset = _read_varint(body, offset)
+            offset += properties_length
+        count = 0
+        while offset < len(body):
+            topic_filter, offset = _read_string(body, offset)
+            self.subscriptions.discard(topic_filter.decode('utf-8'))
+            count += 1
+        reasons = (b'\x00' + b'\x00' * count) if self.protocol_level == 5 else b''
+        self.send(_packet(UNSUBACK, 0, packet_id + reasons))
+
+    def deliver(self, topic, payload, properties, retain=False):
+        topic_bytes = topic.encode('utf-8')
+        body = struct.pack('!H', len(topic_bytes)) + topic_bytes
+        if self.protocol_level == 5:
+            body += _encode_length(len(properties)) + properties
+        try:
+            self.send(_packet(PUBLISH, 0x01 if retain else 0x00, body + payload))
+        except OSError:
+            pass
+
+
+class LocalBroker:
+    """
+    Threaded MQTT broker on 127.0.0.1. on_publish, if set, is called as
+    on_publish(topic, payload, arrival_time) for every PUBLISH received,
+    which lets benchmarks timestamp broker arrival without a subscriber.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, on_publish=None):
+        self.on_publish = on_publish
+        self.messages_received = 0
+        self._clients = set()
+        self._retained = {}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), _ClientHandler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._server.broker = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="local-mqtt-broker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _attach(self, client):
+        with self._lock:
+            self._clients.add(client)
+
+    def _detach(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def retained_for(self, topic_filters):
+        with self._lock:
+            return [(topic, message) for topic, message in self._retained.items()
+                    if any(topic_matches(f, topic) for f in topic_filters)]
+
+    def route(self, topic, payload, retain=False, properties=b''):
+        arrival = time.perf_counter()
+        with self._lock:
+            self.messages_received += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, properties)
+                else:
+                    self._retained.pop(topic, None)
+            subscribers = [c for c in self._clients if any(topic_matches(f, topic) for f in c.subscriptions)]
+        if self.on_publish is not None:
+            self.on_publish(topic, payload, arrival)
+        for client in subscribers:
+            client.deliver(topic, payload, properties)
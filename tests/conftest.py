@@ -0,0 +1,16 @@
+"""
+Makes amcb importable for the tests: the repo root goes on sys.path, and the
+plugin-host modules a stock meshtastic package lacks are replaced by the
+stand-ins in benchmarks/host_standins.py.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # amcb.py lives in the repo root
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import host_standins
+
+host_standins.install()
@@ -0,0 +1,53 @@
+import threading
+import types
+
+import amcb
+
+BASE = {"host": "broker.local", "port": 1883, "topic": "mesh/out"}
+
+
+def _with_subscription(config, topic="mesh/in"):
+    return dict(config, mqtt_to_meshtastic={"subscribe_topic": topic})
+
+
+def test_diff_configs_classifies_changes():
+    old = {"0": dict(BASE), "1": dict(BASE), "2": _with_subscription(BASE), "3": dict(BASE), "4": dict(BASE)}
+    new = {"0": dict(BASE),                                         # unchanged
+           "1": dict(BASE, host="other.local"),                     # broker changed
+           "2": _with_subscription(BASE, "mesh/in2"),               # subscription changed
+           "3": dict(BASE, topic="mesh/elsewhere"),                 # in-place edit
+           "5": dict(BASE)}                                         # added; "4" removed
+    diff = amcb.diff_configs(old, new)
+    assert diff.added == ["5"]
+    assert diff.removed == ["4"]
+    assert diff.reconnect == ["1"]
+    assert diff.resubscribe == ["2"]
+    assert diff.updated == ["3"]
+
+
+def test_diff_configs_treats_will_and_credentials_as_session_changes():
+    old = {"0": dict(BASE), "1": dict(BASE)}
+    new = {"0": dict(BASE, will={"topic": "status", "payload": "gone"}), "1": dict(BASE, username="bridge")}
+    assert amcb.diff_configs(old, new).reconnect == ["0", "1"]
+
+
+def test_diff_configs_of_identical_configs_is_empty():
+    configs = {"0": _with_subscription(BASE)}
+    assert not any(amcb.diff_configs(configs, dict(configs)))
+
+
+def test_mqtt_message_callback_does_not_need_config_lock():
+    # A reload holds config_lock while pool.release() joins paho's network thread, which runs this callback
+    plugin = amcb.AMCBPlugin()
+    try:
+        plugin.mesh_interface = amcb.MockMeshInterface()
+        plugin.mqtt_configs = {"0": _with_subscription(BASE)}
+        callback = plugin._on_message_from_mqtt("0")
+        message = types.SimpleNamespace(topic="mesh/in", payload=b"hello", properties=None)
+        with plugin.config_lock:
+            worker = threading.Thread(target=callback, args=(None, None, message), daemon=True)
+            worker.start()
+            worker.join(5)
+            assert not worker.is_alive()
+    finally:
+        plugin.stop()
@@ -0,0 +1,57 @@
+import time
+import types
+
+import pytest
+
+import amcb
+
+
+@pytest.mark.parametrize("packet", [{}, {'from': 5}, {'from': 5, 'id': 0}, {'id': 9}])
+def test_packets_without_sender_or_id_have_no_key(packet):
+    assert amcb.packet_dedup_key(packet) is None
+
+
+def test_repeat_within_window_is_a_duplicate():
+    cache = amcb.PacketDedupCache(window_s=10)
+    assert cache.add((5, 9), now=100.0)
+    assert not cache.add((5, 9), now=109.0)
+    assert cache.add((5, 9), now=111.0) # Window expired
+    assert cache.stats()["duplicates"] == 1
+
+
+def test_oldest_keys_are_forgotten_beyond_max_entries():
+    cache = amcb.PacketDedupCache(window_s=60, max_entries=2)
+    for key in ((1, 1), (1, 2), (1, 3)):
+        assert cache.add(key)
+    assert (1, 1) not in cache
+    assert (1, 2) in cache and (1, 3) in cache
+    assert cache.stats()["entries"] == 2
+
+
+def test_lowest_gateway_id_wins_a_claim_in_any_order():
+    cache = amcb.PacketDedupCache()
+    for gateway_id in ("!00000002", "!00000001", "!00000003"):
+        cache.record_claim((5, 9), gateway_id)
+    assert cache.claimed_by((5, 9)) == "!00000001"
+    assert cache.claimed_by((5, 10)) is None
+
+
+def test_claims_expire_with_the_window():
+    cache = amcb.PacketDedupCache(window_s=10)
+    cache.record_claim((5, 9), "!00000001", now=time.monotonic() - 11)
+    assert cache.claimed_by((5, 9)) is None
+
+
+def test_claim_messages_are_recorded_and_decide_the_winner():
+    plugin = amcb.AMCBPlugin()
+    try:
+        plugin.dedup_cache = amcb.PacketDedupCache()
+        plugin._on_claim_message(None, None, types.SimpleNamespace(topic="amcb/claims/000000a1/0000beef", payload=b"!00000001"))
+        plugin._on_claim_message(None, None, types.SimpleNamespace(topic="amcb/claims/not-hex", payload=b"!00000000")) # Ignored
+        assert plugin.dedup_cache.claimed_by((0xa1, 0xbeef)) == "!00000001"
+        assert plugin.dedup_cache.stats()["claims"] == 1
+        assert not plugin._won_claim(((0xa1, 0xbeef), "!00000002"))
+        assert plugin._won_claim(((0xa1, 0xbeef), "!00000001"))
+        assert plugin._won_claim(((0xa1, 0xbef0), "!00000002")) # Unclaimed packets are ours
+    finally:
+        plugin.stop()
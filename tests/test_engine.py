@@ -0,0 +1,34 @@
+import json
+import threading
+import time
+
+import amcb
+
+
+def _thread_names():
+    return [thread.name for thread in threading.enumerate()]
+
+
+def test_engine_switches_both_ways_without_leaking_loops(tmp_path):
+    plugin = amcb.AMCBPlugin()
+    plugin.config_file_path = str(tmp_path / "mqtt_config.json")
+    try:
+        for engine in ("asyncio", "threads", "asyncio", "threads"):
+            with open(plugin.config_file_path, 'w') as f:
+                json.dump({"bridge": {"engine": engine}}, f)
+            assert plugin.load_config()
+            time.sleep(0.1)
+            names = _thread_names()
+            if engine == "asyncio":
+                assert isinstance(plugin.engine, amcb.AsyncioEngine)
+                assert plugin.tx_scheduler._loop is plugin.engine.loop
+                assert names.count("amcb-asyncio") == 1
+                assert "amcb-tx-scheduler" not in names
+            else:
+                assert plugin.engine is None
+                assert plugin.mqtt_pool.engine is None
+                assert plugin.tx_scheduler._loop is None
+                assert "amcb-asyncio" not in names
+                assert names.count("amcb-tx-scheduler") == 1
+    finally:
+        plugin.stop()
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import amcb
+
+
+def _packet(portnum='TEXT_MESSAGE_APP', sender=0x10, **extra):
+    return dict({'from': sender, 'fromId': f"!{sender:08x}", 'rxSnr': 6.5,
+                 'decoded': {'portnum': portnum, 'text': 'hi', 'bitfield': 1}}, **extra)
+
+
+def test_empty_filter_compiles_to_none():
+    assert amcb.compile_packet_filter({}) is None
+
+
+def test_filter_allows_and_excludes_portnums():
+    accept = amcb.compile_packet_filter({"portnums": ["TEXT_MESSAGE_APP", "POSITION_APP"], "exclude_portnums": ["POSITION_APP"]})
+    assert accept(_packet('TEXT_MESSAGE_APP'))
+    assert not accept(_packet('POSITION_APP'))
+    assert not accept(_packet('TELEMETRY_APP'))
+    assert not accept({'from': 1}) # Undecrypted packets have no port number
+
+
+def test_filter_matches_sender_by_number_or_id():
+    accept = amcb.compile_packet_filter({"from_nodes": [0x10, 0x20], "exclude_from_nodes": [0x20]})
+    assert accept(_packet(sender=0x10))
+    assert accept({'fromId': '!00000010', 'decoded': {}})
+    assert not accept(_packet(sender=0x20))
+    assert not accept(_packet(sender=0x30))
+
+
+def test_projection_keeps_only_selected_paths():
+    project = amcb.compile_projection(["fromId", "decoded.text", "missing", "decoded.absent"])
+    assert project(_packet()) == {'fromId': '!00000010', 'decoded': {'text': 'hi'}}
+
+
+def test_projection_parent_wins_over_children():
+    project = amcb.compile_projection(["decoded.text", "decoded"])
+    assert project(_packet())['decoded'] == _packet()['decoded']
+
+
+def _load_channel(tmp_path, channel):
+    plugin = amcb.AMCBPlugin()
+    plugin.config_file_path = str(tmp_path / "mqtt_config.json")
+    with open(plugin.config_file_path, 'w') as f:
+        json.dump({"0": dict({"host": "127.0.0.1", "port": 1, "topic": "mesh/out"}, **channel)}, f)
+    try:
+        assert plugin.load_config()
+        return plugin.mqtt_configs["0"], plugin.packet_filters["0"]
+    finally:
+        plugin.stop()
+
+
+@pytest.mark.parametrize("payload_type", amcb.DECODED_PAYLOAD_TYPES)
+def test_decoded_payload_types_drop_top_level_fields(tmp_path, payload_type):
+    config, (_, projection) = _load_channel(tmp_path, {"payload_type": payload_type, "fields": ["fromId", "rxSnr", "decoded.text"]})
+    assert config["fields"] == ["decoded.text"]
+    assert projection(_packet()) == {'decoded': {'text': 'hi'}}
+
+
+def test_decoded_payload_type_without_decoded_fields_sends_whole_decoded(tmp_path):
+    config, (_, projection) = _load_channel(tmp_path, {"payload_type": "decoded_only", "fields": ["fromId", "rxSnr"]})
+    assert "fields" not in config
+    assert projection is None
+
+
+def test_full_packet_keeps_top_level_fields(tmp_path):
+    config, (_, projection) = _load_channel(tmp_path, {"payload_type": "full_packet", "fields": ["fromId", "decoded.text"]})
+    assert config["fields"] == ["fromId", "decoded.text"]
+    assert json.loads(amcb.build_serializer("full_packet", config, projection=projection)(_packet())) == \
+        {'fromId': '!00000010', 'decoded': {'text': 'hi'}}
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import amcb
+
+pytestmark = pytest.mark.skipif(amcb.orjson is None, reason="orjson is not installed")
+
+
+class _Opaque:
+    def __str__(self):
+        return "opaque"
+
+
+def _packet():
+    raw = amcb.mesh_pb2.MeshPacket(id=7) if amcb.mesh_pb2 is not None else _Opaque()
+    return {'from': 0xa1b2c3d4, 'fromId': '!a1b2c3d4', 'id': 7, 'rxSnr': 6.25, 'rxRssi': -97, 'viaMqtt': False,
+            'hopStart': None, 'raw': raw,
+            'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'payload': b'\x00\xffh\xc3\xa9', 'text': 'hé ☃ \U0001f4e1',
+                        'position': {'latitudeI': 1, 'raw': _Opaque()}, 'bitfield': 1},
+            5: 'int key', 'big': 2**70, 'nested': [[1, 2.5, "x"], {'opaque': _Opaque()}]}
+
+
+def test_encoders_produce_the_same_document():
+    packet = _packet()
+    assert json.loads(amcb._encode_orjson(packet)) == json.loads(amcb._encode_json(packet))
+
+
+def test_integer_beyond_64_bits_falls_back_to_stdlib():
+    assert json.loads(amcb._encode_orjson({'big': 2**70})) == {'big': 2**70}
+
+
+@pytest.mark.parametrize("payload_type", amcb.JSON_PAYLOAD_TYPES)
+def test_serializers_agree_across_encoders(payload_type):
+    packets = [_packet(), {'decoded': {'portnum': 'POSITION_APP', 'payload': b'\x01'}}]
+    for packet in packets:
+        by_json = amcb.build_serializer(payload_type, {}, json_encoder='json')(packet)
+        by_orjson = amcb.build_serializer(payload_type, {}, json_encoder='orjson')(packet)
+        if payload_type == 'text_payload_only' and 'text' in packet['decoded']:
+            assert by_orjson == by_json # Raw text, not JSON
+        else:
+            assert json.loads(by_orjson) == json.loads(by_json)
@@ -0,0 +1,68 @@
+import json
+import types
+
+import pytest
+
+import amcb
+
+NODE_NUM = 12345678 # MockMeshInterface's node number
+
+
+@pytest.fixture
+def plugin(tmp_path):
+    plugin = amcb.AMCBPlugin()
+    plugin.config_file_path = str(tmp_path / "mqtt_config.json")
+    with open(plugin.config_file_path, 'w') as f:
+        json.dump({"0": {"host": "127.0.0.1", "port": 1, "topic": "mesh/out",
+                         "mqtt_to_meshtastic": {"subscribe_topic": "mesh/#"}}}, f)
+    assert plugin.load_config()
+    yield plugin
+    plugin.stop()
+
+
+def _message(topic, payload, properties=None):
+    return types.SimpleNamespace(topic=topic, payload=payload, properties=properties)
+
+
+def test_own_publish_is_recognised_when_it_comes_back(plugin):
+    plugin._record_mqtt_publish("mesh/out", b"hello")
+    assert plugin._is_mqtt_echo(_message("mesh/out", b"hello"))
+    assert not plugin._is_mqtt_echo(_message("mesh/out", b"other"))
+    assert not plugin._is_mqtt_echo(_message("mesh/elsewhere", b"hello"))
+
+
+def test_publishes_no_subscription_matches_are_not_remembered(plugin):
+    plugin._record_mqtt_publish("other/out", b"hello")
+    assert plugin.mqtt_echoes.stats()["entries"] == 0
+
+
+def test_origin_marker_identifies_own_messages(plugin):
+    properties = types.SimpleNamespace(UserProperty=[(amcb.ORIGIN_PROPERTY, plugin._origin_id())])
+    assert plugin._is_mqtt_echo(_message("mesh/x", b"never recorded", properties))
+    properties.UserProperty = [(amcb.ORIGIN_PROPERTY, "!someoneelse")]
+    assert not plugin._is_mqtt_echo(_message("mesh/x", b"never recorded", properties))
+
+
+def test_mesh_sends_are_recognised_by_packet_id_and_text(plugin):
+    mesh_interface = amcb.MockMeshInterface()
+    mesh_interface.sendText = lambda **kwargs: types.SimpleNamespace(id=77)
+    plugin.mesh_interface = mesh_interface
+    message = amcb.MeshMessage(amcb.BROADCAST_ADDR, 0, None, b"hi", False, True)
+    plugin._mesh_sender(message, b"hi")()
+
+    assert plugin._is_mesh_echo({'from': NODE_NUM, 'id': 77}, 0)
+    assert plugin._is_mesh_echo({'from': NODE_NUM, 'id': 78, 'decoded': {'text': 'hi'}}, 0)
+    assert not plugin._is_mesh_echo({'from': NODE_NUM, 'id': 78, 'decoded': {'text': 'hi'}}, 1)
+    assert not plugin._is_mesh_echo({'from': NODE_NUM + 1, 'id': 77}, 0)
+
+
+def test_disabled_loop_prevention_keeps_no_fingerprints(plugin):
+    with open(plugin.config_file_path) as f:
+        config = json.load(f)
+    config["bridge"] = {"loop_prevention": {"enabled": False}}
+    with open(plugin.config_file_path, 'w') as f:
+        json.dump(config, f)
+    assert plugin.load_config()
+    assert plugin.mesh_echoes is None and plugin.mqtt_echoes is None
+    plugin._record_mqtt_publish("mesh/out", b"hello")
+    assert not plugin._is_mqtt_echo(_message("mesh/out", b"hello"))
@@ -0,0 +1,53 @@
+import pytest
+
+import amcb
+
+M2M_CONF = {"target_node_id": "!a1b2c3d4", "target_channel_index": 0}
+
+
+def _text_packet(text, sender=5):
+    return {'from': sender, 'channel_index': 0, 'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'text': text}}
+
+
+@pytest.mark.parametrize("payload", [b'{"text": "x", "to": "^all"}', b'{"text": "x", "to": 4294967295}'])
+def test_explicit_broadcast_overrides_target_node(payload):
+    assert amcb.parse_mesh_message('json', payload, M2M_CONF).destination == amcb.BROADCAST_ADDR
+
+
+@pytest.mark.parametrize("payload", [b'{"text": "x"}', b'{"text": "x", "to": null}'])
+def test_missing_destination_uses_target_node(payload):
+    assert amcb.parse_mesh_message('json', payload, M2M_CONF).destination == "!a1b2c3d4"
+
+
+@pytest.mark.parametrize("channel", [-1, amcb.MAX_CHANNELS, 42, True])
+def test_json_channel_out_of_range_is_rejected(channel):
+    with pytest.raises(ValueError):
+        amcb.parse_mesh_message('json', f'{{"text": "x", "channel": {str(channel).lower()}}}'.encode(), M2M_CONF)
+
+
+def test_interleaved_text_fragment_sets_reassemble_separately():
+    first, _ = amcb.fragment_payload(b'a' * 500, True, message_id=1)
+    second, _ = amcb.fragment_payload(b'b' * 500, True, message_id=2)
+    assert len(first) == len(second) == 3
+    reassembler = amcb.FragmentReassembler()
+    rebuilt = []
+    for fragment in (first[0], second[0], first[1], second[1], second[2], first[2]):
+        packet = reassembler.add(_text_packet(fragment.decode('utf-8')))
+        if packet is not None:
+            rebuilt.append(packet['decoded']['text'])
+    assert rebuilt == ['b' * 500, 'a' * 500]
+
+
+def test_repeated_fragment_index_does_not_overwrite():
+    reassembler = amcb.FragmentReassembler()
+    assert reassembler.add(_text_packet("[1/2 #01] first")) is None
+    assert reassembler.add(_text_packet("[1/2 #01] other")) is None
+    packet = reassembler.add(_text_packet("[2/2 #01] second"))
+    assert packet['decoded']['text'] == "firstsecond"
+    assert reassembler.duplicates == 1
+
+
+def test_text_marker_without_id_is_not_a_fragment():
+    reassembler = amcb.FragmentReassembler()
+    packet = _text_packet("[1/2] not a fragment")
+    assert reassembler.add(packet) is packet
@@ -0,0 +1,170 @@
+import time
+import types
+
+import pytest
+
+import amcb
+
+HOLD_S = 60 # ready_at this far ahead keeps items queued until stop()
+
+
+@pytest.fixture(params=["threads", "asyncio"])
+def make_queue(request):
+    """Builds OutboundQueues on a worker thread or, for "asyncio", on an AsyncioEngine loop."""
+    engine = amcb.AsyncioEngine() if request.param == "asyncio" else None
+    queues = []
+
+    def make(handler, **kwargs):
+        queue = amcb.OutboundQueue("0", handler, loop=engine.loop if engine else None, **kwargs)
+        queues.append(queue)
+        return queue
+    yield make
+    for queue in queues:
+        queue.stop()
+    if engine is not None:
+        engine.stop()
+
+
+def _recorder():
+    handled = []
+
+    def handler(item):
+        handled.append(item)
+        return True
+    return handled, handler
+
+
+def _fill(queue, items):
+    """Puts items held until stop(); returns put()'s results."""
+    return [queue.put(item, ready_at=time.monotonic() + HOLD_S) for item in items]
+
+
+def test_drop_oldest_discards_the_front_of_a_full_queue(make_queue):
+    handled, handler = _recorder()
+    queue = make_queue(handler, max_depth=3, overflow="drop_oldest")
+    assert _fill(queue, [1, 2, 3, 4, 5]) == [True] * 5
+    queue.stop()
+    assert handled == [3, 4, 5]
+    assert queue.stats() == {"depth": 0, "enqueued": 5, "dropped": 2, "published": 3, "failed": 0, "skipped": 0}
+
+
+def test_drop_newest_rejects_incoming_items(make_queue):
+    handled, handler = _recorder()
+    queue = make_queue(handler, max_depth=3, overflow="drop_newest")
+    assert _fill(queue, [1, 2, 3, 4, 5]) == [True, True, True, False, False]
+    queue.stop()
+    assert handled == [1, 2, 3]
+    assert queue.stats() == {"depth": 0, "enqueued": 3, "dropped": 2, "published": 3, "failed": 0, "skipped": 0}
+
+
+def test_block_gives_up_after_timeout(make_queue):
+    handled, handler = _recorder()
+    queue = make_queue(handler, max_depth=1, overflow="block", block_timeout_ms=100)
+    started = time.monotonic()
+    assert _fill(queue, [1, 2]) == [True, False]
+    assert time.monotonic() - started >= 0.1
+    queue.stop()
+    assert handled == [1]
+    assert queue.stats()["dropped"] == 1
+
+
+def test_block_waits_for_room(make_queue):
+    handled, handler = _recorder()
+    queue = make_queue(handler, max_depth=1, overflow="block", block_timeout_ms=5000)
+    assert queue.put(1, ready_at=time.monotonic() + 0.1)
+    assert queue.put(2) # Blocks until the worker takes 1
+    queue.stop()
+    assert handled == [1, 2]
+    assert queue.stats()["dropped"] == 0
+
+
+def test_failed_and_raising_items_count_as_failed(make_queue):
+    def handler(item):
+        if item == "raise":
+            raise ValueError(item)
+        return item == "ok"
+    queue = make_queue(handler)
+    for item in ("ok", "fail", "raise", "ok"):
+        assert queue.put(item)
+    queue.stop()
+    stats = queue.stats()
+    assert (stats["enqueued"], stats["published"], stats["failed"]) == (4, 2, 2)
+
+
+def test_stop_drains_queued_items_and_rejects_new_ones(make_queue):
+    handled, handler = _recorder()
+    idle_calls = []
+    queue = make_queue(handler, idle_handler=lambda final: idle_calls.append(final))
+    _fill(queue, range(10))
+    queue.stop() # Held items are handed over without waiting for ready_at
+    assert handled == list(range(10))
+    assert idle_calls[-1] is True # Final idle call, where batchers flush
+    assert not queue.put(10)
+    assert queue.stats()["enqueued"] == 10
+
+
+def _client(connected=True):
+    client = types.SimpleNamespace(published=[])
+    client.is_connected = lambda: connected
+    client.publish = lambda topic, payload, **kwargs: client.published.append(payload)
+    return client
+
+
+def _plugin_route(client, batch=None):
+    """A plugin with one channel route whose queue feeds _publish_route_item, as _sync_outbound_queues wires it."""
+    plugin = amcb.AMCBPlugin()
+    batcher = None
+    if batch is not None:
+        batcher = amcb.PublishBatcher("0", plugin._publish_payload)
+        batcher.configure(dict(amcb.DEFAULT_BATCH_CONFIG, **batch))
+    queue = amcb.OutboundQueue("0", plugin._publish_route_item, idle_handler=batcher.poll if batcher else None)
+    if batcher is not None:
+        batcher.record = queue.record
+    route = amcb.Route("0", client, "mesh/out", 0, False, "text_payload_only", lambda packet: packet.encode(), queue, batcher=batcher)
+    return plugin, route
+
+
+def _put(route, packet, claim=None):
+    assert route.queue.put((route, route.topic, packet, 0.0, claim))
+
+
+def test_batched_packets_count_when_the_batch_is_published():
+    client = _client()
+    plugin, route = _plugin_route(client, batch={"max_messages": 3})
+    try:
+        for packet in ("a", "b", "c", "d"):
+            _put(route, packet)
+        route.queue.stop() # Flushes the pending "d"
+        assert route.queue.stats()["published"] == 4
+        assert route.batcher.batches_published == 2
+        assert len(client.published) == 2
+    finally:
+        plugin.stop()
+
+
+def test_batched_packets_that_fail_to_publish_count_as_failed():
+    plugin, route = _plugin_route(_client(connected=False), batch={"max_messages": 10})
+    try:
+        _put(route, "a")
+        _put(route, "b")
+        route.queue.stop()
+        stats = route.queue.stats()
+        assert (stats["published"], stats["failed"]) == (0, 2)
+    finally:
+        plugin.stop()
+
+
+def test_packets_claimed_by_another_gateway_count_as_skipped():
+    client = _client()
+    plugin, route = _plugin_route(client)
+    try:
+        plugin.dedup_cache = amcb.PacketDedupCache()
+        plugin.dedup_cache.record_claim((1, 2), "!00000001")
+        _put(route, "lost", claim=((1, 2), "!00000002"))
+        _put(route, "won", claim=((3, 4), "!00000002"))
+        route.queue.stop()
+        stats = route.queue.stats()
+        assert (stats["published"], stats["skipped"]) == (1, 1)
+        assert client.published == [b"won"]
+    finally:
+        plugin.stop()
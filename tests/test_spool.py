@@ -0,0 +1,109 @@
+import json
+import os
+
+import amcb
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".seg"))
+
+
+def _replay_all(spool):
+    delivered = []
+    result = spool.replay(lambda topic, payload, qos, retain: delivered.append(payload) or True, lambda: True)
+    return result, delivered
+
+
+def test_replay_skips_truncated_tail_left_by_crash(tmp_path):
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    spool.append("t", b"one")
+    spool.append("t", b"two")
+    spool.close()
+    with open(os.path.join(str(tmp_path), _segments(str(tmp_path))[0]), 'ab') as f:
+        f.write(b"junkjun") # Shorter than a record header
+
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    spool.append("t", b"three")
+    result, delivered = _replay_all(spool)
+
+    assert delivered == [b"one", b"two", b"three"]
+    assert result is True
+    assert not spool.has_pending()
+
+
+def test_replay_skips_record_cut_short(tmp_path):
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    spool.append("t", b"x" * 100)
+    spool.close()
+    segment_path = os.path.join(str(tmp_path), _segments(str(tmp_path))[0])
+    with open(segment_path, 'rb') as f:
+        record = f.read()
+    with open(segment_path, 'ab') as f:
+        f.write(record[:40]) # Full header, partial payload
+
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    result, delivered = _replay_all(spool)
+
+    assert delivered == [b"x" * 100]
+    assert result is True
+    assert not spool.has_pending()
+
+
+def test_replay_skips_corrupt_record(tmp_path):
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    spool.append("t", b"good")
+    spool.append("t", b"bad")
+    spool.close()
+    segment_path = os.path.join(str(tmp_path), _segments(str(tmp_path))[0])
+    with open(segment_path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"!")
+
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    result, delivered = _replay_all(spool)
+
+    assert delivered == [b"good"]
+    assert result is True
+    assert not spool.has_pending()
+
+
+def test_replay_resumes_from_cursor_after_restart(tmp_path):
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    for payload in (b"1", b"2", b"3"):
+        spool.append("t", payload)
+    delivered = []
+    spool.replay(lambda topic, payload, qos, retain: len(delivered) < 2 and (delivered.append(payload) or True), lambda: True)
+    spool.close()
+
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000)
+    result, rest = _replay_all(spool)
+
+    assert delivered == [b"1", b"2"]
+    assert rest == [b"3"]
+    assert result is True
+
+
+def test_oversized_segment_bytes_is_reduced(tmp_path):
+    plugin = amcb.AMCBPlugin()
+    plugin.config_file_path = str(tmp_path / "mqtt_config.json")
+    with open(plugin.config_file_path, 'w') as f:
+        json.dump({"0": {"host": "127.0.0.1", "port": 1, "topic": "mesh/out",
+                         "spool": {"dir": str(tmp_path / "spool"), "max_bytes": 4000, "segment_bytes": 8000}}}, f)
+    try:
+        assert plugin.load_config()
+        assert plugin.mqtt_configs["0"]["spool"]["segment_bytes"] == 1000
+    finally:
+        plugin.stop()
+
+
+def test_replay_handles_record_larger_than_read_chunk(tmp_path):
+    big = os.urandom(5 * 2**20)
+    spool = amcb.PacketSpool(str(tmp_path), replay_rate=10000, segment_bytes=16 * 2**20, max_bytes=64 * 2**20)
+    spool.append("t", b"before")
+    spool.append("t", big)
+    spool.append("t", b"after")
+    result, delivered = _replay_all(spool)
+
+    assert delivered == [b"before", big, b"after"]
+    assert result is True
+    assert not spool.has_pending()
@@ -0,0 +1,46 @@
+import pytest
+
+import amcb
+
+
+def _packet(**extra):
+    return dict({'from': 0xa1b2c3d4, 'to': 0xffffffff, 'toId': '^all', 'decoded': {'portnum': 'POSITION_APP'}}, **extra)
+
+
+def test_template_without_placeholders_compiles_to_none():
+    assert amcb.compile_topic_template("mesh/out", "0") is None
+
+
+def test_placeholders_are_filled_per_packet():
+    render = amcb.compile_topic_template("mesh/{channel}/{portnum}/{fromId}/{toId}/{from}/{gateway}", "2", "!0000beef")
+    assert render(_packet()) == f"mesh/2/POSITION_APP/!a1b2c3d4/^all/{0xa1b2c3d4}/!0000beef"
+
+
+def test_numeric_portnum_renders_as_its_name():
+    render = amcb.compile_topic_template("mesh/{portnum}", "0")
+    assert render(_packet(decoded={'portnum': 1})) == "mesh/TEXT_MESSAGE_APP"
+
+
+def test_missing_values_render_as_unknown():
+    render = amcb.compile_topic_template("mesh/{portnum}/{fromId}/{gateway}", "0")
+    assert render({}) == "mesh/unknown/unknown/unknown"
+
+
+@pytest.mark.parametrize("value, level", [("a/b", "a_b"), ("+", "_"), ("x#", "x_"), ("", "unknown")])
+def test_values_stay_one_topic_level(value, level):
+    render = amcb.compile_topic_template("mesh/{fromId}/end", "0")
+    assert render({'fromId': value}) == f"mesh/{level}/end"
+
+
+def test_rendered_topics_are_cached():
+    render = amcb.compile_topic_template("mesh/{fromId}", "0")
+    for sender in (1, 2, 1, 1):
+        render({'from': sender})
+    info = render.cache_info()
+    assert (info.hits, info.misses) == (2, 2)
+
+
+def test_unknown_placeholder_is_rejected():
+    with pytest.raises(ValueError, match="bogus"):
+        amcb.topic_template_fields("mesh/{bogus}")
+    assert amcb.topic_template_fields("mesh/{channel}/{to}") == ["channel", "to"]
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import amcb
+
+FAST_PRESET = amcb.MODEM_PRESETS['SHORT_TURBO'] # A full packet costs about 0.1 s of airtime
+
+
+def _scheduler(**channels):
+    scheduler = amcb.TransmitScheduler()
+    scheduler.radio_params = FAST_PRESET
+    for channel_id_str, overrides in channels.items():
+        scheduler.configure_channel(channel_id_str, dict(amcb.DEFAULT_TX_CONFIG, **overrides))
+    return scheduler
+
+
+def _submit_all(scheduler, messages):
+    """Queues (channel, name, size) messages; returns the send log and an Event set once all were sent."""
+    sent = []
+    done = threading.Event()
+
+    def send(name):
+        sent.append(name)
+        if len(sent) == len(messages):
+            done.set()
+
+    for channel_id_str, name, size in messages:
+        assert scheduler.submit(channel_id_str, "^all", name.encode('utf-8').ljust(size, b'.'), lambda n=name: send(n))
+    return sent, done
+
+
+def test_short_message_does_not_overtake_earlier_ones():
+    airtime = amcb.estimate_airtime(233, *FAST_PRESET)
+    scheduler = _scheduler(**{"0": {"duty_cycle_percent": 100, "burst_airtime_ms": airtime * 1500}})
+    try:
+        sent, done = _submit_all(scheduler, [("0", "A", 233), ("0", "B", 233), ("0", "C", 233), ("0", "D", 233), ("0", "short", 5)])
+        assert done.wait(10)
+        assert sent == ["A", "B", "C", "D", "short"]
+    finally:
+        scheduler.stop()
+
+
+def test_channel_with_empty_bucket_yields_to_others():
+    airtime = amcb.estimate_airtime(233, *FAST_PRESET)
+    scheduler = _scheduler(**{"slow": {"duty_cycle_percent": 10, "burst_airtime_ms": airtime * 1000, "priority": 1},
+                              "fast": {"duty_cycle_percent": 100, "burst_airtime_ms": 10000}})
+    try:
+        sent, done = _submit_all(scheduler, [("slow", "slow-1", 233), ("slow", "slow-2", 233), ("fast", "fast-1", 5)])
+        assert done.wait(10)
+        assert sent == ["slow-1", "fast-1", "slow-2"]
+    finally:
+        scheduler.stop()
+
+
+def test_higher_priority_channel_goes_first():
+    scheduler = _scheduler(low={"priority": 0}, high={"priority": 5})
+    with scheduler._cond: # Queue both before the sender can look at either
+        sent, done = _submit_all(scheduler, [("low", "low", 5), ("high", "high", 5)])
+    try:
+        assert done.wait(5)
+        assert sent == ["high", "low"]
+    finally:
+        scheduler.stop()
+
+
+def test_full_channel_queue_drops_and_counts():
+    scheduler = _scheduler(**{"0": {"max_queue": 2}})
+    try:
+        with scheduler._cond: # Nothing is sent while the queue fills
+            results = [scheduler.submit("0", "^all", bytes([i]) * 200, lambda: None) for i in range(4)]
+            stats = scheduler.stats()
+        assert results == [True, True, False, False]
+        assert stats["dropped"] == 2
+        assert stats["queued"] == 2
+    finally:
+        scheduler.stop()
+
+
+def test_fragments_of_consecutive_messages_stay_in_order():
+    scheduler = _scheduler(**{"0": {"duty_cycle_percent": 100, "burst_airtime_ms": 200}})
+    try:
+        expected = []
+        sent = []
+        done = threading.Event()
+        for message_id, letter in ((1, b'a'), (2, b'b')):
+            fragments, truncated = amcb.fragment_payload(letter * 500, True, message_id=message_id)
+            assert not truncated
+            expected.extend(fragments)
+            for fragment in fragments:
+                scheduler.submit("0", "^all", fragment,
+                                 lambda f=fragment: sent.append(f) or (len(sent) == len(expected) and done.set()))
+        assert done.wait(10)
+        assert sent == expected
+    finally:
+        scheduler.stop()
+
+
+def test_dedup_windows_are_per_channel():
+    scheduler = _scheduler(long={"dedup_window_s": 300}, short={"dedup_window_s": 0.05})
+    try:
+        with scheduler._cond: # Keep everything queued; only deduplication is under test
+            assert scheduler.submit("long", "^all", b"same", lambda: None)
+            assert scheduler.submit("short", "^all", b"same", lambda: None)
+        time.sleep(0.1)
+        with scheduler._cond:
+            assert scheduler.submit("short", "^all", b"same", lambda: None) # Its 0.05 s window has passed
+            assert not scheduler.submit("long", "^all", b"same", lambda: None) # Still inside 300 s
+        assert scheduler.stats()["deduplicated"] == 1
+    finally:
+        scheduler.stop()